@@ -21,21 +21,28 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import json
 import logging
+import pickle
 import webbrowser
 
 import numpy as np
 import pandas as pd
 
+from czsc.Data.bar_store import BarStore
 from czsc.Fetch.mongo import FACTOR_DATABASE
 from czsc.Fetch.tdx import get_bar
 from czsc.Indicator import IndicatorSet
+from czsc.objects import Point, ZS
+from czsc.Setting import cache_path
 from czsc.Utils.echarts_plot import kline_pro
+from czsc.Utils.fx_kernel import calculate_fx_bi
 from czsc.Utils.logs import util_log_info
-from czsc.Utils.trade_date import TradeDate, util_get_real_date, util_get_next_day
+from czsc.Utils.trade_date import util_get_trade_ordinal, util_get_real_date, util_get_next_day
 from czsc.Utils.transformer import DataEncoder
 
 
@@ -47,12 +54,13 @@ def identify_direction(v1, v2):
     return direction
 
 
-def update_fx(bars, new_bars: list, fx_list: list, trade_date: list):
+def update_fx(bars: BarStore, new_bars: BarStore, fx_list: list, trade_date):
     """更新分型序列
     k线中有direction，fx中没有direction字段
         分型记对象样例：
          {
              'date': Timestamp('2020-11-26 00:00:00'),
+              'ordinal': 1606348800000000000, 交易时段序号，用来比较先后
               'fx_mark': -1, 低点用—1表示
               'value': 138.0,
               'fx_start': Timestamp('2020-11-25 00:00:00'),
@@ -68,13 +76,15 @@ def update_fx(bars, new_bars: list, fx_list: list, trade_date: list):
         """
     assert len(bars) > 0
     bar = bars[-1].copy()
+    # 交易时段序号，用于比较日期先后
+    bar['ordinal'] = util_get_trade_ordinal(bar['date'])
 
     if len(trade_date) > 1:
-        if TradeDate(bar['date']) < TradeDate(trade_date[-1]):
+        if bar['ordinal'] < trade_date.last_ordinal:
             util_log_info('{} data is older than {} !'.format(bar['date'], trade_date[-1]))
             return
 
-    trade_date.append(bar['date'])
+    trade_date.append(bar['date'], bar['ordinal'])
 
     # 第1根K线没有方向,不需要任何处理
     if len(bars) < 2:
@@ -99,32 +109,33 @@ def update_fx(bars, new_bars: list, fx_list: list, trade_date: list):
 
     # 没有包含关系，需要进行分型识别，趋势有可能改变
     if (cur_h > last_h and cur_l > last_l) or (cur_h < last_h and cur_l < last_l):
-        new_bars.append(bar)
         # 分型识别
         if last_direction * direction < 0:
 
             bar.update(direction=direction)
+            new_bars.append(bar)
             if direction < 0:
-                fx = {
-                    "date": last_bar['date'],
-                    "fx_mark": 1,
-                    "value": last_bar['high'],
-                    "fx_start": new_bars[-3]['date'],  # 记录分型的开始和结束时间
-                    "fx_end": bar['date'],
-                    # "direction": bar['direction'],
-                }
+                fx = Point(
+                    date=last_bar['date'],
+                    ordinal=last_bar['ordinal'],
+                    fx_mark=1,
+                    value=last_bar['high'],
+                    fx_start=new_bars[-3]['date'],  # 记录分型的开始和结束时间
+                    fx_end=bar['date'],
+                )
             else:
-                fx = {
-                    "date": last_bar['date'],
-                    "fx_mark": -1,
-                    "value": last_bar['low'],
-                    "fx_start": new_bars[-3]['date'],  # 记录分型的开始和结束时间
-                    "fx_end": bar['date'],
-                    # "direction": bar['direction'],
-                }
+                fx = Point(
+                    date=last_bar['date'],
+                    ordinal=last_bar['ordinal'],
+                    fx_mark=-1,
+                    value=last_bar['low'],
+                    fx_start=new_bars[-3]['date'],  # 记录分型的开始和结束时间
+                    fx_end=bar['date'],
+                )
             fx_list.append(fx)
             return True
         bar.update(direction=last_direction + np.sign(last_direction))
+        new_bars.append(bar)
         return False
 
     # 有包含关系，不需要进行分型识别，趋势不改变,direction数值增加
@@ -133,12 +144,12 @@ def update_fx(bars, new_bars: list, fx_list: list, trade_date: list):
     # 有包含关系，按方向分别处理,同时需要更新日期
     if last_direction > 0:
         if cur_h < last_h:
-            bar.update(high=last_h, date=last_dt)
+            bar.update(high=last_h, date=last_dt, ordinal=last_bar['ordinal'])
         if cur_l < last_l:
             bar.update(low=last_l)
     elif last_direction < 0:
         if cur_l > last_l:
-            bar.update(low=last_l, date=last_dt)
+            bar.update(low=last_l, date=last_dt, ordinal=last_bar['ordinal'])
         if cur_h > last_h:
             bar.update(high=last_h)
     else:
@@ -149,6 +160,55 @@ def update_fx(bars, new_bars: list, fx_list: list, trade_date: list):
     return False
 
 
+class TradeDateList(object):
+    """存放K线日期，同时维护日期到位置的索引，index查找为O(1)"""
+
+    def __init__(self):
+        self.trade_date = []
+        # 日期对应的位置，日期重复时保留第一个位置，和list.index一致
+        self.position = {}
+        # 最后一个日期的交易时段序号
+        self.last_ordinal = None
+        # trim 删除的日期数量，index 返回的是完整序列中的位置，和指标的下标对应
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.trade_date)
+
+    def __getitem__(self, item):
+        return self.trade_date[item]
+
+    def append(self, value, ordinal=None):
+        self.position.setdefault(value, self.offset + len(self.trade_date))
+        self.trade_date.append(value)
+        self.last_ordinal = util_get_trade_ordinal(value) if ordinal is None else ordinal
+
+    def trim(self, count, pinned=()):
+        """删除前面 count 个日期，pinned 中的日期仍然可以用 index 查找原来的位置"""
+        count = min(count, len(self.trade_date))
+        del self.trade_date[:count]
+        self.offset = self.offset + count
+
+        missing = set()
+        for value, position in list(self.position.items()):
+            if position < self.offset and value not in pinned:
+                del self.position[value]
+                missing.add(value)
+        # 重复的日期保留下来的，位置改为保留的第一个
+        for i, value in enumerate(self.trade_date):
+            if not missing:
+                break
+            if value in missing:
+                self.position[value] = self.offset + i
+                missing.discard(value)
+
+    def index(self, value):
+        try:
+            return self.position[value]
+        except KeyError:
+            raise ValueError('{} is not in trade_date'.format(value))
+
+
 class XdList(object):
     """存放线段"""
 
@@ -180,6 +240,23 @@ class XdList(object):
     def append(self, value):
         self.xd_list.append(value)
 
+    def trim(self, margin=8):
+        """
+        删除高一级别倒数第二个端点之前的线段，回溯时最多多访问前面一个端点，保留 margin 个余量
+        高一级别还没有两个端点时，初始化需要全部线段，不删除
+        """
+        if self.next is None or len(self.next) < 2:
+            return
+
+        ordinal = self.next[-2]['ordinal']
+        index = 0
+        while index < len(self.xd_list) - margin and self.xd_list[index + margin]['ordinal'] < ordinal:
+            index = index + 1
+        del self.xd_list[:index]
+        # 中枢和信号只用到最后一个
+        del self.zs_list[:-2]
+        del self.sig_list[:-2]
+
     def update_zs(self):
         """
         {
@@ -204,16 +281,16 @@ class XdList(object):
             assert len(xd_list) < 4
             zg = xd_list[0] if xd_list[0]['fx_mark'] > 0 else xd_list[1]
             zd = xd_list[0] if xd_list[0]['fx_mark'] < 0 else xd_list[1]
-            zs = {
-                'ZG': zg,
-                'ZD': zd,
-                'GG': [zg],  # 初始用list储存，记录高低点的变化过程，中枢完成时可能会回退
-                'DD': [zd],  # 根据最高最低点的变化过程可以识别时扩散，收敛，向上还是向下的形态
-                'xd_list': xd_list[:2],
-                'weight': 1,  # 记录中枢中段的数量
-                'location': 0,  # 初始状态为0，说明没有方向， -1 表明下降第1个中枢， +2 表明上升第2个中枢
-                'real_loc': 0  # 除去只有一段的中枢
-            }
+            zs = ZS(
+                ZG=zg,
+                ZD=zd,
+                GG=[zg],  # 初始用list储存，记录高低点的变化过程，中枢完成时可能会回退
+                DD=[zd],  # 根据最高最低点的变化过程可以识别时扩散，收敛，向上还是向下的形态
+                xd_list=xd_list[:2],
+                weight=1,  # 记录中枢中段的数量
+                location=0,  # 初始状态为0，说明没有方向， -1 表明下降第1个中枢， +2 表明上升第2个中枢
+                real_loc=0  # 除去只有一段的中枢
+            )
             zs_list.append(zs)
             return False
 
@@ -221,7 +298,7 @@ class XdList(object):
         last_zs = zs_list[-1]
         xd = xd_list[-2]
 
-        if TradeDate(last_zs['xd_list'][-1]['date']) >= TradeDate(xd['date']):
+        if last_zs['xd_list'][-1]['ordinal'] >= xd['ordinal']:
             # 已经计算过中枢
             return False
 
@@ -238,17 +315,17 @@ class XdList(object):
                     real_loc=last_zs['real_loc'] + 1 if last_zs['weight'] == 2 else last_zs['real_loc']
                 )
 
-                zs = {
-                    'zs_start': xd_list[-4],
-                    'ZG': xd,
-                    'ZD': zs_end,
-                    'GG': [xd],
-                    'DD': [zs_end],
-                    'xd_list': [zs_end, xd],
-                    'weight': 1,
-                    'location': -1 if last_zs['location'] >= 0 else last_zs['location'] - 1,
-                    'real_loc': -1 if last_zs['real_loc'] >= 0 else last_zs['real_loc'] - 1,
-                }
+                zs = ZS(
+                    zs_start=xd_list[-4],
+                    ZG=xd,
+                    ZD=zs_end,
+                    GG=[xd],
+                    DD=[zs_end],
+                    xd_list=[zs_end, xd],
+                    weight=1,
+                    location=-1 if last_zs['location'] >= 0 else last_zs['location'] - 1,
+                    real_loc=-1 if last_zs['real_loc'] >= 0 else last_zs['real_loc'] - 1,
+                )
                 zs_list.append(zs)
                 return True
             elif xd['value'] < last_zs['ZG']['value']:
@@ -268,17 +345,17 @@ class XdList(object):
                     GG=last_zs['GG'],
                     real_loc=last_zs['real_loc'] - 1 if last_zs['weight'] == 2 else last_zs['real_loc']
                 )
-                zs = {
-                    'zs_start': xd_list[-4],
-                    'ZG': zs_end,
-                    'ZD': xd,
-                    'GG': [zs_end],
-                    'DD': [xd],
-                    'xd_list': [zs_end, xd],
-                    'weight': 1,
-                    'location': 1 if last_zs['location'] <= 0 else last_zs['location'] + 1,
-                    'real_loc': 1 if last_zs['real_loc'] <= 0 else last_zs['real_loc'] + 1,
-                }
+                zs = ZS(
+                    zs_start=xd_list[-4],
+                    ZG=zs_end,
+                    ZD=xd,
+                    GG=[zs_end],
+                    DD=[xd],
+                    xd_list=[zs_end, xd],
+                    weight=1,
+                    location=1 if last_zs['location'] <= 0 else last_zs['location'] + 1,
+                    real_loc=1 if last_zs['real_loc'] <= 0 else last_zs['real_loc'] + 1,
+                )
                 zs_list.append(zs)
                 return True
             elif xd['value'] > last_zs['ZD']['value']:
@@ -303,8 +380,8 @@ class XdList(object):
         end = trade_date.index(xd['date'])
         kn = end - start + 1
         fx_mark = kn * np.sign(xd.get('fx_mark', xd.get('direction', 0)))
-        dif = self.indicators.macd[end]['dif']
-        macd = sum([x['macd'] for x in self.indicators.macd[start: end + 1] if fx_mark * x['macd'] > 0])
+        dif = self.indicators.macd.value_at(end, 'dif')
+        macd = self.indicators.macd.area(start, end, fx_mark)
         xd.update(fx_mark=fx_mark, dif=dif, macd=macd)
         # xd.update(fx_mark=fx_mark, dif=dif, avg_macd=macd/kn)
 
@@ -341,7 +418,7 @@ class XdList(object):
             # 线段不存在，初始化线段，找4个点的最高和最低点组成线段
             bi_list = bi_list[:-1].copy()
             bi_list = sorted(bi_list, key=lambda x: x['value'], reverse=False)
-            if TradeDate(bi_list[0]['date']) < TradeDate(bi_list[-1]['date']):
+            if bi_list[0]['ordinal'] < bi_list[-1]['ordinal']:
                 xd_list.append(bi_list[0])
                 xd_list.append(bi_list[-1])
             else:
@@ -366,7 +443,7 @@ class XdList(object):
             return True
 
         # assert xd['date'] > last_xd['date']
-        if TradeDate(xd['date']) <= TradeDate(last_xd['date']):
+        if xd['ordinal'] <= last_xd['ordinal']:
             util_log_info('The {} quotes bar input maybe wrong!'.format(xd['date']))
 
         if bi3['fx_mark'] > 0:
@@ -383,12 +460,12 @@ class XdList(object):
                     xd_list.update_xd_eigenvalue()
                     return True
                 # 出现三笔破坏线段，连续两笔，一笔比一笔高,寻找段之间的最高点
-                elif TradeDate(bi3['date']) > TradeDate(last_xd['date']) and xd['value'] > bi3['value']:
+                elif bi3['ordinal'] > last_xd['ordinal'] and xd['value'] > bi3['value']:
                     index = -5
                     bi = bi_list[index]
                     # 连续两个高点没有碰到段前面一个低点
                     try:
-                        if TradeDate(bi['date']) < TradeDate(last_xd['date']) and \
+                        if bi['ordinal'] < last_xd['ordinal'] and \
                                 bi_list[index - 1]['value'] > bi3['value'] and \
                                 bi_list[index]['value'] > xd['value']:
                             return False
@@ -396,7 +473,7 @@ class XdList(object):
                         pass
                         # util_log_info('Last xd {}:{}'.format(last_xd['date'], err))
 
-                    while TradeDate(bi['date']) > TradeDate(last_xd['date']):
+                    while bi['ordinal'] > last_xd['ordinal']:
                         if xd['value'] < bi['value']:
                             xd = bi
                         index = index - 2
@@ -418,12 +495,12 @@ class XdList(object):
                     xd_list.update_xd_eigenvalue()
                     return True
                 # 出现三笔破坏线段，连续两笔，一笔比一笔低,将最低的一笔作为段的起点，避免出现最低点不是端点的问题
-                elif TradeDate(bi3['date']) > TradeDate(last_xd['date']) and xd['value'] < bi3['value']:
+                elif bi3['ordinal'] > last_xd['ordinal'] and xd['value'] < bi3['value']:
                     index = -5
                     bi = bi_list[index]
                     # 连续两个个低点没有碰到段前面一高低点
                     try:
-                        if TradeDate(bi['date']) < TradeDate(last_xd['date']) and \
+                        if bi['ordinal'] < last_xd['ordinal'] and \
                                 bi_list[index - 1]['value'] < bi3['value'] and \
                                 bi_list[index]['value'] < xd['value']:
                             return False
@@ -431,7 +508,7 @@ class XdList(object):
                         pass
                         # util_log_info('Last xd {}:{}'.format(last_xd['date'], err))
 
-                    while TradeDate(bi['date']) > TradeDate(last_xd['date']):
+                    while bi['ordinal'] > last_xd['ordinal']:
                         if xd['value'] > bi['value']:
                             xd = bi
                         index = index - 2
@@ -441,9 +518,10 @@ class XdList(object):
                     return True
         return False
 
-    def update_sig(self):
+    def update_sig(self, position=-1):
         """
         线段更新后调用，判断是否出现买点
+        position 为当前K线的位置，逐根更新时是最后一根，回放历史时是笔更新时的K线
         """
         if len(self.zs_list) < 1:
             return False
@@ -454,8 +532,9 @@ class XdList(object):
         if 'zs_start' in zs:
             xd_list.insert(0, zs['zs_start'])
 
+        bar = self.bars[position]
         sig = {
-            'date': self.bars[-1]['date'],
+            'date': bar['date'],
             'real_loc': zs['real_loc'],
             'location': zs['location'],
             'weight': zs['weight'],
@@ -472,7 +551,7 @@ class XdList(object):
             # if zs['location'] > 0 and zs.get('zs_start', False):
             #     sig.update(start_macd=zs['zs_start']['macd'], start_avg_macd=zs['zs_start']['avg_macd'])
 
-            sig.update(boll=self.indicators.boll[-1].get('UB', np.nan) / self.bars[-1]['high'] * 100 - 100)
+            sig.update(boll=self.indicators.boll[position].get('UB', np.nan) / bar['high'] * 100 - 100)
 
             if xd['value'] > zs['GG'][-1]['value']:
                 xd_mark = -1  # 如果weight=1, 背驰，有可能1卖
@@ -503,7 +582,7 @@ class XdList(object):
             # if zs['location'] < 0 and zs.get('zs_start', False):
             #     sig.update(start_macd=zs['zs_start']['macd'], start_avg_macd=zs['zs_start']['avg_macd'])
 
-            sig.update(boll=100 - self.indicators.boll[-1].get('LB', np.nan) / self.bars[-1]['low'] * 100)
+            sig.update(boll=100 - self.indicators.boll[position].get('LB', np.nan) / bar['low'] * 100)
 
             if xd['value'] > zs['GG'][-1]['value']:
                 xd_mark = 4  # 三买
@@ -585,17 +664,17 @@ class XdList(object):
 
         self.sig_list.append(sig)
 
-    def update(self):
+    def update(self, position=-1):
 
         self.update_zs()
 
         # 计算对应买卖点
-        self.update_sig()
+        self.update_sig(position)
 
         return self.update_xd()
 
 
-def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
+def update_bi(new_bars: BarStore, fx_list: list, bi_list: XdList, trade_date):
     """更新笔序列
     笔标记对象样例：和分型标记序列结构一样
      {
@@ -619,9 +698,9 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
       return: True 笔的数据出现更新，包括新增笔或者笔的延续
     """
     # 每根k线都要对bi进行判断
-    bar = new_bars[-1].copy()
+    new_bar = new_bars[-1]
 
-    if TradeDate(bar['date']) < TradeDate(trade_date[-1]):
+    if new_bar['ordinal'] < trade_date.last_ordinal:
         # 包含的K线，不会改变bi的状态，不需要处理
         return False
 
@@ -639,19 +718,25 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
         return False
 
     last_bi = bi_list[-1]
-    bar.update(value=bar['high'] if bar['direction'] > 0 else bar['low'])
+    # K线作为笔的端点
+    bar = Point(
+        date=new_bar['date'],
+        ordinal=new_bar['ordinal'],
+        direction=new_bar['direction'],
+        value=new_bar['high'] if new_bar['direction'] > 0 else new_bar['low'],
+    )
 
     # if bar['date'] > pd.to_datetime('2020-09-08'):
     #     print('error')
 
     # k 线确认模式，当前K线的日期比分型K线靠后，说明进来的数据时K线
-    if TradeDate(bar['date']) > TradeDate(bi['fx_end']):
+    if trade_date.index(bar['date']) > trade_date.index(bi['fx_end']):
         if 'direction' not in last_bi:  # bi的结尾是分型
             # 趋势延续替代,首先确认是否延续, 由于处理过包含，高低点可能不正确，反趋势的极值点会忽略
             # 下一根继续趋势，端点后移，如果继续反趋势，该点忽略
             # todo 处理过包含的bar，有一个判断是多余的，直接用bar['value] 参与判断
-            if (last_bi['fx_mark'] > 0 and bar['high'] > last_bi['value']) \
-                    or (last_bi['fx_mark'] < 0 and bar['low'] < last_bi['value']):
+            if (last_bi['fx_mark'] > 0 and new_bar['high'] > last_bi['value']) \
+                    or (last_bi['fx_mark'] < 0 and new_bar['low'] < last_bi['value']):
                 bi_list[-1] = bar
                 bi_list.update_xd_eigenvalue()
                 return True
@@ -665,7 +750,7 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
             if kn_inside > 1 and bar['direction'] * last_bi['fx_mark'] < 0:
                 # 寻找同向的第一根分型
                 index = -1
-                while TradeDate(bi['date']) > TradeDate(last_bi['date']):
+                while bi['ordinal'] > last_bi['ordinal']:
                     if bar['direction'] * bi['fx_mark'] > 0:
                         break
                     index = index - 1
@@ -686,8 +771,8 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
 
             # 价格确认
             # todo 处理过包含的bar，有一个判断是多余的，直接用bar['value] 参与判断
-            if (last_bi['fx_mark'] < 0 and bar['high'] > bi_list[-2]['value']) \
-                    or (last_bi['fx_mark'] > 0 and bar['low'] < bi_list[-2]['value']):
+            if (last_bi['fx_mark'] < 0 and new_bar['high'] > bi_list[-2]['value']) \
+                    or (last_bi['fx_mark'] > 0 and new_bar['low'] < bi_list[-2]['value']):
                 bi_list.append(bar)
                 bi_list.update_xd_eigenvalue()
                 return True
@@ -734,7 +819,7 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
 
         if kn_inside > 0:  # 两个分型间至少有1根k线，端点有可能不是高低点
             index = -2
-            while TradeDate(fx_list[index]['date']) > TradeDate(last_bi['date']):
+            while fx_list[index]['ordinal'] > last_bi['ordinal']:
                 # 分析的fx_mark取值为-1和+1
                 if (bi['fx_mark'] * fx_list[index]['fx_mark'] > 0) \
                         and (bi['fx_mark'] * bi['value'] < fx_list[index]['fx_mark'] * fx_list[index]['value']):
@@ -763,22 +848,41 @@ def update_bi(new_bars: list, fx_list: list, bi_list: XdList, trade_date: list):
     return handle_fx_end()
 
 
+# 引擎状态的字段，xd_list 中引用了 bars、indicators 和 trade_date，需要一起保存
+CHECKPOINT_FIELDS = ['trade_date', 'bars', 'indicators', 'new_bars', 'fx_list', 'xd_list', 'sig_list']
+# 状态结构改变时修改版本号，旧的文件会被忽略
+CHECKPOINT_VERSION = 2
+
+# 保留的最少K线数量，指标计算需要前面的数据
+MIN_RETAINED_BARS = 100
+
+
 class CzscBase:
-    def __init__(self):
+    def __init__(self, max_bars=None):
+        """
+        max_bars 为 None 时保存全部数据，否则只保留最近 max_bars 根K线，
+        以及各级别线段、中枢计算仍然需要的更早的数据，用于长时间运行的实时行情
+        """
         # self.freq = freq
         # assert isinstance(code, str)
         # self.code = code.upper()
+        assert max_bars is None or max_bars >= MIN_RETAINED_BARS
+        self.max_bars = max_bars
 
-        self.trade_date = []  # 用来查找索引
-        self.bars = []
+        self.trade_date = TradeDateList()  # 用来查找索引，和XdList共享
+        self.bars = BarStore()
         self.indicators = IndicatorSet(self.bars)
         # self.indicators = None
-        self.new_bars = []
+        self.new_bars = BarStore()
         self.fx_list = []
         self.xd_list = XdList(self.bars, self.indicators, self.trade_date)  # bi作为线段的head
         self.sig_list = []
 
     def update(self):
+        # 超出保留数量一倍时删除一次，每根K线的平均开销为O(1)
+        if self.max_bars is not None and len(self.trade_date) >= 2 * self.max_bars:
+            self.trim()
+
         # 有包含关系时，不可能有分型出现，不出现分型时才需要
         self.indicators.update()
 
@@ -792,12 +896,18 @@ class CzscBase:
         ):
             return
 
+        self.update_xd()
+
+    def update_xd(self, position=-1):
+        """
+        笔更新后逐级更新线段、中枢和买卖点，position 为当前K线的位置
+        """
         # 新增确定性的笔才处理段
         xd_list = self.xd_list
         result = True
         index = 0
         while result:
-            result = xd_list.update()
+            result = xd_list.update(position)
 
             # 计算对应买卖点
             if len(xd_list.sig_list) > 0:
@@ -824,6 +934,110 @@ class CzscBase:
             xd_list.prev = temp_list
             index = index + 1
 
+    def bulk_load(self, data):
+        """
+        用全部历史K线一次性初始化，之后继续逐根输入新的K线，结果和全部逐根更新一致
+        分型和笔由 calculate_fx_bi 一次计算，指标按数组计算，
+        线段、中枢和买卖点依赖每根K线时笔的状态，按笔的更新记录逐级回放
+        :param data: pd.DataFrame，K线数据，至少包含 date high low close
+        """
+        if self.bars:
+            raise ValueError('bulk_load needs an empty engine, {} bars exist'.format(len(self.bars)))
+        if data is None or len(data) < 1:
+            return
+
+        new_bars, fx_list, bi_list, trade, updates = calculate_fx_bi(data, history=True)
+
+        self.indicators.bulk_load(data)
+        self.new_bars = new_bars
+        self.fx_list = fx_list
+        date = self.bars.column('date')
+        for i in trade:
+            self.trade_date.append(pd.Timestamp(date[i]))
+
+        for position, size, bi in updates:
+            if len(self.xd_list) < 1:
+                # 最开始两个分型作为第一笔，和 update_bi 一样不处理线段
+                self.xd_list.append(bi_list[0])
+                self.xd_list.append(bi)
+                self.xd_list.update_xd_eigenvalue()
+                continue
+
+            if size > len(self.xd_list):
+                self.xd_list.append(bi)
+            else:
+                self.xd_list[-1] = bi
+            self.xd_list.update_xd_eigenvalue()
+            self.update_xd(position)
+
+    def trim(self):
+        """
+        只保留最近 max_bars 根K线，更早的数据中只保留各级别线段和分型仍然引用的日期位置和MACD面积
+        """
+        # 各级别线段只保留高一级别识别时还会访问的部分
+        xd_list = self.xd_list
+        while xd_list is not None:
+            xd_list.trim()
+            xd_list = xd_list.next
+
+        # 笔的识别只回溯到最后一笔之后的分型
+        bi_list = self.xd_list
+        if len(bi_list) > 1:
+            ordinal = bi_list[-2]['ordinal']
+            index = 0
+            while index < len(self.fx_list) - 3 and self.fx_list[index]['ordinal'] < ordinal:
+                index = index + 1
+            del self.fx_list[:index]
+
+        dates = set()
+        points = list(self.fx_list)
+        xd_list = self.xd_list
+        while xd_list is not None:
+            points.extend(xd_list.xd_list)
+            xd_list = xd_list.next
+        for point in points:
+            for name in ['date', 'fx_start', 'fx_end']:
+                if name in point:
+                    dates.add(point[name])
+        pinned = [self.trade_date.index(date) for date in dates]
+
+        count = len(self.trade_date) - self.max_bars
+        self.trade_date.trim(count, pinned=dates)
+        self.indicators.trim(count, pinned=pinned)
+        self.new_bars.trim(len(self.new_bars) - self.max_bars)
+        del self.sig_list[:-self.max_bars]
+
+    def dump(self, filename):
+        """
+        保存引擎的全部状态，K线、分型、各级别线段、中枢、信号以及指标
+        """
+        state = {name: getattr(self, name) for name in CHECKPOINT_FIELDS}
+        temp = filename + '.tmp'
+        with open(temp, 'wb') as f:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, filename)  # 写完再替换，避免中断时留下损坏的文件
+
+    def load(self, filename):
+        """
+        从dump保存的文件恢复状态，之后继续输入新的K线即可，文件不存在或者版本不一致返回False
+        """
+        if not os.path.exists(filename):
+            return False
+
+        try:
+            with open(filename, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception as error:
+            util_log_info("Load checkpoint {} failed: {}".format(filename, error))
+            return False
+
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            return False
+
+        for name in CHECKPOINT_FIELDS:
+            setattr(self, name, checkpoint['state'][name])
+        return True
+
     #  必须实现,每次输入一个行情数据，然后调用update看是否需要更新
     def on_bar(self, bar):
         """
@@ -835,12 +1049,30 @@ class CzscBase:
 
 
 class CzscMongo(CzscBase):
-    def __init__(self, code='rul8', start=None, end=None, freq='day', exchange=None):
+    def __init__(self, code='rul8', start=None, end=None, freq='day', exchange=None, checkpoint=False, cache=False,
+                 max_bars=None):
+        """
+        checkpoint 为 True 时，从本地保存的状态继续计算，只处理最后一根K线之后的数据，run结束后保存新的状态
+        cache 为 True 时行情数据通过本地K线缓存读取
+        max_bars 为保留的K线数量，None 时保留全部
+        """
         # 只处理一个品种
-        super().__init__()
+        super().__init__(max_bars=max_bars)
         self.code = code
         self.freq = freq
         self.exchange = exchange
+        self.checkpoint = checkpoint
+
+        last_ordinal = None
+        if checkpoint and start is None and self.load(self.checkpoint_path) and self.bars:
+            last_ordinal = self.trade_date.last_ordinal
+            if end is not None and util_get_trade_ordinal(end) < last_ordinal:
+                # 保存的状态比需要的数据新，重新计算
+                super().__init__(max_bars=max_bars)
+                last_ordinal = None
+            else:
+                # 夜盘K线的日期和交易日相同，从最后一根K线的自然日开始读取，再按交易时间过滤
+                start = self.bars[-1]['date'].normalize()
 
         # self._bi_list = fetch_future_bi_day(self.code, limit=2, format='dict')
         self._bi_list = []
@@ -851,9 +1083,19 @@ class CzscMongo(CzscBase):
         elif start is None:
             start = '1990-01-01'
 
-        self.data = get_bar(code, start=start, end=end, freq=freq, exchange=exchange)
+        self.data = get_bar(code, start=start, end=end, freq=freq, exchange=exchange, cache=cache)
         # self.data = get_bar(code, start, end='2020-12-09', freq=freq, exchange=exchange)
 
+        if last_ordinal is not None and self.data is not None:
+            ordinal = self.data['date'].map(util_get_trade_ordinal)
+            self.data = self.data[ordinal > last_ordinal]
+
+    @property
+    def checkpoint_path(self):
+        path = os.path.join(cache_path, 'czsc')
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, '{}_{}_{}.pkl'.format(self.code, self.exchange, self.freq))
+
     def draw(self, chart_path=None):
         if len(self.bars) < 1:
             return
@@ -872,10 +1114,11 @@ class CzscMongo(CzscBase):
 
     def on_bar(self, bar):
         """
-        bar 格式
+        bar 格式，dict 或者 pd.Series
         date 默认为 Timestamp，主要时画图函数使用
         """
-        bar = bar.to_dict()
+        if isinstance(bar, pd.Series):
+            bar = bar.to_dict()
         # if 'trade' in bar:
         #     bar['vol'] = bar.pop('trade')
         # bar['date'] = pd.to_datetime(bar['date'])
@@ -886,12 +1129,24 @@ class CzscMongo(CzscBase):
         except Exception as error:
             util_log_info(error)
 
-    def run(self, start=None, end=None):
+    def run(self, start=None, end=None, bulk=False):
+        """
+        bulk 为 True 时，没有保存的状态则用 bulk_load 一次性计算全部历史数据，否则逐根计算
+        """
         if self.data is None or self.data.empty:
             util_log_info('{} {} quote data is empty'.format(self.code, self.freq))
             return
 
-        self.data.apply(self.on_bar, axis=1)
+        if bulk and not self.bars:
+            self.bulk_load(self.data)
+        else:
+            # 直接按行遍历列数据生成dict，避免apply(axis=1)为每一行构造Series
+            columns = self.data.columns.to_list()
+            for values in self.data.itertuples(index=False, name=None):
+                self.on_bar(dict(zip(columns, values)))
+
+        if self.checkpoint:
+            self.dump(self.checkpoint_path)
         # self.save()
 
     def save(self, collection=FACTOR_DATABASE.future_bi_day):
@@ -1012,176 +1267,221 @@ class CzscMongo(CzscBase):
             json.dump(data, write_file, indent=4, sort_keys=True, cls=DataEncoder)
 
 
-def calculate_bs_signals(security_df: pd.DataFrame, last_trade_date=None):
-    sig_list = []
-
-    if last_trade_date is None:
-        last_trade_date = util_get_real_date(datetime.today().strftime('%Y-%m-%d'))
+def _calculate_bs_signal(code, item, last_trade_date, last_trade_time):
+    """
+    计算单个品种的日线和5分钟买卖点信号，没有信号返回None
+    """
+    exchange = item['exchange']
+    util_log_info("============={} {} Signal==========".format(code, exchange))
+    try:
+        czsc_day = CzscMongo(code=code, end=last_trade_date, freq='day', exchange=exchange, cache=True)
+    except Exception as error:
+        util_log_info("{} : {}".format(code, error))
+        return
+
+    if len(czsc_day.data) < 1:
+        util_log_info("==========={} {} 0 Quotes==========".format(code, exchange))
+        return
+
+    if czsc_day.data.iloc[-1]['date'] < last_trade_date:
+        util_log_info(
+            "=={} {} last trade date {}==".format(
+                code, exchange, czsc_day.data.iloc[-1]['date'].strftime('%Y-%m-%d'))
+        )
+        return
 
-    last_trade_time = pd.to_datetime(util_get_next_day(last_trade_date))
-    last_trade_date = pd.to_datetime(last_trade_date)
+    czsc_day.run()
+    sig_day_list = czsc_day.sig_list
 
-    index = 0
+    if len(sig_day_list) < 1:
+        return
 
-    for code, item in security_df.iterrows():
-        exchange = item['exchange']
-        util_log_info("============={} {} Signal==========".format(code, exchange))
-        try:
-            czsc_day = CzscMongo(code=code, end=last_trade_date, freq='day', exchange=exchange)
-        except Exception as error:
-            util_log_info("{} : {}".format(code, error))
-            continue
+    last_day_sig = sig_day_list[-1]
 
-        if len(czsc_day.data) < 1:
-            util_log_info("==========={} {} 0 Quotes==========".format(code, exchange))
-            continue
+    if last_day_sig['date'] < last_trade_date:
+        util_log_info(
+            "===={} {} last Signal {}====".format(code, exchange, last_day_sig['date'].strftime('%Y-%m-%d'))
+        )
+        return
 
-        if czsc_day.data.iloc[-1]['date'] < last_trade_date:
+    # 流动性过滤，future为成交量过滤
+    if item['instrument'] == 'future':
+        amount = czsc_day.bars[-1]['volume']
+        if amount < 10000:
             util_log_info(
-                "=={} {} last trade date {}==".format(
-                    code, exchange, czsc_day.data.iloc[-1]['date'].strftime('%Y-%m-%d'))
+                "===={} {} volume is few!====".format(code, exchange)
             )
-            continue
+            return
+    elif exchange in ['hkconnect']:
+        amount = czsc_day.bars[-1]['hk_stock_amount']
+    else:
+        amount = czsc_day.bars[-1]['amount']
+        if amount < 10000000:
+            util_log_info(
+                "===={} {} amount is few!====".format(code, exchange)
+            )
+            return
 
-        czsc_day.run()
-        sig_day_list = czsc_day.sig_list
+    # 笔中枢走势的起点，如果是上升趋势的买点，从当前中枢的最高点开始计算，如果是卖点，从上升趋势的起点开始
+    xd_list = czsc_day.xd_list
+    zs_list = xd_list.zs_list
 
-        if len(sig_day_list) < 1:
-            continue
+    if len(zs_list) < 1:
+        return
 
-        last_day_sig = sig_day_list[-1]
+    xd_mark = last_day_sig['xd_mark']
+    # if xd_mark < 0:
+    #     xd = zs_list[-1]['DD'][-1]
+    # else:
+    #     xd = zs_list[-1]['GG'][-1]
+    #
+    # start = xd.get('fx_start')
+    start = xd_list.sig_list[-1]['start']
 
-        if last_day_sig['date'] < last_trade_date:
-            util_log_info(
-                "===={} {} last Signal {}====".format(code, exchange, last_day_sig['date'].strftime('%Y-%m-%d'))
-            )
-            continue
+    czsc_min = CzscMongo(code=code, start=start, end=last_trade_time, freq='5min', exchange=exchange, cache=True)
 
-        # 流动性过滤，future为成交量过滤
-        if item['instrument'] == 'future':
-            amount = czsc_day.bars[-1]['volume']
-            if amount < 10000:
-                util_log_info(
-                    "===={} {} volume is few!====".format(code, exchange)
-                )
-                continue
-        elif exchange in ['hkconnect']:
-            amount = czsc_day.bars[-1]['hk_stock_amount']
-        else:
-            amount = czsc_day.bars[-1]['amount']
-            if amount < 10000000:
-                util_log_info(
-                    "===={} {} amount is few!====".format(code, exchange)
-                )
-                continue
+    try:
+        if len(czsc_min.data) < 1:
+            util_log_info("========={} {} 0 5min Quotes========".format(code, exchange))
+            return
+    except:
+        util_log_info("========={} {} 5min Quotes file is not exists!========".format(code, exchange))
+        return
+
+    if czsc_min.data.iloc[-1]['date'] < last_trade_date:
+        util_log_info(
+            "==Please Update {} {} 5min Quotes from {}==".format(
+                code, exchange, czsc_day.data.iloc[-1]['date'].strftime('%Y-%m-%d'))
+        )
+        return
 
-        # 笔中枢走势的起点，如果是上升趋势的买点，从当前中枢的最高点开始计算，如果是卖点，从上升趋势的起点开始
-        xd_list = czsc_day.xd_list
-        zs_list = xd_list.zs_list
+    czsc_min.run()
 
-        if len(zs_list) < 1:
-            continue
+    sig_min_list = czsc_min.sig_list
 
-        xd_mark = last_day_sig['xd_mark']
-        # if xd_mark < 0:
-        #     xd = zs_list[-1]['DD'][-1]
-        # else:
-        #     xd = zs_list[-1]['GG'][-1]
-        #
-        # start = xd.get('fx_start')
-        start = xd_list.sig_list[-1]['start']
+    if len(sig_min_list) < 1:
+        return
 
-        czsc_min = CzscMongo(code=code, start=start, end=last_trade_time, freq='5min', exchange=exchange)
+    last_min_sig = sig_min_list[-1]
 
-        try:
-            if len(czsc_min.data) < 1:
-                util_log_info("========={} {} 0 5min Quotes========".format(code, exchange))
-                continue
-        except:
-            util_log_info("========={} {} 5min Quotes file is not exists!========".format(code, exchange))
-            continue
+    if last_min_sig['date'] < last_trade_date:
+        return
 
-        if czsc_min.data.iloc[-1]['date'] < last_trade_date:
-            util_log_info(
-                "==Please Update {} {} 5min Quotes from {}==".format(
-                    code, exchange, czsc_day.data.iloc[-1]['date'].strftime('%Y-%m-%d'))
-            )
-            continue
+    df = pd.DataFrame(sig_min_list).set_index('date')
 
-        czsc_min.run()
+    bar_df = czsc_min.bars.to_df().set_index('date')
+    bar_df = bar_df[bar_df.index > last_trade_date]
 
-        sig_min_list = czsc_min.sig_list
+    if xd_mark > 0:
+        idx = bar_df['low'].idxmin()
+    else:
+        idx = bar_df['high'].idxmax()
 
-        if len(sig_min_list) < 1:
-            continue
+    if df.empty:
+        util_log_info("===Please Download {} {} 5min Data===".format(code, exchange))
+        return
 
-        last_min_sig = sig_min_list[-1]
+    try:
+        last_min_sig = df.loc[idx].to_dict()
+    except:
+        util_log_info("{} {} Have a opposite Signal=======".format(code, exchange))
+        return
 
-        if last_min_sig['date'] < last_trade_date:
-            continue
+    if last_min_sig['xd_mark'] * xd_mark < 0:  # 日内高低点不一定是高级别买卖点
+        util_log_info("{} {} Have a opposite Signal=======".format(code, exchange))
+        return
 
-        df = pd.DataFrame(sig_min_list).set_index('date')
+    # 顺趋势买卖点为1，-1，逆趋势级别要大,小于0为逆趋势,或者不为笔分型
+    # (xd_mark * zs_list[-1]['location'] <= 0 and last_min_sig['xd'] >= 2)
+    # (xd_mark * zs_list[-1]['location'] >= 0 and last_min_sig['xd_mark'] in [1, -1])
+    # ('fx_start' in xd_list[-1])
+    if not (
+            (xd_mark * zs_list[-1]['location'] <= 0 and last_min_sig['xd'] >= 2)
+            or (xd_mark * zs_list[-1]['location'] >= 0 and last_min_sig['xd_mark'] in [1, -1])
+            or ('fx_start' in xd_list[-1])
+    ):
+        util_log_info("==={} xd:{}, xd_mark:{}===".format(code, last_min_sig['xd'], last_min_sig['xd_mark']))
+        return
 
-        bar_df = pd.DataFrame(czsc_min.bars).set_index('date')
-        bar_df = bar_df[bar_df.index > last_trade_date]
+    try:
+        dif = 0 if np.isnan(last_min_sig.get('dif')) else last_min_sig.get('dif')
+        macd = 0 if np.isnan(last_min_sig.get('macd')) else last_min_sig.get('macd')
+        last_min_sig.update(macd=dif + macd)
+    except TypeError:
+        util_log_info("{} {} has no macd value=======".format(code, exchange))
 
-        if xd_mark > 0:
-            idx = bar_df['low'].idxmin()
-        else:
-            idx = bar_df['high'].idxmax()
+    # if code in ['515120', '510310', '512500', '515380', '515390', '515800', '159905']:
+    #     print('ok')
 
-        if df.empty:
-            util_log_info("===Please Download {} {} 5min Data===".format(code, exchange))
-            continue
+    for idx in range(1, last_min_sig['xd']+1):
+        dif = 0 if np.isnan(last_min_sig.get('dif{}'.format(idx))) else last_min_sig.get('dif{}'.format(idx))
+        macd = 0 if np.isnan(last_min_sig.get('macd{}'.format(idx))) else last_min_sig.get('macd{}'.format(idx))
+        last_min_sig.update(macd=last_min_sig.get('macd') + dif + macd)
 
-        try:
-            last_min_sig = df.loc[idx].to_dict()
-        except:
-            util_log_info("{} {} Have a opposite Signal=======".format(code, exchange))
-            continue
+    for key in last_min_sig:
+        last_day_sig[key + '_min'] = last_min_sig[key]
 
-        if last_min_sig['xd_mark'] * xd_mark < 0:  # 日内高低点不一定是高级别买卖点
-            util_log_info("{} {} Have a opposite Signal=======".format(code, exchange))
-            continue
+    # last_day_sig['start'] = start
 
-        # 顺趋势买卖点为1，-1，逆趋势级别要大,小于0为逆趋势,或者不为笔分型
-        # (xd_mark * zs_list[-1]['location'] <= 0 and last_min_sig['xd'] >= 2)
-        # (xd_mark * zs_list[-1]['location'] >= 0 and last_min_sig['xd_mark'] in [1, -1])
-        # ('fx_start' in xd_list[-1])
-        if not (
-                (xd_mark * zs_list[-1]['location'] <= 0 and last_min_sig['xd'] >= 2)
-                or (xd_mark * zs_list[-1]['location'] >= 0 and last_min_sig['xd_mark'] in [1, -1])
-                or ('fx_start' in xd_list[-1])
-        ):
-            util_log_info("==={} xd:{}, xd_mark:{}===".format(code, last_min_sig['xd'], last_min_sig['xd_mark']))
-            continue
+    last_day_sig.update(amount=amount, code=code, exchange=exchange)
 
-        try:
-            dif = 0 if np.isnan(last_min_sig.get('dif')) else last_min_sig.get('dif')
-            macd = 0 if np.isnan(last_min_sig.get('macd')) else last_min_sig.get('macd')
-            last_min_sig.update(macd=dif + macd)
-        except TypeError:
-            util_log_info("{} {} has no macd value=======".format(code, exchange))
+    return last_day_sig
+
+
+def _init_signal_worker():
+    # 每个进程只在启动时读取一次证券列表，之后所有任务复用
+    from czsc.Fetch import tdx
+    return tdx.get_security_index()
 
-        # if code in ['515120', '510310', '512500', '515380', '515390', '515800', '159905']:
-        #     print('ok')
 
-        for idx in range(1, last_min_sig['xd']+1):
-            dif = 0 if np.isnan(last_min_sig.get('dif{}'.format(idx))) else last_min_sig.get('dif{}'.format(idx))
-            macd = 0 if np.isnan(last_min_sig.get('macd{}'.format(idx))) else last_min_sig.get('macd{}'.format(idx))
-            last_min_sig.update(macd=last_min_sig.get('macd') + dif + macd)
+def _calculate_bs_signal_task(args):
+    return _calculate_bs_signal(*args)
 
-        for key in last_min_sig:
-            last_day_sig[key + '_min'] = last_min_sig[key]
 
-        # last_day_sig['start'] = start
+def calculate_bs_signals(security_df: pd.DataFrame, last_trade_date=None, processes=1, chunksize=None):
+    """
+    :param security_df: 证券列表
+    :param last_trade_date: 最后交易日
+    :param processes: 进程数，1为单进程，None为cpu核数
+    :param chunksize: 每次分配给一个进程的品种数量
+    """
+    sig_list = []
 
-        last_day_sig.update(amount=amount, code=code, exchange=exchange)
+    if last_trade_date is None:
+        last_trade_date = util_get_real_date(datetime.today().strftime('%Y-%m-%d'))
 
-        sig_list.append(last_day_sig)
+    last_trade_time = pd.to_datetime(util_get_next_day(last_trade_date))
+    last_trade_date = pd.to_datetime(last_trade_date)
 
-        index = index + 1
-        util_log_info("==={:=>4d}. {} {} Have a Signal=======".format(index, code, exchange))
+    tasks = [
+        (code, item, last_trade_date, last_trade_time)
+        for code, item in zip(security_df.index, security_df.to_dict('records'))
+    ]
+
+    if processes == 1 or len(tasks) < 2:
+        results = map(_calculate_bs_signal_task, tasks)
+        executor = None
+    else:
+        processes = processes or os.cpu_count()
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (processes * 4))
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_signal_worker)
+        # map按提交顺序返回结果，输出和单进程一致
+        results = executor.map(_calculate_bs_signal_task, tasks, chunksize=chunksize)
+
+    index = 0
+    try:
+        for (code, item, _, _), last_day_sig in zip(tasks, results):
+            if last_day_sig is None:
+                continue
+
+            sig_list.append(last_day_sig)
+
+            index = index + 1
+            util_log_info("==={:=>4d}. {} {} Have a Signal=======".format(index, code, item['exchange']))
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     if len(sig_list) < 1:
         util_log_info("========There are 0 Signal=======")
@@ -1217,7 +1517,7 @@ def calculate_bs_signals(security_df: pd.DataFrame, last_trade_date=None):
     return df
 
 
-def main_signal(last_trade_date=None, security_blocks=None):
+def main_signal(last_trade_date=None, security_blocks=None, processes=1):
     from czsc.Fetch.tdx import SECURITY_DATAFRAME
 
     security_classes = [
@@ -1262,7 +1562,7 @@ def main_signal(last_trade_date=None, security_blocks=None):
             sub_security_df = sub_security_df[sub_security_df['finance'] > 40]
             sub_security_df = sub_security_df[sub_security_df['holders'] > 10]
 
-        df = calculate_bs_signals(sub_security_df, last_trade_date)
+        df = calculate_bs_signals(sub_security_df, last_trade_date, processes=processes)
 
         if df is None or df.empty:
             continue
@@ -25,8 +25,6 @@
 财务指标结构
 
 """
-from datetime import datetime
-
 import pandas as pd
 import numpy as np
 
@@ -128,32 +126,34 @@ class FinancialStruct:
             return self.data.loc[(pd.Timestamp(reportdate), code), key]
 
     def get_ttm_data(self):
+        """
+        滚动12个月数据，年报直接使用，其他报告期 TTM = 本期 + 上年年报 - 上年同期，
+        缺少上年年报或者上年同期时使用本期数据
+        按 (报告期, 代码) 一次对齐所有代码，不逐行计算
+        """
         data = self.data
-        ttm_data = pd.DataFrame()
-
-        for index, item in data.iterrows():
-            date = index[0]
-            code = index[1]
-
-            y = date.year
-            m = date.month
-            d = date.day
-
-            if m == 12:
-                x = item
-            else:
-                date1 = datetime(y - 1, m, d)
-                date2 = datetime(y - 1, 12, 31)
-
-                try:
-                    x1 = data.loc[(date1, code)]
-                    x2 = data.loc[(date2, code)]
-                    x = item + x2 - x1
-                except:
-                    x = item
-
-            ttm_data = ttm_data.append(x.to_frame(index).T)
-            ttm_data.index.set_names(['report_date', 'code'], inplace=True)
+        if data.empty:
+            return pd.DataFrame()
+
+        report_date = data.index.get_level_values(0)
+        code = data.index.get_level_values(1)
+
+        last_year = report_date - pd.DateOffset(years=1)
+        last_annual = pd.to_datetime(pd.DataFrame({'year': report_date.year - 1, 'month': 12, 'day': 31}))
+
+        x1 = data.index.get_indexer(pd.MultiIndex.from_arrays([last_year, code]))
+        x2 = data.index.get_indexer(pd.MultiIndex.from_arrays([last_annual, code]))
+
+        # 2月29日等上年没有同一天的报告期，不计算
+        same_day = (last_year.month == report_date.month) & (last_year.day == report_date.day)
+        mask = (report_date.month != 12) & same_day & (x1 >= 0) & (x2 >= 0)
+
+        values = data.to_numpy(dtype=float)
+        ttm = values.copy()
+        ttm[mask] = values[mask] + values[x2[mask]] - values[x1[mask]]
+
+        ttm_data = pd.DataFrame(ttm, index=data.index.copy(), columns=data.columns)
+        ttm_data.index.set_names(['report_date', 'code'], inplace=True)
 
         return ttm_data
 
@@ -0,0 +1,274 @@
+# coding:utf-8
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+按列存储的K线序列
+
+K线和指标按字段分别存放在预分配的numpy数组中，容量不足时成倍扩容，
+读取时按行组装成dict，和原来 list of dict 的用法一致：
+    bars[-1]['high'], bars[-20:], len(bars), for bar in bars
+行是 BarRow，修改字段 bars[-1]['x'] = value 会同时写入对应的列，新的字段增加一列；
+同一行多次读取得到的是不同的对象(最后一行除外)，只有写入的那个对象和列保持一致。
+trim 删除前面的数据后，offset 记录删除的行数，下标仍然从当前保留的第一行开始
+"""
+from datetime import datetime
+from numbers import Integral, Real
+
+import numpy as np
+import pandas as pd
+
+
+def _column_dtype(value):
+    if isinstance(value, (pd.Timestamp, datetime, np.datetime64)):
+        return np.dtype('datetime64[ns]')
+    if isinstance(value, (bool, np.bool_)):
+        return np.dtype(object)
+    if isinstance(value, Integral):
+        return np.dtype(np.int64)
+    if isinstance(value, Real):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def _empty_value(dtype):
+    if dtype.kind == 'M':
+        return np.datetime64('NaT')
+    if dtype.kind == 'f':
+        return np.nan
+    if dtype.kind == 'i':
+        return 0
+    return None
+
+
+class BarRow(dict):
+    """BarStore 的一行，修改字段时同时写入对应的列"""
+
+    __slots__ = ('_store', '_position')
+
+    def __init__(self, store, position, values):
+        super().__init__(values)
+        self._store = store
+        # 在完整序列中的位置，trim 之后仍然对应同一行
+        self._position = position
+
+    def __setitem__(self, name, value):
+        super().__setitem__(name, value)
+        self._store._set_value(self._position - self._store.offset, name, value)
+
+    def update(self, *args, **kwargs):
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+
+    def setdefault(self, name, value=None):
+        if name not in self:
+            self[name] = value
+        return self[name]
+
+    def __reduce__(self):
+        # 序列化为普通dict，不带上整个 BarStore
+        return dict, (dict(self),)
+
+
+class BarStore:
+    """
+    按列存储的K线序列
+
+    所有行的字段相同：某一行新出现的字段会增加一列，之前的行用空值填充，
+    缺少某个字段的行同样填充空值(时间 NaT，小数 nan，整数 0，其他 None)，
+    所以 'key' in bar 对所有行都成立，需要用填充值判断是否有数据，例如 bar.get('UB', np.nan)
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.length = 0
+        # 已经删除的行数，offset + i 为第i行在完整序列中的位置
+        self.offset = 0
+        # 字段名 -> 预分配的数组，保持字段插入顺序
+        self.columns = {}
+        # 最后一行的dict缓存，引擎绝大多数读取的都是最后一根K线
+        self._last = None
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self._record(i)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._record(i) for i in range(*item.indices(self.length))]
+
+        if item < 0:
+            item = item + self.length
+        if item < 0 or item >= self.length:
+            raise IndexError('BarStore index out of range')
+
+        if item == self.length - 1:
+            if self._last is None:
+                self._last = self._record(item)
+            return self._last
+        return self._record(item)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_last'] = None
+        return state
+
+    def _record(self, i):
+        record = {}
+        for name, column in self.columns.items():
+            value = column[i]
+            if column.dtype.kind == 'M':
+                value = pd.Timestamp(value)
+            record[name] = value
+        return BarRow(self, self.offset + i, record)
+
+    def _grow(self, capacity):
+        for name, column in self.columns.items():
+            new_column = np.empty(capacity, dtype=column.dtype)
+            new_column[:self.length] = column[:self.length]
+            self.columns[name] = new_column
+        self.capacity = capacity
+
+    def _add_column(self, name, value):
+        dtype = _column_dtype(value)
+        column = np.empty(self.capacity, dtype=dtype)
+        column[:self.length] = _empty_value(dtype)
+        self.columns[name] = column
+
+    def _set_value(self, i, name, value):
+        if i < 0 or i >= self.length:
+            raise IndexError('BarStore row has been removed')
+        column = self.columns.get(name)
+        if column is None:
+            self._add_column(name, value)
+            column = self.columns[name]
+            # 缓存的最后一行没有新的字段
+            self._last = None
+        elif column.dtype.kind == 'i' and not isinstance(value, Integral):
+            # 整数列出现小数时升级为float
+            column = column.astype(np.float64)
+            self.columns[name] = column
+        column[i] = value
+
+        if self._last is not None and i == self.length - 1:
+            dict.__setitem__(self._last, name, value)
+
+    def _set(self, i, bar):
+        for name, value in bar.items():
+            column = self.columns.get(name)
+            if column is None:
+                self._add_column(name, value)
+                column = self.columns[name]
+            elif column.dtype.kind == 'i' and not isinstance(value, Integral):
+                # 整数列出现小数时升级为float
+                column = column.astype(np.float64)
+                self.columns[name] = column
+            column[i] = value
+
+        # 缺失的字段用空值填充
+        if len(bar) < len(self.columns):
+            for name, column in self.columns.items():
+                if name not in bar:
+                    column[i] = _empty_value(column.dtype)
+
+    def append(self, bar: dict):
+        if self.length >= self.capacity:
+            self._grow(self.capacity * 2)
+        self._set(self.length, bar)
+        self.length = self.length + 1
+        self._last = None
+
+    def extend(self, columns: dict):
+        """按列批量追加数据，columns 为 字段名 -> 等长数组"""
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        size = len(next(iter(columns.values()))) if columns else 0
+        if size < 1:
+            return
+
+        capacity = self.capacity
+        while self.length + size > capacity:
+            capacity = capacity * 2
+        if capacity > self.capacity:
+            self._grow(capacity)
+
+        start, end = self.length, self.length + size
+        for name, values in columns.items():
+            column = self.columns.get(name)
+            if column is None:
+                dtype = values.dtype
+                if dtype.kind == 'M':
+                    dtype = np.dtype('datetime64[ns]')
+                elif dtype.kind in 'iu':
+                    dtype = np.dtype(np.int64)
+                elif dtype.kind == 'f':
+                    dtype = np.dtype(np.float64)
+                else:
+                    dtype = np.dtype(object)
+                column = np.empty(self.capacity, dtype=dtype)
+                column[:start] = _empty_value(dtype)
+                self.columns[name] = column
+            elif column.dtype.kind == 'i' and values.dtype.kind == 'f':
+                column = column.astype(np.float64)
+                self.columns[name] = column
+            column[start:end] = values
+
+        for name, column in self.columns.items():
+            if name not in columns:
+                column[start:end] = _empty_value(column.dtype)
+
+        self.length = end
+        self._last = None
+
+    def pop(self, index=-1):
+        if index not in [-1, self.length - 1]:
+            raise IndexError('BarStore only supports pop the last bar')
+        bar = self[-1]
+        self.length = self.length - 1
+        self._last = None
+        return bar
+
+    def trim(self, count):
+        """删除前面 count 行，保留的数据移动到数组开头"""
+        count = min(count, self.length)
+        if count < 1:
+            return
+        for column in self.columns.values():
+            column[:self.length - count] = column[count:self.length]
+            if column.dtype.kind == 'O':
+                column[self.length - count:self.length] = None  # 释放对象引用
+        self.length = self.length - count
+        self.offset = self.offset + count
+        self._last = None
+
+    def column(self, name):
+        """返回字段的数组视图，不复制数据"""
+        return self.columns[name][:self.length]
+
+    def to_df(self):
+        return pd.DataFrame({name: self.column(name) for name in self.columns})
@@ -0,0 +1,104 @@
+# coding:utf-8
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+固定容量的环形缓冲区
+
+K线生成器每个级别保存最近 capacity 根K线，满了之后新的K线覆盖最早的一根，
+追加和替换最后一根都是O(1)，不需要每次更新都用 x = x[-max_count:] 复制整个列表。
+读取的用法和 list 一致：
+    buffer[-1], buffer[-1] = bar, buffer[-20:], len(buffer), for bar in buffer
+K线是字段不固定的dict(symbol、dt、成交量字符串等)，这里保存对象引用，不按列存储。
+"""
+
+
+class RingBuffer:
+    """固定容量的环形缓冲区"""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('RingBuffer capacity must be positive')
+        self.capacity = capacity
+        self.items = [None] * capacity
+        # 最早一个元素在 items 中的位置
+        self.start = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self.items[(self.start + i) % self.capacity]
+
+    def __repr__(self):
+        return "<RingBuffer {}/{}>".format(self.length, self.capacity)
+
+    def _position(self, item):
+        if item < 0:
+            item = item + self.length
+        if item < 0 or item >= self.length:
+            raise IndexError('RingBuffer index out of range')
+        return (self.start + item) % self.capacity
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step != 1:
+                return [self.items[(self.start + i) % self.capacity] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+
+            # 连续的一段最多分成两次切片
+            lo = (self.start + start) % self.capacity
+            hi = lo + stop - start
+            if hi <= self.capacity:
+                return self.items[lo:hi]
+            return self.items[lo:] + self.items[:hi - self.capacity]
+
+        return self.items[self._position(item)]
+
+    def __setitem__(self, item, value):
+        self.items[self._position(item)] = value
+
+    def append(self, value):
+        if self.length < self.capacity:
+            self.items[(self.start + self.length) % self.capacity] = value
+            self.length = self.length + 1
+        else:
+            self.items[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def extend(self, values):
+        for value in list(values)[-self.capacity:]:
+            self.append(value)
+
+    def clear(self):
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.length = 0
@@ -0,0 +1,245 @@
+# coding:utf-8
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+通达信K线的本地按列缓存
+
+每个K线文件对应一个目录，每个字段存放在一个二进制文件中：
+    meta.json  字段和类型、记录数、源文件的修改时间和大小
+    date.bin   int64 纳秒时间戳
+    open.bin ...
+源文件修改后，从缓存的最后一根K线开始读取（最后一根K线盘中会被改写），追加到字段文件末尾，
+查询时内存映射日期列，按天二分查找 start 和 end，只复制需要的记录
+
+缓存目录按源文件的完整路径区分，不同通达信目录下的同名文件互不影响。
+更新和读取都持有缓存目录的文件锁，多个进程同时读取同一个品种时不会互相改写。
+改写字段文件之前删除 meta.json，写完后再保存，中断或者字段文件的大小和 meta 的记录数不一致时重建缓存。
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from czsc.Fetch.tdx_reader import count_records
+from czsc.Setting import cache_path
+from czsc.Utils import util_log_info
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_VERSION = 1
+BAR_CACHE_PATH = '{}{}{}'.format(cache_path, os.sep, 'bars')
+
+_DAY_NS = 24 * 60 * 60 * 1000000000
+
+
+def _cache_dir(file_path):
+    # 文件名便于查看，加上完整路径的摘要区分不同目录下的同名文件
+    path = os.path.abspath(file_path)
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(BAR_CACHE_PATH, '{}-{}'.format(os.path.basename(path), digest))
+
+
+@contextmanager
+def _lock(cache_dir):
+    """缓存目录的进程间互斥锁"""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, 'lock'), 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _load_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_VERSION:
+        return None
+
+    # 写入中断或者文件被改动，字段文件的大小和记录数不一致
+    for name, dtype in meta['columns']:
+        try:
+            size = os.path.getsize(os.path.join(cache_dir, name + '.bin'))
+        except OSError:
+            return None
+        if size != meta['length'] * np.dtype(dtype).itemsize:
+            return None
+    return meta
+
+
+def _save_meta(cache_dir, meta):
+    filename = os.path.join(cache_dir, 'meta.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def _remove_meta(cache_dir):
+    # 改写字段文件之前删除meta，中断时缓存无效，下次重建
+    try:
+        os.remove(os.path.join(cache_dir, 'meta.json'))
+    except FileNotFoundError:
+        pass
+
+
+def _columns(df):
+    return [['date', '<i8']] + [[name, df[name].dtype.str] for name in df.columns]
+
+
+def _write(cache_dir, meta, df, row):
+    """
+    保留前row条记录，后面写入df，增量更新时截断字段文件后直接追加，
+    重建时每个字段写到临时文件后替换原来的文件
+    """
+    _remove_meta(cache_dir)
+    for name, dtype in meta['columns']:
+        values = df.index.to_numpy(dtype='datetime64[ns]').view('<i8') if name == 'date' else df[name].to_numpy()
+        values = np.ascontiguousarray(values, dtype=dtype)
+
+        filename = os.path.join(cache_dir, name + '.bin')
+        if row > 0:
+            size = row * values.itemsize
+            with open(filename, 'r+b') as f:
+                if os.fstat(f.fileno()).st_size < size:
+                    raise ValueError('Bar cache {} is shorter than {} records'.format(filename, row))
+                f.truncate(size)
+                f.seek(size)
+                f.write(values.tobytes())
+        else:
+            with open(filename + '.tmp', 'wb') as f:
+                f.write(values.tobytes())
+            os.replace(filename + '.tmp', filename)
+
+    meta['length'] = row + len(df)
+
+
+def _column(cache_dir, meta, name):
+    dtype = dict(meta['columns'])[name]
+    if meta['length'] < 1:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(os.path.join(cache_dir, name + '.bin'), dtype=dtype, mode='r', shape=(meta['length'],))
+
+
+def _update(cache_dir, file_path, reader):
+    stat = os.stat(file_path)
+
+    meta = _load_meta(cache_dir)
+    if meta is not None and meta['source_mtime'] == stat.st_mtime_ns and meta['source_size'] == stat.st_size:
+        return meta
+
+    if meta is not None and 0 < meta['length'] <= count_records(file_path):
+        # 重新读取缓存的最后一根K线，日期一致时从这里开始覆盖
+        df = reader(file_path, skip=meta['length'] - 1)
+        last_date = _column(cache_dir, meta, 'date')[-1]
+        if len(df) > 0 and df.index[0].value == last_date and _columns(df) == meta['columns']:
+            _write(cache_dir, meta, df, meta['length'] - 1)
+            meta.update(source_mtime=stat.st_mtime_ns, source_size=stat.st_size)
+            _save_meta(cache_dir, meta)
+            return meta
+
+    df = reader(file_path)
+    meta = {'version': CACHE_VERSION, 'columns': _columns(df), 'length': 0}
+    _write(cache_dir, meta, df, 0)
+    meta.update(source_mtime=stat.st_mtime_ns, source_size=stat.st_size)
+    _save_meta(cache_dir, meta)
+    return meta
+
+
+def update_bar_cache(file_path, reader):
+    """
+    同步缓存和源文件，源文件没有变化时直接返回，否则只读取新增的记录，无法增量更新时重建
+    reader: czsc.Fetch.tdx_reader 中对应的读取函数
+    """
+    cache_dir = _cache_dir(file_path)
+    with _lock(cache_dir):
+        return _update(cache_dir, file_path, reader)
+
+
+def _bisect(dates, day, right=False):
+    """dates按天递增（夜盘K线的时间不一定递增），查找day所在的位置"""
+    lo, hi = 0, len(dates)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        value = dates[mid] // _DAY_NS
+        if value < day or (right and value == day):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _read(cache_dir, meta, start, end):
+    dates = _column(cache_dir, meta, 'date')
+    lo = _bisect(dates, start.value // _DAY_NS) if start is not None else 0
+    hi = _bisect(dates, end.value // _DAY_NS, right=True) if end is not None else len(dates)
+
+    index = pd.DatetimeIndex(np.array(dates[lo:hi]).view('datetime64[ns]'), name='date')
+    return pd.DataFrame(
+        {name: np.array(_column(cache_dir, meta, name)[lo:hi]) for name, _ in meta['columns'][1:]},
+        index=index
+    )
+
+
+def read_cached_bars(file_path, reader, start=None, end=None):
+    """
+    通过缓存读取K线，结果和直接调用 reader(file_path, start, end) 一致
+    """
+    start = pd.to_datetime(start) if start else None
+    end = pd.to_datetime(end) if end else None
+
+    cache_dir = _cache_dir(file_path)
+    try:
+        # 读取期间持有锁，其他进程不会替换正在读取的字段文件
+        with _lock(cache_dir):
+            meta = _update(cache_dir, file_path, reader)
+            df = _read(cache_dir, meta, start, end)
+    except Exception as error:
+        util_log_info('Bar cache of {} is not available: {}'.format(file_path, error))
+        return reader(file_path, start, end)
+
+    if start is not None:
+        df = df[df.index >= start]
+    if end is not None:
+        df = df[df.index <= end]
+    return df
@@ -24,6 +24,7 @@
 import logging
 from datetime import datetime
 
+import bson
 import numpy
 import pandas as pd
 import pymongo
@@ -31,7 +32,7 @@ from pandas import DataFrame
 
 from czsc.Data.financial_mean import financial_dict
 from czsc.Utils import util_log_info
-from czsc.Utils.trade_date import util_get_real_date, trade_date_sse, util_date_valid, util_date_stamp, \
+from czsc.Utils.trade_date import util_get_real_date, util_date_valid, util_date_stamp, \
     util_date_str2int, util_date_int2str
 
 # uri = 'mongodb://localhost:27017/factor'
@@ -107,9 +108,28 @@ def util_code_tolist(code, auto_fill=True):
 
 
 def now_time():
-    return str(util_get_real_date(str(datetime.date.today() - datetime.timedelta(days=1)), trade_date_sse, -1)) + \
+    return str(util_get_real_date(str(datetime.date.today() - datetime.timedelta(days=1)), 'sse', -1)) + \
            ' 17:00:00' if datetime.datetime.now().hour < 15 else str(util_get_real_date(
-        str(datetime.date.today()), trade_date_sse, -1)) + ' 15:00:00'
+        str(datetime.date.today()), 'sse', -1)) + ' 15:00:00'
+
+
+FUTURE_DAY_COLUMNS = ['code', 'open', 'high', 'low', 'close', 'position', 'price', 'trade', 'date']
+
+
+def _fetch_columns(collections, filter, columns, batch_size=10000):
+    """
+    只读取需要的字段，按批次取回原始BSON，用 bson 的C扩展整批解码后按列拼接成DataFrame
+    """
+    projection = {"_id": 0}
+    projection.update({column: 1 for column in columns})
+
+    frames = [
+        DataFrame(bson.decode_all(batch), columns=columns)
+        for batch in collections.find_raw_batches(filter, projection, batch_size=batch_size)
+    ]
+    if len(frames) < 1:
+        return DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
 
 
 def fetch_future_day(
@@ -133,59 +153,33 @@ def fetch_future_day(
     code = util_code_tolist(code, auto_fill=False)
 
     if util_date_valid(end):
-
-        _data = []
-        cursor = collections.find(
-            {
-                'code': {
-                    '$in': code
-                },
-                "date_stamp":
-                    {
-                        "$lte": util_date_stamp(end),
-                        "$gte": util_date_stamp(start)
-                    }
+        filter = {
+            'code': {
+                '$in': code
             },
-            {"_id": 0},
-            batch_size=10000
-        )
+            "date_stamp":
+                {
+                    "$lte": util_date_stamp(end),
+                    "$gte": util_date_stamp(start)
+                }
+        }
+
         if format in ['dict', 'json']:
+            cursor = collections.find(filter, {"_id": 0}, batch_size=10000)
             return [data for data in cursor]
-        for item in cursor:
-            _data.append(
-                [
-                    str(item['code']),
-                    float(item['open']),
-                    float(item['high']),
-                    float(item['low']),
-                    float(item['close']),
-                    float(item['position']),
-                    float(item['price']),
-                    float(item['trade']),
-                    item['date']
-                ]
-            )
+
+        _data = _fetch_columns(collections, filter, FUTURE_DAY_COLUMNS)
+        _data['code'] = _data['code'].astype(str)
+        for column in ['open', 'high', 'low', 'close', 'position', 'price', 'trade']:
+            _data[column] = _data[column].astype(float)
 
         # 多种数据格式
         if format in ['n', 'N', 'numpy']:
-            _data = numpy.asarray(_data)
+            _data = numpy.asarray(_data.to_numpy(dtype=object).tolist())
         elif format in ['list', 'l', 'L']:
-            _data = _data
+            _data = _data.to_numpy(dtype=object).tolist()
         elif format in ['P', 'p', 'pandas', 'pd']:
-            _data = DataFrame(
-                _data,
-                columns=[
-                    'code',
-                    'open',
-                    'high',
-                    'low',
-                    'close',
-                    'position',
-                    'price',
-                    'trade',
-                    'date'
-                ]
-            ).drop_duplicates()
+            _data = _data.drop_duplicates()
             _data['date'] = pd.to_datetime(_data['date'])
             _data = _data.set_index('date', drop=False)
         else:
@@ -198,6 +192,17 @@ def fetch_future_day(
         logging.warning('Something wrong with date')
 
 
+def fetch_future_days(codes, start=None, end=None, collections=QA_DATABASE.future_day):
+    """
+    一次查询读取多个品种的日线
+    :return: dict, code -> pd.DataFrame，和 fetch_future_day 单个品种的结果一致
+    """
+    data = fetch_future_day(codes, start=start, end=end, collections=collections)
+    if data is None:
+        return {}
+    return {code: df for code, df in data.groupby('code', sort=False)}
+
+
 def fetch_financial_report(code=None, start=None, end=None, report_date=None, ltype='EN', db=QA_DATABASE):
     """
     获取专业财务报表
@@ -25,18 +25,24 @@
 # 从TDX磁盘空间读取数据
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
-from pytdx.reader import TdxDailyBarReader, TdxExHqDailyBarReader, TdxLCMinBarReader, BlockReader
+from pytdx.reader import BlockReader
 
 from czsc.Data.code_classify import sse_code_classify, szse_code_classify
-from czsc.Setting import TDX_DIR
+from czsc.Setting import TDX_DIR, cache_path
 from czsc.Utils import util_log_info
+from czsc.Utils.trade_date import util_get_trade_ordinal
 from czsc.Data.frequency import parse_frequency_str
 from czsc.Data.resample import resample_from_daily_data
+from czsc.Fetch.bar_cache import read_cached_bars
+from czsc.Fetch.tdx_reader import read_daily_bars, read_ex_daily_bars, read_min_bars
 
 _SH_DIR = '{}{}{}'.format(TDX_DIR, os.sep, 'vipdoc\\sh')
 _SZ_DIR = '{}{}{}'.format(TDX_DIR, os.sep, 'vipdoc\\sz')
@@ -101,10 +107,7 @@ def _get_sh_sz_list():
     sz_df['instrument'] = sz_df.code.apply(szse_code_classify)
 
     sz_df['filename'] = sz_list
-    sz_df['last_modified'] = sz_df['filename'].apply(lambda x: os.path.getmtime(os.path.join(sz_dir, x)))
-
     sh_df['filename'] = sh_list
-    sh_df['last_modified'] = sh_df['filename'].apply(lambda x: os.path.getmtime(os.path.join(sh_dir, x)))
 
     return pd.concat([sh_df, sz_df])
 
@@ -159,35 +162,120 @@ def _get_ds_list():
         lambda x: DS_CODE_TO_TYPE[x]['instrument'] if x in DS_CODE_TO_TYPE else None)
 
     ds_df['filename'] = ds_list
-    ds_df['last_modified'] = ds_df['filename'].apply(lambda x: os.path.getmtime(os.path.join(ds_dir, x)))
 
     return ds_df
 
 
-def get_security_list():
-    securities: DataFrame = pd.concat([_get_sh_sz_list(), _get_ds_list()])
-    securities['last_modified'] = securities['last_modified'].apply(lambda x: pd.to_datetime(x, unit='s'))  # 日期正确，小时不对
-    return securities.set_index('code')
+def _get_lday_dir(tdx_code):
+    if tdx_code == 'sh':
+        return '{}{}{}'.format(_SH_DIR, os.sep, 'lday')
+    if tdx_code == 'sz':
+        return '{}{}{}'.format(_SZ_DIR, os.sep, 'lday')
+    return '{}{}{}'.format(_DS_DIR, os.sep, 'lday')
 
 
-SECURITY_DATAFRAME = get_security_list()
+# 证券文件列表的内存缓存 (目录修改时间, DataFrame, 索引, 带文件修改时间的证券列表)
+_SECURITY_CACHE = None
+_SECURITY_CACHE_FILE = '{}{}{}'.format(cache_path, os.sep, 'tdx_security_list.pkl')
+# 内存缓存最多每隔这么多秒检查一次目录的修改时间，get_bar 不需要每次都读取目录信息
+SECURITY_CACHE_CHECK_INTERVAL = 60
+_SECURITY_CACHE_CHECKED = 0.0
 
 
-def _get_tdx_code_from_security_dataframe(code, exchange):
+def _get_security_cache(refresh=False):
+    """
+    证券文件列表和分类，目录中增加或者删除文件时目录的修改时间会改变，用来判断缓存是否有效
+    先查内存，再查本地缓存文件，都失效时重新扫描目录
+    内存缓存在 SECURITY_CACHE_CHECK_INTERVAL 秒内直接使用，refresh=True 时立即检查
+    """
+    global _SECURITY_CACHE, _SECURITY_CACHE_CHECKED
+
+    now = time.monotonic()
+    if _SECURITY_CACHE is not None and not refresh:
+        if now - _SECURITY_CACHE_CHECKED < SECURITY_CACHE_CHECK_INTERVAL:
+            return _SECURITY_CACHE
+
+    key = (TDX_DIR,) + tuple(os.path.getmtime(_get_lday_dir(x)) for x in ['sh', 'sz', 'ds'])
+    _SECURITY_CACHE_CHECKED = now
+
+    if _SECURITY_CACHE is not None and _SECURITY_CACHE[0] == key:
+        return _SECURITY_CACHE
+
+    securities = None
     try:
-        recorder = SECURITY_DATAFRAME.loc[code]
-    except:
+        cached_key, cached_securities = pd.read_pickle(_SECURITY_CACHE_FILE)
+        if cached_key == key:
+            securities = cached_securities
+    except Exception:
+        pass
+
+    if securities is None:
+        securities = pd.concat([_get_sh_sz_list(), _get_ds_list()], ignore_index=True)
+        try:
+            pd.to_pickle((key, securities), _SECURITY_CACHE_FILE)
+        except Exception as error:
+            util_log_info("Can't save security list cache {}: {}".format(_SECURITY_CACHE_FILE, error))
+
+    # code -> [{'tdx_code', 'exchange', 'instrument'}]，同一个代码可能在多个市场
+    index = {}
+    for record in securities[['code', 'tdx_code', 'exchange', 'instrument']].to_dict('records'):
+        index.setdefault(record['code'], []).append(record)
+
+    _SECURITY_CACHE = (key, securities, index, None)
+    return _SECURITY_CACHE
+
+
+def get_security_index(refresh=False):
+    """
+    代码 -> 证券记录列表，refresh=True 时立即检查目录是否有变化
+    """
+    return _get_security_cache(refresh)[2]
+
+
+def get_security_list(refresh=False):
+    global _SECURITY_CACHE
+
+    key, securities, index, security_df = _get_security_cache(refresh)
+    if security_df is None:
+        security_df: DataFrame = securities.copy()
+        security_df['last_modified'] = [
+            os.path.getmtime(os.path.join(_get_lday_dir(tdx_code), filename))
+            for tdx_code, filename in zip(security_df['tdx_code'], security_df['filename'])
+        ]
+        security_df['last_modified'] = pd.to_datetime(security_df['last_modified'], unit='s')  # 日期正确，小时不对
+        security_df = security_df.set_index('code')
+        _SECURITY_CACHE = (key, securities, index, security_df)
+    return security_df
+
+
+def __getattr__(name):
+    # SECURITY_DATAFRAME 第一次使用时才扫描文件，import时不再读取目录
+    if name == 'SECURITY_DATAFRAME':
+        return get_security_list()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _get_security_record(code, exchange):
+    records = get_security_index().get(code)
+    if not records:
         util_log_info("Can't get tdx_code from {}".format(code))
         return
 
-    if isinstance(recorder, pd.Series):
-        return recorder['tdx_code']
+    if len(records) == 1:
+        return records[0]
 
-    try:
-        return recorder.loc[recorder['exchange'] == exchange].loc[code, 'tdx_code']
-    except:
-        util_log_info('Not only one {} in the list , please provide exchange or instrument'.format(code))
-        return recorder.tdx_code[0]
+    for record in records:
+        if record['exchange'] == exchange:
+            return record
+
+    util_log_info('Not only one {} in the list , please provide exchange or instrument'.format(code))
+    return records[0]
+
+
+def _get_tdx_code_from_security_dataframe(code, exchange):
+    record = _get_security_record(code, exchange)
+    if record is not None:
+        return record['tdx_code']
 
 
 def _generate_path(code, freq, tdx_code):
@@ -224,15 +312,17 @@ def _generate_path(code, freq, tdx_code):
     return file_path
 
 
-def get_bar(code, start=None, end=None, freq='day', exchange=None):
+def get_bar(code, start=None, end=None, freq='day', exchange=None, cache=False):
     """
     股票成交量 volume 单位是100股
+    cache 为 True 时通过本地缓存读取，源文件更新后只读取新增的记录
     """
     code = code.upper()
     standard_freq = parse_frequency_str(freq)
 
     try:
-        tdx_code = _get_tdx_code_from_security_dataframe(code, exchange)
+        record = _get_security_record(code, exchange)
+        tdx_code = record['tdx_code']
     except:
         util_log_info("Can't get tdx_code from {}".format(code))
         return
@@ -251,51 +341,29 @@ def get_bar(code, start=None, end=None, freq='day', exchange=None):
         util_log_info('=={}== {} file is not exists!'.format(code, file_path))
         return
 
-    # 统一freq的数据结构
-    if tdx_code in ['sh', 'sz']:
-        if standard_freq in ['D', 'w', 'M', 'Q', 'Y']:
-            reader = TdxDailyBarReader()
-            df = reader.get_df(file_path)
-        elif standard_freq in ['1min', '5min', '30min', '60min']:
-            reader = TdxLCMinBarReader()
-            df = reader.get_df(file_path)
+    # 统一freq的数据结构，按日期二分查找只读取start到end之间的记录
+    if standard_freq in ['D', 'w', 'M', 'Q', 'Y']:
+        if tdx_code in ['sh', 'sz']:
+            reader = read_daily_bars
         else:
-            util_log_info('Not supported frequency {}'.format(freq))
-            return
+            reader = read_ex_daily_bars
+    elif standard_freq in ['1min', '5min', '30min', '60min']:
+        reader = read_min_bars
     else:
-        if standard_freq in ['D', 'w', 'M', 'Q', 'Y']:
-            reader = TdxExHqDailyBarReader()
-            df = reader.get_df(file_path)
-        elif standard_freq in ['1min', '5min', '30min', '60min']:
-            reader = TdxLCMinBarReader()
-            df = reader.get_df(file_path)
-        else:
-            util_log_info('Not supported frequency {}'.format(freq))
-            return
-
-    if len(df) < 1:
+        util_log_info('Not supported frequency {}'.format(freq))
         return
 
-    recorder = SECURITY_DATAFRAME.loc[code]
-
-    if isinstance(recorder, pd.DataFrame):
-        instrument = recorder.loc[recorder['tdx_code'] == tdx_code].loc[code, 'instrument']
-        exchange = recorder.loc[recorder['tdx_code'] == tdx_code].loc[code, 'exchange']
+    if cache:
+        df = read_cached_bars(file_path, reader, start, end)
     else:
-        instrument = recorder['instrument']
-        exchange = recorder['exchange']
+        df = reader(file_path, start, end)
+
+    instrument = record['instrument']
+    exchange = record['exchange']
 
     if instrument in ['future', 'option']:
         df.rename(columns={'amount': "position", "jiesuan": "settle"}, inplace=True)
 
-    if start:
-        start = pd.to_datetime(start)
-        df = df[df.index >= start]
-
-    if end:
-        end = pd.to_datetime(end)
-        df = df[df.index <= end]
-
     df['date'] = df.index
     df = df.assign(code=code, exchange=exchange)
 
@@ -304,6 +372,71 @@ def get_bar(code, start=None, end=None, freq='day', exchange=None):
     return df
 
 
+def get_bars(codes, start=None, end=None, freq='day', exchange=None, cache=False, max_workers=8, format='long'):
+    """
+    同时读取多个品种的K线，用线程池并发读取文件
+    :param codes: 代码列表，元素为 code 或者 (code, exchange)
+    :param format: 'long' 返回长表，code 为 category 类型，按 codes 的顺序排列
+                   'dict' 返回 字段 -> 二维数组 (日期, 品种)，日期为所有品种日期的并集，按交易时间排序，缺失为nan，
+                   品种按 (code, exchange) 区分，对应的代码和交易所在 panel['code'] 和 panel['exchange'] 中
+    """
+    codes = [x if isinstance(x, (tuple, list)) else (x, exchange) for x in codes]
+
+    get_security_index()  # 在主线程建立证券索引，避免每个线程重复扫描
+
+    def fetch(item):
+        code, code_exchange = item
+        try:
+            return get_bar(code, start=start, end=end, freq=freq, exchange=code_exchange, cache=cache)
+        except Exception as error:
+            util_log_info('{} : {}'.format(code, error))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(fetch, codes))
+
+    # 同一个代码可能在多个交易所，用读取到的交易所区分品种，没有数据的用传入的交易所
+    keys = [
+        (code.upper(), df['exchange'].iloc[0] if df is not None and len(df) > 0 else code_exchange)
+        for (code, code_exchange), df in zip(codes, frames)
+    ]
+    frames = dict((key, df) for key, df in zip(keys, frames) if df is not None and len(df) > 0)
+    categories = list(dict.fromkeys(keys))
+
+    if format == 'long':
+        if len(frames) < 1:
+            return pd.DataFrame()
+        df = pd.concat([frames[key] for key in categories if key in frames])
+        df['code'] = pd.Categorical(df['code'], categories=list(dict.fromkeys(code for code, _ in categories)))
+        return df
+
+    if format != 'dict':
+        raise ValueError('Not supported format {}'.format(format))
+
+    dates = pd.DatetimeIndex([], dtype='datetime64[ns]')
+    for x in frames.values():
+        dates = dates.union(x.index.astype('datetime64[ns]'))
+    # 夜盘K线的时间比当天日盘晚，按交易时间排序
+    dates = dates[np.argsort([util_get_trade_ordinal(x) for x in dates], kind='stable')]
+    columns = [
+        name for name in dict.fromkeys(name for x in frames.values() for name in x.columns)
+        if name not in ['date', 'code', 'exchange'] and all(
+            pd.api.types.is_numeric_dtype(x[name]) for x in frames.values() if name in x.columns)
+    ]
+
+    panel = {name: np.full((len(dates), len(categories)), np.nan) for name in columns}
+    for key, x in frames.items():
+        rows = dates.get_indexer(x.index)
+        column = categories.index(key)
+        for name in columns:
+            if name in x.columns:
+                panel[name][rows, column] = x[name].to_numpy()
+
+    panel['date'] = dates.to_numpy()
+    panel['code'] = np.array([code for code, _ in categories], dtype=object)
+    panel['exchange'] = np.array([code_exchange for _, code_exchange in categories], dtype=object)
+    return panel
+
+
 def get_index_block():
     """
     返回股票对应的指数
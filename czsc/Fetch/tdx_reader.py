@@ -0,0 +1,166 @@
+# coding:utf-8
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+直接读取通达信的K线文件
+
+文件是定长记录，用 numpy 结构化类型内存映射，日期按记录顺序递增，
+二分查找 start 和 end 所在的位置，只解析需要的记录，结果和 pytdx 的 get_df 一致
+    .day  沪深 <IIIIIfII  日期 开 高 低 收(整数，需要乘系数) 成交额 成交量 保留
+    .day  扩展 <IffffIIf  日期 开 高 低 收 持仓量(港股通为成交额) 成交量 结算价
+    .lc5 .lc1  <HHfffffII 日期 分钟数 开 高 低 收 成交额 成交量 保留
+"""
+import os
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+from pytdx.reader import TdxDailyBarReader
+
+DAILY_DTYPE = np.dtype([
+    ('date', '<u4'), ('open', '<u4'), ('high', '<u4'), ('low', '<u4'), ('close', '<u4'),
+    ('amount', '<f4'), ('volume', '<u4'), ('reserved', '<u4'),
+])
+
+EX_DAILY_DTYPE = np.dtype([
+    ('date', '<u4'), ('open', '<f4'), ('high', '<f4'), ('low', '<f4'), ('close', '<f4'),
+    ('amount', '<u4'), ('volume', '<u4'), ('jiesuan', '<f4'),
+])
+
+MIN_DTYPE = np.dtype([
+    ('date', '<u2'), ('minute', '<u2'), ('open', '<f4'), ('high', '<f4'), ('low', '<f4'), ('close', '<f4'),
+    ('amount', '<f4'), ('volume', '<u4'), ('reserved', '<u4'),
+])
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+# 三种文件的记录都是32字节
+RECORD_SIZE = 32
+
+
+def count_records(file_path):
+    return os.path.getsize(file_path) // RECORD_SIZE
+
+
+def _daily_key(date):
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def _min_key(date):
+    return (date.year - 2004) * 2048 + date.month * 100 + date.day
+
+
+def _read_records(file_path, dtype, key, start=None, end=None, skip=0):
+    """
+    内存映射文件，按日期二分查找 start 到 end 之间的记录，返回复制出来的结构化数组
+    start 和 end 所在的日期只按天定位，精确的时间在生成DataFrame之后过滤
+    skip 跳过前面的记录，用来增量读取新增的数据
+    """
+    count = os.path.getsize(file_path) // dtype.itemsize
+    if count <= skip:
+        return np.empty(0, dtype=dtype)
+
+    records = np.memmap(file_path, dtype=dtype, mode='r', shape=(count,))
+    dates = records['date']
+
+    # bisect 只访问 log(n) 个元素，np.searchsorted 会把整列复制成连续数组
+    lo = bisect_left(dates, key(start), lo=skip) if start is not None else skip
+    hi = bisect_right(dates, key(end), lo=lo) if end is not None else count
+
+    data = np.array(records[lo:hi])
+    del records
+    return data
+
+
+def _to_df(date, columns, start=None, end=None):
+    df = pd.DataFrame(columns, index=pd.DatetimeIndex(date, name='date'))
+    if start is not None:
+        df = df[df.index >= start]
+    if end is not None:
+        df = df[df.index <= end]
+    return df
+
+
+def _parse_daily_date(date):
+    date = date.astype(np.int64)
+    return pd.to_datetime({'year': date // 10000, 'month': date // 100 % 100, 'day': date % 100}).to_numpy(
+        dtype='datetime64[ns]')
+
+
+def read_daily_bars(file_path, start=None, end=None, skip=0):
+    """
+    沪深日线 .day 文件，价格和成交量按证券类型乘系数，和 pytdx TdxDailyBarReader.get_df 一致
+    """
+    start = pd.to_datetime(start) if start else None
+    end = pd.to_datetime(end) if end else None
+
+    reader = TdxDailyBarReader()
+    security_type = reader.get_security_type(file_path)
+    if security_type not in reader.SECURITY_TYPE:
+        raise NotImplementedError('Unknown security type {}'.format(file_path))
+    coefficient = reader.SECURITY_COEFFICIENT[security_type]
+
+    data = _read_records(file_path, DAILY_DTYPE, _daily_key, start, end, skip)
+    columns = {name: data[name] * coefficient[0] for name in PRICE_COLUMNS}
+    columns['amount'] = data['amount'].astype(np.float64)
+    columns['volume'] = data['volume'] * coefficient[1]
+    return _to_df(_parse_daily_date(data['date']), columns, start, end)
+
+
+def read_ex_daily_bars(file_path, start=None, end=None, skip=0):
+    """
+    扩展行情日线 .day 文件，港股通的成交额存放在持仓量字段，和 pytdx TdxExHqDailyBarReader.get_df 一致
+    """
+    start = pd.to_datetime(start) if start else None
+    end = pd.to_datetime(end) if end else None
+
+    data = _read_records(file_path, EX_DAILY_DTYPE, _daily_key, start, end, skip)
+    columns = {name: data[name].astype(np.float64) for name in PRICE_COLUMNS}
+    columns['amount'] = data['amount'].astype(np.int64)
+    columns['volume'] = data['volume'].astype(np.int64)
+    columns['jiesuan'] = data['jiesuan'].astype(np.float64)
+    columns['hk_stock_amount'] = data['amount'].view('<f4').astype(np.float64)
+    return _to_df(_parse_daily_date(data['date']), columns, start, end)
+
+
+def read_min_bars(file_path, start=None, end=None, skip=0):
+    """
+    分钟线 .lc5 .lc1 文件，和 pytdx TdxLCMinBarReader.get_df 一致
+    """
+    start = pd.to_datetime(start) if start else None
+    end = pd.to_datetime(end) if end else None
+
+    data = _read_records(file_path, MIN_DTYPE, _min_key, start, end, skip)
+
+    num = data['date'].astype(np.int64)
+    minute = data['minute'].astype(np.int64)
+    date = pd.to_datetime({
+        'year': num // 2048 + 2004, 'month': num % 2048 // 100, 'day': num % 2048 % 100,
+        'hour': minute // 60, 'minute': minute % 60,
+    }).to_numpy(dtype='datetime64[ns]')
+
+    columns = {name: data[name].astype(np.float64) for name in PRICE_COLUMNS}
+    columns['amount'] = data['amount'].astype(np.float64)
+    columns['volume'] = data['volume'].astype(np.int64)
+    return _to_df(date, columns, start, end)
@@ -26,14 +26,16 @@ from abc import ABCMeta
 import pandas as pd
 import numpy as np
 
+from czsc.Data.bar_store import BarStore
 from czsc.Fetch.tdx import get_bar
 from czsc.Indicator import ema
+from czsc.Utils import ta
 
 
 class Indicator(metaclass=ABCMeta):
     def __init__(self, bars, params, field='close'):
         self.bars = bars
-        self.value = []
+        self.value = BarStore()
         self.field = field
         self.params = params
 
@@ -46,6 +48,24 @@ class Indicator(metaclass=ABCMeta):
     def update(self, bars):
         raise NotImplementedError
 
+    def load(self):
+        """用全部K线一次性计算指标，之后可以继续调用update逐根更新"""
+        raise NotImplementedError
+
+    def _load_start(self):
+        """
+        load 需要完整的K线历史，返回还没有计算指标的第一根K线的位置，
+        位置按完整序列计算，和 update 中的 offset + len 一致
+        """
+        if self.bars.offset > 0:
+            raise ValueError('{}.load needs the full history, {} bars have been trimmed'.format(
+                self.__class__.__name__, self.bars.offset))
+        return self.value.offset + len(self.value)
+
+    def trim(self, count):
+        """和K线一起删除前面 count 根的数据"""
+        self.value.trim(count)
+
 
 class MA(Indicator):
     def __init__(self, bars=None, params=None):
@@ -58,22 +78,30 @@ class MA(Indicator):
 
     def update(self):
         bar = self.bars[-1]
-        length = len(self.bars)
+        length = self.bars.offset + len(self.bars)  # 包括已经删除的K线
         record = {'date': bar['date']}
 
         for n, item_name in zip(self.params, self.item_names):
             if length < n:
                 continue
 
+            data = self.bars.column(self.field)
             if length == n:
-                data = np.array([bar[self.field] for bar in self.bars])
                 record[item_name] = data.mean()
                 continue
 
-            record[item_name] = self.value[-1][item_name] + (bar[self.field] - self.bars[-n - 1][self.field]) / n
+            record[item_name] = self.value[-1][item_name] + (bar[self.field] - data[-n - 1]) / n
 
         self.value.append(record)
 
+    def load(self):
+        start = self._load_start()
+        close = self.bars.column(self.field).astype(np.float64)
+        record = {'date': self.bars.column('date')[start:]}
+        for n, item_name in zip(self.params, self.item_names):
+            record[item_name] = ta.MA(close, n)[start:]
+        self.value.extend(record)
+
 
 class EMA(Indicator):
     def __init__(self, bars=None, params=None):
@@ -89,9 +117,19 @@ class EMA(Indicator):
 
         self.ema_func = ema_func
 
+    def __getstate__(self):
+        # ema函数是闭包，不能pickle，恢复时重新生成
+        state = self.__dict__.copy()
+        state.pop('ema_func')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ema_func = {'ema' + str(n): ema(n) for n in self.params}
+
     def update(self):
         bar = self.bars[-1]
-        length = len(self.bars)
+        length = self.bars.offset + len(self.bars)  # 包括已经删除的K线
         record = {'date': bar['date']}
 
         for item_name in self.ema_func:
@@ -104,9 +142,17 @@ class EMA(Indicator):
 
         self.value.append(record)
 
+    def load(self):
+        start = self._load_start()
+        close = self.bars.column(self.field).astype(np.float64)
+        record = {'date': self.bars.column('date')[start:]}
+        for n in self.params:
+            record['ema' + str(n)] = ta.EMA(close, n)[start:]
+        self.value.extend(record)
+
 
 class BOLL(Indicator):
-    def __init__(self, bars=None, params=None):
+    def __init__(self, bars=None, params=None, anchor_period=1000):
         if params is None:
             params = [20, 2]
 
@@ -117,11 +163,30 @@ class BOLL(Indicator):
 
         self.ma = MA(bars=self.bars, params=[self.N])
 
+        # 滚动计算标准差，窗口内 close - anchor 的和与平方和
+        # 每 anchor_period 根K线用窗口数据重新计算一次，避免累计误差
+        self.anchor_period = anchor_period
+        self.anchor = 0.0
+        self.sum = 0.0
+        self.sum2 = 0.0
+        self.count = 0
+
+    def reanchor(self, close):
+        self.anchor = close.mean()
+        delta = close - self.anchor
+        self.sum = delta.sum()
+        self.sum2 = (delta * delta).sum()
+        self.count = 0
+
+    def std(self):
+        var = (self.sum2 - self.sum * self.sum / self.N) / (self.N - 1)  # 使用估算标准差，ddof 自由度，分母为N-1
+        return np.sqrt(var) if var > 0 else 0.0
+
     def update(self):
         self.ma.update()
 
         bar = self.bars[-1]
-        length = len(self.bars)
+        length = self.bars.offset + len(self.bars)  # 包括已经删除的K线
         record = {'date': bar['date']}
 
         if length < self.N:
@@ -130,13 +195,40 @@ class BOLL(Indicator):
 
         date, record['boll'] = self.ma[-1].values()
 
-        close = np.array([bar['close'] for bar in self.bars[-self.N:]])
+        close = self.bars.column('close')
+
+        if length == self.N or self.count >= self.anchor_period:
+            self.reanchor(close[-self.N:])
+        else:
+            new = close[-1] - self.anchor
+            old = close[-self.N - 1] - self.anchor
+            self.sum = self.sum + new - old
+            self.sum2 = self.sum2 + new * new - old * old
+            self.count = self.count + 1
 
-        record['UB'] = record['boll'] + self.P * close.std(ddof=1)  # 使用估算标准差，ddof 自由度，分母为N-1
-        record['LB'] = record['boll'] - self.P * close.std(ddof=1)
+        std = self.std()
+        record['UB'] = record['boll'] + self.P * std
+        record['LB'] = record['boll'] - self.P * std
 
         self.value.append(record)
 
+    def load(self):
+        self.ma.load()
+
+        start = self._load_start()
+        close = self.bars.column('close').astype(np.float64)
+        boll, ub, lb = ta.BOLL(close, self.N, self.P)
+        self.value.extend({'date': self.bars.column('date')[start:], 'boll': boll[start:],
+                           'UB': ub[start:], 'LB': lb[start:]})
+
+        # 后续逐根更新时需要的滚动状态
+        if len(close) >= self.N:
+            self.reanchor(close[-self.N:])
+
+    def trim(self, count):
+        super().trim(count)
+        self.ma.trim(count)
+
 
 class MACD(Indicator):
     def __init__(self, bars=None, params=None):
@@ -146,7 +238,13 @@ class MACD(Indicator):
         super().__init__(bars=bars, params=params)
 
         self.ema = EMA(bars=self.bars, params=self.params[:2])
-        self.dea_func = ema(self.params[2])
+        # trim 删除后仍然需要的位置 -> dif和面积
+        self.pinned = {}
+
+    def __setstate__(self, state):
+        # 兼容保存了 dea_func 的旧版本
+        state.pop('dea_func', None)
+        self.__dict__.update(state)
 
     def update(self):
         """
@@ -164,22 +262,80 @@ class MACD(Indicator):
         dif = short - long
         record = {'date': date, 'dif': dif}
 
+        if self.value.offset + len(self.value) < 1:
+            dea, up_area, down_area = np.nan, 0.0, 0.0
+        else:
+            last = self.value[-1]
+            dea, up_area, down_area = last['dea'], last['up_area'], last['down_area']
+
+        # 红柱和绿柱面积的前缀和，用来O(1)计算任意区间的面积
+        record['dea'], record['macd'], record['up_area'], record['down_area'] = ta.MACD_STEP(
+            dif, dea, up_area, down_area, self.params[2])
+
         self.value.append(record)
 
-        length = len(self.value)
+    def load(self):
+        self.ema.load()
 
-        if length < 2:
-            record['dea'] = dif
+        start = self._load_start()
+        short = self.ema.value.column('ema' + str(self.params[0]))
+        long = self.ema.value.column('ema' + str(self.params[1]))
+        dif = short - long
+        dea, macd, up_area, down_area = ta.MACD_AREA(dif, self.params[2])
+
+        self.value.extend({
+            'date': self.ema.value.column('date')[start:],
+            'dif': dif[start:],
+            'dea': dea[start:],
+            'macd': macd[start:],
+            'up_area': up_area[start:],
+            'down_area': down_area[start:],
+        })
+
+    def trim(self, count, pinned=()):
+        """
+        pinned 为删除之后仍然要计算面积的位置，保存这些位置和前一个位置的 dif 和面积前缀和
+        """
+        offset = self.value.offset
+        rows = {}
+        for index in pinned:
+            for row in [index - 1, index]:
+                if 0 <= row < offset + count:
+                    rows[row] = self.pinned[row] if row < offset else {
+                        name: self.value.columns[name][row - offset] for name in ['dif', 'up_area', 'down_area']
+                    }
+        self.pinned = rows
+
+        super().trim(count)
+        self.ema.trim(count)
+
+    def value_at(self, index, name):
+        """完整序列中 index 位置的值，已经删除的位置从 pinned 中读取"""
+        if index < self.value.offset:
+            return self.pinned[index][name]
+        return self.value.column(name)[index - self.value.offset]
+
+    def area(self, start, end, direction):
+        """
+        start到end（包含end）之间的MACD面积，direction > 0 为红柱面积，< 0 为绿柱面积
+        start和end为完整序列中的位置
+        """
+        if direction > 0:
+            name = 'up_area'
+        elif direction < 0:
+            name = 'down_area'
         else:
-            record['dea'] = self.dea_func(record['dif'], self.value[-2]['dea'])
+            return 0
 
-        record['macd'] = (record['dif'] - record['dea']) * 2
+        if start > 0:
+            return self.value_at(end, name) - self.value_at(start - 1, name)
+        return self.value_at(end, name)
 
 
 class IndicatorSet:
     def __init__(self, bars=None):
         if bars is None:
-            self.bars = []
+            self.bars = BarStore()
         else:
             self.bars = bars
         # self.ma = MA(self.bars)
@@ -187,6 +343,25 @@ class IndicatorSet:
         self.boll = BOLL(self.bars)
         self.macd = MACD(self.bars)
 
+    @classmethod
+    def from_arrays(cls, data):
+        """
+        用全部历史数据一次性计算指标，返回的 IndicatorSet 可以继续用 on_bar 逐根更新
+        :param data: pd.DataFrame 或者 字段名 -> 数组 的dict，至少包含 date 和 close
+        """
+        indicators = cls()
+        indicators.bulk_load(data)
+        return indicators
+
+    def bulk_load(self, data):
+        if isinstance(data, pd.DataFrame):
+            data = {name: data[name].to_numpy() for name in data.columns}
+        self.bars.extend(data)
+        # self.ma.load()
+        # self.ema.load()
+        self.boll.load()
+        self.macd.load()
+
     def on_bar(self, bar):
         bar = bar.to_dict()
         self.bars.append(bar)
@@ -198,6 +373,12 @@ class IndicatorSet:
         self.boll.update()
         self.macd.update()
 
+    def trim(self, count, pinned=()):
+        """删除前面 count 根K线和对应的指标，pinned 为之后仍然要计算MACD面积的位置"""
+        self.bars.trim(count)
+        self.boll.trim(count)
+        self.macd.trim(count, pinned=pinned)
+
 
 if __name__ == '__main__':
     indicators = IndicatorSet()
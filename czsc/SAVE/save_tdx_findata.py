@@ -23,9 +23,12 @@
 # SOFTWARE.
 import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
-import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from pytdx.reader.history_financial_reader import HistoryFinancialReader
 
@@ -39,9 +42,55 @@ QA_DATABASE = CLIENT.quantaxis
 _CW_DIR = '{}{}{}'.format(TDX_DIR, os.sep, 'vipdoc\\cw')
 
 
-def save_financial_files():
+def _parse_financial_file(filename):
+    """
+    解析一个gpcw财务数据文件，返回需要保存的记录，在子进程中运行
+    """
+    df = HistoryFinancialReader().get_df(filename)
+
+    # 修改columns的名称
+    columns = df.columns.to_list()
+    col = {}
+
+    for name in columns[1:]:
+        col[name] = '00{}'.format(name[3:])[-3:]
+
+    df.rename(columns=col, inplace=True)
+
+    return util_to_json_from_pandas(
+        df.reset_index().drop_duplicates(subset=['code', 'report_date']).sort_index()
+    )
+
+
+def _bulk_upsert(coll, data, chunk_size=1000):
+    """
+    按 chunk_size 分批 bulk_write，不按顺序执行，返回 新增、匹配、修改 的条数
+    """
+    upserted, matched, modified = 0, 0, 0
+    for i in range(0, len(data), chunk_size):
+        requests = [
+            UpdateOne({'code': d['code'], 'report_date': d['report_date']}, {'$set': d}, upsert=True)
+            for d in data[i:i + chunk_size]
+        ]
+        try:
+            result = coll.bulk_write(requests, ordered=False)
+            upserted = upserted + result.upserted_count
+            matched = matched + result.matched_count
+            modified = modified + result.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            upserted = upserted + details.get('nUpserted', 0)
+            matched = matched + details.get('nMatched', 0)
+            modified = modified + details.get('nModified', 0)
+            util_log_info('写入错误的条数 {}'.format(len(details.get('writeErrors', []))))
+    return upserted, matched, modified
+
+
+def save_financial_files(chunk_size=1000, processes=None):
     """
     将tdx目录下的gpcw财务数据存储到mongo数据库
+    :param chunk_size: 每次 bulk_write 的记录数
+    :param processes: 解析文件的进程数，None为cpu核数
     """
     coll = QA_DATABASE.financial
     coll.create_index(
@@ -62,42 +111,46 @@ def save_financial_files():
     df = df[df['last_modified'] > last_modified]
     df.sort_values(by='last_modified', ascending=[False]).head()
 
+    files = []
     for filename in df['filename'].to_list():
         try:
             date = int(re.match(pattern, filename).groupdict()['date'])
         except:
             continue
-
-        util_log_info('NOW SAVING {}'.format(date))
-        util_log_info('在数据库中的条数 {}'.format(coll.count_documents({'report_date': date})))
-        try:
-            filename = os.path.join(_CW_DIR, filename)
-            df = HistoryFinancialReader().get_df(filename)
-
-            # 修改columns的名称
-            columns = df.columns.to_list()
-            col = {}
-
-            for name in columns[1:]:
-                col[name] = '00{}'.format(name[3:])[-3:]
-
-            df.rename(columns=col, inplace=True)
-
-            data = util_to_json_from_pandas(
-                df.reset_index().drop_duplicates(subset=['code', 'report_date']).sort_index()
-            )
-            util_log_info('即将更新的条数 {}'.format(len(data)))
+        files.append((date, os.path.join(_CW_DIR, filename)))
+
+    # 多进程解析文件，主进程按文件顺序写入数据库
+    # 同时最多解析 processes*2 个文件，写入之后释放结果，内存不随文件数量增长
+    window = (processes or os.cpu_count() or 1) * 2
+    files = iter(files)
+    futures = deque()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        def submit():
+            item = next(files, None)
+            if item is not None:
+                futures.append((item[0], executor.submit(_parse_financial_file, item[1])))
+
+        for _ in range(window):
+            submit()
+
+        while futures:
+            date, future = futures.popleft()
+            submit()
+
+            util_log_info('NOW SAVING {}'.format(date))
+            util_log_info('在数据库中的条数 {}'.format(coll.count_documents({'report_date': date})))
             try:
-                for d in data:
-                    coll.update_one({'code': d['code'], 'report_date': d['report_date']}, {'$set': d}, upsert=True)
-
+                data = future.result()
             except Exception as e:
-                if isinstance(e, MemoryError):
-                    coll.insert_many(data, ordered=True)
-                elif isinstance(e, pymongo.bulk.BulkWriteError):
-                    pass
-        except Exception as e:
-            util_log_info('似乎没有数据')
+                util_log_info('似乎没有数据')
+                continue
+            finally:
+                future = None
+
+            util_log_info('即将更新的条数 {}'.format(len(data)))
+            upserted, matched, modified = _bulk_upsert(coll, data, chunk_size)
+            util_log_info('新增 {} 条，匹配 {} 条，修改 {} 条'.format(upserted, matched, modified))
+            data = None
 
     util_log_info('SUCCESSFULLY SAVE/UPDATE FINANCIAL DATA')
 
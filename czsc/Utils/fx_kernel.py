@@ -0,0 +1,380 @@
+# coding: utf-8
+"""
+分型和笔识别的编译版本，用于一次性回补全部历史数据
+
+逻辑和 czsc.CzscBase 中的 update_fx、update_bi 逐根处理一致，在 numba 中按数组计算：
+    包含关系处理后的K线 new_bars
+    分型序列 fx_list
+    第一级的笔端点 bi_list
+实时行情仍然使用 update_fx、update_bi 逐根更新，线段和中枢依赖每根K线时笔的状态，不在这里计算，
+需要时返回笔的更新记录，由 CzscBase.bulk_load 按记录逐级回放
+
+分型和笔端点放在同一个点池中，fx_list 和 bi_list 存放点池的序号，
+和Python版本一样，没有copy的笔端点和分型是同一个对象，修改会同时生效
+笔端点的 fx_mark 按 update_xd_eigenvalue 的规则更新为K线根数，不计算 dif 和 macd
+"""
+import numpy as np
+import numba
+import pandas as pd
+
+from czsc.Data.bar_store import BarStore
+from czsc.objects import Point
+from czsc.Utils.trade_date import util_get_trade_ordinal
+
+# 点池的字段
+_DATE, _MARK, _START, _END, _DIRECTION = range(5)
+# 字段不存在，对应Point中的None
+_NONE = np.iinfo(np.int64).min
+
+
+@numba.njit()
+def _new_point(points, values, size, date, mark, value, start, end, direction):
+    points[size, _DATE] = date
+    points[size, _MARK] = mark
+    points[size, _START] = start
+    points[size, _END] = end
+    points[size, _DIRECTION] = direction
+    values[size] = value
+    return size + 1
+
+
+@numba.njit()
+def _copy_point(points, values, size, p):
+    points[size] = points[p]
+    values[size] = values[p]
+    return size + 1
+
+
+@numba.njit()
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+
+@numba.njit()
+def _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i):
+    """update_xd_eigenvalue 中对 fx_mark 的更新，同时记录第 i 根K线时笔的更新"""
+    xd = bi_list[bi_size - 1]
+    last_xd = bi_list[bi_size - 2]
+    kn = position[date_code[points[xd, _DATE]]] - position[date_code[points[last_xd, _DATE]]] + 1
+    if points[xd, _MARK] != _NONE:
+        mark = points[xd, _MARK]
+    elif points[xd, _DIRECTION] != _NONE:
+        mark = points[xd, _DIRECTION]
+    else:
+        mark = 0
+    points[xd, _MARK] = kn * _sign(mark)
+
+    events[event_size, 0] = i
+    events[event_size, 1] = bi_size
+    events[event_size, 2] = xd
+    return event_size + 1
+
+
+@numba.njit()
+def fx_bi_kernel(high, low, ordinal, date_code):
+    """
+    :param high: np.array 最高价
+    :param low: np.array 最低价
+    :param ordinal: np.array 交易时段序号
+    :param date_code: np.array 日期编号，日期相同的K线编号相同
+    :return: new_bars的 (数据来源K线, 日期来源K线, high, low, direction)，
+        点池的 (整数字段, value)，fx_list 和 bi_list 对应的点池序号，
+        加入 trade_date 的K线位置，笔的更新记录 (K线位置, 笔的数量, 最后一笔的点池序号)
+    """
+    n = len(high)
+
+    # 包含处理后的K线，作为栈使用
+    nb_source = np.empty(n, dtype=np.int64)
+    nb_date = np.empty(n, dtype=np.int64)
+    nb_high = np.empty(n, dtype=np.float64)
+    nb_low = np.empty(n, dtype=np.float64)
+    nb_direction = np.zeros(n, dtype=np.int64)
+    nb_size = 0
+
+    # 每根K线最多新增4个点：分型、笔端点的copy、K线端点、第一笔的起点
+    points = np.empty((4 * n + 4, 5), dtype=np.int64)
+    values = np.empty(4 * n + 4, dtype=np.float64)
+    size = 0
+
+    fx_list = np.empty(n, dtype=np.int64)
+    fx_size = 0
+    bi_list = np.empty(4 * n + 4, dtype=np.int64)
+    bi_size = 0
+
+    # 每根K线最多更新一次笔
+    trade = np.empty(n, dtype=np.int64)
+    events = np.empty((n, 3), dtype=np.int64)
+    event_size = 0
+
+    # 日期在 trade_date 中第一次出现的位置，对应 trade_date.index
+    position = np.full(n, -1, dtype=np.int64)
+    trade_size = 0
+    last_ordinal = 0
+    bar_count = 0
+
+    for i in range(n):
+        bar_count += 1
+
+        # ---------------- update_fx ----------------
+        skip = trade_size > 1 and ordinal[i] < last_ordinal
+        if not skip:
+            if position[date_code[i]] < 0:
+                position[date_code[i]] = trade_size
+            trade[trade_size] = i
+            trade_size += 1
+            last_ordinal = ordinal[i]
+
+            if bar_count < 2:
+                nb_source[0] = i
+                nb_date[0] = i
+                nb_high[0] = high[i]
+                nb_low[0] = low[i]
+                nb_size = 1
+            else:
+                last = nb_size - 1
+                cur_h, cur_l = high[i], low[i]
+                last_h, last_l = nb_high[last], nb_low[last]
+                direction = 1 if cur_h > last_h else -1
+
+                if bar_count < 3:
+                    nb_source[nb_size] = i
+                    nb_date[nb_size] = i
+                    nb_high[nb_size] = cur_h
+                    nb_low[nb_size] = cur_l
+                    nb_direction[nb_size] = direction
+                    nb_size += 1
+                else:
+                    last_direction = nb_direction[last]
+                    if (cur_h > last_h and cur_l > last_l) or (cur_h < last_h and cur_l < last_l):
+                        nb_source[nb_size] = i
+                        nb_date[nb_size] = i
+                        nb_high[nb_size] = cur_h
+                        nb_low[nb_size] = cur_l
+                        if last_direction * direction < 0:
+                            nb_direction[nb_size] = direction
+                            nb_size += 1
+                            if direction < 0:
+                                size = _new_point(points, values, size, nb_date[last], 1, last_h,
+                                                  nb_date[nb_size - 3], i, _NONE)
+                            else:
+                                size = _new_point(points, values, size, nb_date[last], -1, last_l,
+                                                  nb_date[nb_size - 3], i, _NONE)
+                            fx_list[fx_size] = size - 1
+                            fx_size += 1
+                        else:
+                            nb_direction[nb_size] = last_direction + _sign(last_direction)
+                            nb_size += 1
+                    else:
+                        # 有包含关系，替换最后一根K线
+                        date = i
+                        if last_direction > 0:
+                            if cur_h < last_h:
+                                cur_h = last_h
+                                date = nb_date[last]
+                            if cur_l < last_l:
+                                cur_l = last_l
+                        elif last_direction < 0:
+                            if cur_l > last_l:
+                                cur_l = last_l
+                                date = nb_date[last]
+                            if cur_h > last_h:
+                                cur_h = last_h
+                        nb_source[last] = i
+                        nb_date[last] = date
+                        nb_high[last] = cur_h
+                        nb_low[last] = cur_l
+                        nb_direction[last] = last_direction + _sign(last_direction)
+
+        # ---------------- update_bi ----------------
+        top = nb_size - 1
+        if ordinal[nb_date[top]] < last_ordinal:
+            continue
+
+        if fx_size < 2:
+            continue
+
+        bi = size
+        size = _copy_point(points, values, size, fx_list[fx_size - 1])
+
+        if bi_size < 1:
+            bi_list[0] = size
+            size = _copy_point(points, values, size, fx_list[fx_size - 2])
+            bi_list[1] = bi
+            bi_size = 2
+            event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+            continue
+
+        last_bi = bi_list[bi_size - 1]
+        last_mark = points[last_bi, _MARK]
+        bar_direction = nb_direction[top]
+        bar_value = nb_high[top] if bar_direction > 0 else nb_low[top]
+        bar_date = nb_date[top]
+        bar_position = position[date_code[bar_date]]
+
+        # K线确认模式
+        if bar_position > position[date_code[points[bi, _END]]]:
+            if points[last_bi, _DIRECTION] == _NONE:
+                if (last_mark > 0 and nb_high[top] > values[last_bi]) \
+                        or (last_mark < 0 and nb_low[top] < values[last_bi]):
+                    size = _new_point(points, values, size, bar_date, _NONE, bar_value, _NONE, _NONE, bar_direction)
+                    bi_list[bi_size - 1] = size - 1
+                    event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code,
+                                                    events, event_size, i)
+                    continue
+
+                kn_inside = bar_position - position[date_code[points[last_bi, _END]]] - 1
+                if kn_inside > 1 and bar_direction * last_mark < 0:
+                    # 寻找同向的第一根分型，没有copy
+                    index = fx_size - 1
+                    while ordinal[points[bi, _DATE]] > ordinal[points[last_bi, _DATE]]:
+                        if bar_direction * points[bi, _MARK] > 0:
+                            break
+                        index = index - 1
+                        if index < 0:
+                            break
+                        bi = fx_list[index]
+
+                    if (bar_direction * points[bi, _MARK] > 0) \
+                            and (_sign(bar_direction) * bar_value < points[bi, _MARK] * values[bi]):
+                        points[bi, _END] = bar_date
+                        bi_list[bi_size] = bi
+                    else:
+                        size = _new_point(points, values, size, bar_date, _NONE, bar_value, _NONE, _NONE,
+                                          bar_direction)
+                        bi_list[bi_size] = size - 1
+                    bi_size += 1
+                    event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code,
+                                                    events, event_size, i)
+                    continue
+
+                if bi_size < 2:
+                    continue
+
+                # 价格确认
+                if (last_mark < 0 and nb_high[top] > values[bi_list[bi_size - 2]]) \
+                        or (last_mark > 0 and nb_low[top] < values[bi_list[bi_size - 2]]):
+                    size = _new_point(points, values, size, bar_date, _NONE, bar_value, _NONE, _NONE, bar_direction)
+                    bi_list[bi_size] = size - 1
+                    bi_size += 1
+                    event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code,
+                                                    events, event_size, i)
+            else:
+                # 原有未出现分型笔的延续
+                size = _new_point(points, values, size, bar_date, _NONE, bar_value, _NONE, _NONE, bar_direction)
+                bi_list[bi_size - 1] = size - 1
+                event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+            continue
+
+        # 非分型结尾笔，直接替换成分型
+        if points[last_bi, _DIRECTION] != _NONE \
+                or date_code[points[bi, _DATE]] == date_code[points[last_bi, _DATE]]:
+            bi_list[bi_size - 1] = bi
+            event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+            continue
+
+        bi_mark = points[bi, _MARK]
+        if last_mark * bi_mark > 0:
+            if _sign(last_mark) * values[last_bi] < bi_mark * values[bi]:
+                bi_list[bi_size - 1] = bi
+                event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+                continue
+        else:
+            kn_inside = position[date_code[points[bi, _START]]] - position[date_code[points[last_bi, _END]]] - 1
+            if kn_inside > 0:
+                # 两个分型间的同向极值点，比较的是当前的端点，找到后copy
+                best = bi
+                index = fx_size - 2
+                while index >= 0 and ordinal[points[fx_list[index], _DATE]] > ordinal[points[last_bi, _DATE]]:
+                    fx = fx_list[index]
+                    if (points[best, _MARK] * points[fx, _MARK] > 0) \
+                            and (points[best, _MARK] * values[best] < points[fx, _MARK] * values[fx]):
+                        best = fx
+                    index = index - 1
+                if best != bi:
+                    bi = size
+                    size = _copy_point(points, values, size, best)
+                    points[bi, _END] = points[fx_list[fx_size - 1], _END]
+
+                bi_list[bi_size] = bi
+                bi_size += 1
+                event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+                continue
+
+            if bi_size < 2:
+                continue
+
+            # 价格确认
+            if (bi_mark > 0 and values[bi] > values[bi_list[bi_size - 2]]) \
+                    or (bi_mark < 0 and values[bi] < values[bi_list[bi_size - 2]]):
+                bi_list[bi_size] = bi
+                bi_size += 1
+                event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+                continue
+
+        # fx_end处理，K线的方向要和上一笔一致
+        if bar_direction * last_mark < 0:
+            continue
+        if last_mark * bar_value > last_mark * values[last_bi]:
+            size = _new_point(points, values, size, bar_date, _NONE, bar_value, _NONE, _NONE, bar_direction)
+            bi_list[bi_size - 1] = size - 1
+            event_size = _update_eigenvalue(points, bi_list, bi_size, position, date_code, events, event_size, i)
+
+    return (nb_source[:nb_size], nb_date[:nb_size], nb_high[:nb_size], nb_low[:nb_size], nb_direction[:nb_size],
+            points[:size], values[:size], fx_list[:fx_size], bi_list[:bi_size],
+            trade[:trade_size], events[:event_size])
+
+
+def _to_point(points, values, p, date, ordinal):
+    point = Point(date=date[points[p, _DATE]], ordinal=ordinal[points[p, _DATE]], value=values[p])
+    if points[p, _MARK] != _NONE:
+        point['fx_mark'] = points[p, _MARK]
+    if points[p, _START] != _NONE:
+        point['fx_start'] = date[points[p, _START]]
+    if points[p, _END] != _NONE:
+        point['fx_end'] = date[points[p, _END]]
+    if points[p, _DIRECTION] != _NONE:
+        point['direction'] = points[p, _DIRECTION]
+    return point
+
+
+def calculate_fx_bi(data, history=False):
+    """
+    用全部历史K线一次计算分型和笔，结果和逐根调用 update_fx、update_bi 一致
+    :param data: pd.DataFrame 或者 BarStore，至少包含 date high low
+    :param history: 为 True 时再返回加入 trade_date 的K线位置，以及笔的更新记录
+        [(K线位置, 笔的数量, 最后一笔)]，第一条记录是最开始的两个分型组成第一笔
+    :return: (new_bars, fx_list, bi_list)，new_bars 为 BarStore，fx_list 和 bi_list 为 Point 列表，
+        和Python版本一样，笔端点可能和分型是同一个对象
+    """
+    if isinstance(data, BarStore):
+        data = data.to_df()
+
+    date = pd.DatetimeIndex(data['date']).as_unit('ns')
+    ordinal = data['date'].map(util_get_trade_ordinal).to_numpy(dtype=np.int64)
+    date_code = pd.factorize(date.asi8)[0].astype(np.int64)
+
+    (nb_source, nb_date, nb_high, nb_low, nb_direction,
+     points, values, fx_index, bi_index, trade, events) = fx_bi_kernel(
+        data['high'].to_numpy(dtype=np.float64), data['low'].to_numpy(dtype=np.float64), ordinal, date_code
+    )
+
+    new_bars = BarStore()
+    columns = {name: data[name].to_numpy()[nb_source] for name in data.columns}
+    columns.update(date=date.to_numpy()[nb_date], high=nb_high, low=nb_low)
+    columns['ordinal'] = ordinal[nb_date]
+    columns['direction'] = nb_direction
+    new_bars.extend(columns)
+
+    # 同一个点只生成一个Point对象
+    date = list(date)
+    cache = {}
+    for p in np.concatenate([fx_index, bi_index, events[:, 2]]):
+        if p not in cache:
+            cache[p] = _to_point(points, values, p, date, ordinal)
+    fx_list = [cache[p] for p in fx_index]
+    bi_list = [cache[p] for p in bi_index]
+    if not history:
+        return new_bars, fx_list, bi_list
+
+    updates = [(i, size, cache[p]) for i, size, p in events.tolist()]
+    return new_bars, fx_list, bi_list, trade, updates
@@ -1,55 +1,51 @@
 # coding: utf-8
 import warnings
-from datetime import datetime, timedelta
+from datetime import datetime
 
-def get_next_end_time(dt: datetime, m=1):
+from czsc.Data.ring_buffer import RingBuffer
+from czsc.Utils.sessions import get_session
+
+
+def get_next_end_time(dt: datetime, m=1, exchange='sse'):
     """获取 dt 对应的分钟周期结束时间
 
     :param dt: datetime
     :param m: int
         分钟周期，1 表示 1分钟，5 表示 5分钟 ...
+    :param exchange: str
+        交易所，见 czsc.Utils.sessions
     :return: datetime
     """
-    am_st = "09:30"
-    am_et = "11:30"
-    pm_st = "13:00"
-    pm_et = "15:00"
-
-    if dt.strftime("%H:%M") == am_et or dt.strftime("%H:%M") == pm_et:
-        return dt.replace(second=0)
-
-    delta = timedelta(minutes=1)
-    for _ in range(1000):
-        dt = dt + delta
-        if dt.minute % m == 0:
-            h = dt.strftime("%H:%M")
-            if am_et >= h > am_st or pm_et >= h > pm_st:
-                return dt.replace(second=0)
-    return dt.replace(second=0)
+    return get_session(exchange).bar_end(dt, m)
+
 
 class KlineGeneratorBase:
     """K线生成器，仿实盘"""
 
-    def __init__(self, max_count=5000, freqs=None):
+    def __init__(self, max_count=5000, freqs=None, exchange='sse'):
         """
 
         :param max_count: int
-            最大K线数量
+            最大K线数量，每个级别的K线保存在容量为 max_count 的环形缓冲区中
         :param freqs: list of str
             级别列表，默认值为 ['周线', '日线', '60分钟', '30分钟', '15分钟', '5分钟', '1分钟']
+        :param exchange: str
+            交易所，决定分钟K线的结束时间和夜盘所属的交易日，见 czsc.Utils.sessions
         """
         self.max_count = max_count
+        self.session = get_session(exchange)
         if freqs is None:
             self.freqs = ['周线', '日线', '60分钟', '30分钟', '15分钟', '5分钟', '1分钟']
         else:
             self.freqs = freqs
-        self.m1 = []
-        self.m5 = []
-        self.m15 = []
-        self.m30 = []
-        self.m60 = []
-        self.D = []
-        self.W = []
+        self.minutes = {m for m in (1, 5, 15, 30, 60) if "{}分钟".format(m) in self.freqs}
+        self.m1 = RingBuffer(max_count)
+        self.m5 = RingBuffer(max_count)
+        self.m15 = RingBuffer(max_count)
+        self.m30 = RingBuffer(max_count)
+        self.m60 = RingBuffer(max_count)
+        self.D = RingBuffer(max_count)
+        self.W = RingBuffer(max_count)
         self.end_dt = None
         self.symbol = None
 
@@ -114,15 +110,17 @@ class KlineGeneratorBase:
 class KlineGeneratorByTick(KlineGeneratorBase):
     """K线生成器，仿实盘，从tick开始生成"""
 
-    def __init__(self, max_count=5000, freqs=None):
+    def __init__(self, max_count=5000, freqs=None, exchange='sse'):
         """
 
         :param max_count: int
             最大K线数量
         :param freqs: list of str
             级别列表，默认值为 ['周线', '日线', '60分钟', '30分钟', '15分钟', '5分钟', '1分钟']
+        :param exchange: str
+            交易所，见 czsc.Utils.sessions
         """
-        super().__init__(max_count, freqs)
+        super().__init__(max_count, freqs, exchange)
 
     def __repr__(self):
         return "<KlineGeneratorByTick for {}; latest_dt={}>".format(self.symbol, self.end_dt)
@@ -159,21 +157,18 @@ class KlineGeneratorByTick(KlineGeneratorBase):
         }
 
     def __update_minutes(self, tick=None, minutes=(1, 5, 15, 30, 60)):
-        # 更新分钟线
+        # 更新分钟线，各个周期的结束时间一次查表得到
         fm_map = {1: self.m1, 5: self.m5, 15: self.m15, 30: self.m30, 60: self.m60}
+        minutes = [minute for minute in minutes if minute in self.minutes]
 
-        for minute in minutes:
-            if "{}分钟".format(minute) not in self.freqs:
-                continue
-
+        for minute, next_end_dt in zip(minutes, self.session.bar_ends(tick['dt'], minutes)):
             m = fm_map[minute]
             if not m:
                 next_bar = self.__init_bar_from_tick(tick)
-                next_bar['dt'] = get_next_end_time(tick['dt'], m=minute)
+                next_bar['dt'] = next_end_dt
                 m.append(next_bar)
             else:
                 last = m[-1]
-                next_end_dt = get_next_end_time(tick['dt'], m=minute)
                 if next_end_dt > last['dt'] and next_end_dt.minute != last['dt'].minute:
                     next_bar = self.__init_bar_from_tick(tick)
                     next_bar['dt'] = next_end_dt
@@ -182,7 +177,6 @@ class KlineGeneratorByTick(KlineGeneratorBase):
                     next_bar = self.__update_from_tick(last, tick)
                     next_bar['dt'] = next_end_dt
                     m[-1] = next_bar
-            fm_map[minute] = m[-self.max_count:]
 
     def __update_d(self, tick=None):
         if "日线" not in self.freqs:
@@ -192,11 +186,10 @@ class KlineGeneratorByTick(KlineGeneratorBase):
             self.D.append(self.__init_bar_from_tick(tick))
         else:
             last = self.D[-1]
-            if last['dt'].date() != tick['dt'].date():
+            if self.session.trade_date(last['dt']) != self.session.trade_date(tick['dt']):
                 self.D.append(self.__init_bar_from_tick(tick))
             else:
                 self.D[-1] = self.__update_from_tick(last, tick)
-        self.D = self.D[-self.max_count:]
 
     def __update_w(self, tick=None):
         if "周线" not in self.freqs:
@@ -210,7 +203,6 @@ class KlineGeneratorByTick(KlineGeneratorBase):
                 self.W.append(self.__init_bar_from_tick(tick))
             else:
                 self.W[-1] = self.__update_from_tick(last, tick)
-        self.W = self.W[-self.max_count:]
 
     def update(self, tick=None):
         """输入1分钟最新K线 或 tick，更新其他级别K线
@@ -238,15 +230,17 @@ class KlineGeneratorByTick(KlineGeneratorBase):
 class KlineGeneratorBy1Min(KlineGeneratorBase):
     """K线生成器，仿实盘，从1分钟开始生成"""
 
-    def __init__(self, max_count=5000, freqs=None):
+    def __init__(self, max_count=5000, freqs=None, exchange='sse'):
         """
 
         :param max_count: int
             最大K线数量
         :param freqs: list of str
             级别列表，默认值为 ['周线', '日线', '60分钟', '30分钟', '15分钟', '5分钟', '1分钟']
+        :param exchange: str
+            交易所，见 czsc.Utils.sessions
         """
-        super().__init__(max_count, freqs)
+        super().__init__(max_count, freqs, exchange)
 
     def __repr__(self):
         return "<KlineGeneratorBy1Min for {}; latest_dt={}>".format(self.symbol, self.end_dt)
@@ -278,8 +272,6 @@ class KlineGeneratorBy1Min(KlineGeneratorBase):
             else:
                 raise ValueError("1分钟新K线的时间必须大于等于最后一根K线的时间")
 
-        self.m1 = self.m1[-self.max_count:]
-
     def __update_minutes(self, k=None, minutes=(5, 15, 30, 60)):
         # 更新分钟线
         fm_map = {5: self.m5, 15: self.m15, 30: self.m30, 60: self.m60}
@@ -298,7 +290,6 @@ class KlineGeneratorBy1Min(KlineGeneratorBase):
                 else:
                     next_bar = self.__update_from_1min(last, k)
                     m[-1] = next_bar
-            fm_map[minute] = m[-self.max_count:]
 
     def __update_d(self, k=None):
         if "日线" not in self.freqs:
@@ -307,13 +298,11 @@ class KlineGeneratorBy1Min(KlineGeneratorBase):
         if not self.D:
             self.D.append(k)
         last = self.D[-1]
-        if k['dt'].date() != last['dt'].date():
+        if self.session.trade_date(k['dt']) != self.session.trade_date(last['dt']):
             self.D.append(k)
         else:
             self.D[-1] = self.__update_from_1min(last, k)
 
-        self.D = self.D[-self.max_count:]
-
     def __update_w(self, k=None):
         if "周线" not in self.freqs:
             return
@@ -325,8 +314,6 @@ class KlineGeneratorBy1Min(KlineGeneratorBase):
         else:
             self.W[-1] = self.__update_from_1min(last, k)
 
-        self.W = self.W[-self.max_count:]
-
     def update(self, k=None):
         """输入1分钟最新K线，更新其他级别K线
 
@@ -0,0 +1,187 @@
+# coding: utf-8
+"""
+交易所的交易时段
+
+交易日从前一天的 TRADE_DAY_START 开始，夜盘属于下一个交易日，所有交易所的日盘都在这之前收盘。
+每个交易时段 (start, end) 用 'HH:MM' 表示，end 小于 start 的是跨过午夜的夜盘。
+
+分钟K线的结束时间和原来的 get_next_end_time 一致：
+    时间正好是某个交易时段的结束时间时，就是这个时间；
+    否则是之后第一个满足 minute % m == 0，并且在某个交易时段 (start, end] 之内的时间。
+每个周期按一天的1440分钟预先计算到结束时间的间隔，查找只需要一次下标访问。
+"""
+from datetime import date, time, timedelta
+
+# 交易日的开始时间，晚于该时间的K线属于下一个交易日
+TRADE_DAY_START = time(20, 30)
+
+_MINUTES = 24 * 60
+
+# 交易所 -> 交易时段，按交易日内的先后顺序排列
+_SESSION_SOURCES = {
+    'sse': [('09:30', '11:30'), ('13:00', '15:00')],
+    'szse': [('09:30', '11:30'), ('13:00', '15:00')],
+    'cffex': [('09:30', '11:30'), ('13:00', '15:00')],
+    # 上期所夜盘最晚到 02:30(黄金、白银)，其他品种更早收盘，没有成交的时间不会生成K线
+    'shfe': [('21:00', '02:30'), ('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    'dce': [('21:00', '23:00'), ('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    'czce': [('21:00', '23:00'), ('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')],
+    'hkconnect': [('09:30', '12:00'), ('13:00', '16:00')],
+}
+_SESSION_CALENDARS = {}
+_SESSIONS = {}
+
+
+def _minute(value):
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+class TradeSession:
+    """
+    交易所的交易时段和各个分钟周期的K线结束时间表
+    """
+
+    def __init__(self, name, sessions, calendar='sse'):
+        self.name = name
+        self.calendar = calendar
+        self.sessions = [(_minute(start), _minute(end)) for start, end in sessions]
+        self.ends = {end for _, end in self.sessions}
+        self._tables = {}
+
+        start = TRADE_DAY_START.hour * 60 + TRADE_DAY_START.minute
+        offsets = []
+        for st, et in self.sessions:
+            offsets.extend([(st - start) % _MINUTES, (et - start) % _MINUTES or _MINUTES])
+        if offsets != sorted(offsets) or len(set(offsets)) != len(offsets):
+            raise ValueError('Sessions of {} must be ordered within a trade day from {}'.format(
+                name, TRADE_DAY_START))
+
+    def __repr__(self):
+        return "<TradeSession {}>".format(self.name)
+
+    def in_session(self, minute):
+        """一天中的第 minute 分钟是否在某个交易时段 (start, end] 之内"""
+        for st, et in self.sessions:
+            if st < et:
+                if st < minute <= et:
+                    return True
+            elif minute > st or minute <= et:
+                return True
+        return False
+
+    def _build(self, m):
+        # 从后往前扫描两天，找到每一分钟之后的第一个结束时间
+        following = None
+        nxt = [None] * (2 * _MINUTES)
+        for x in range(2 * _MINUTES - 1, -1, -1):
+            nxt[x] = following
+            minute = x % _MINUTES
+            if minute % 60 % m == 0 and self.in_session(minute):
+                following = x
+
+        if following is None:
+            raise ValueError('No bar of {} minutes in sessions of {}'.format(m, self.name))
+
+        table = [timedelta(minutes=0 if x in self.ends else nxt[x] - x) for x in range(_MINUTES)]
+        self._tables[m] = table
+        return table
+
+    def bar_table(self, m=1):
+        """
+        m 分钟周期的结束时间表，下标是一天中的分钟数，值是到K线结束时间(秒为0)的间隔
+        """
+        table = self._tables.get(m)
+        if table is None:
+            table = self._build(m)
+        return table
+
+    def boundaries(self, m=1):
+        """交易日内 m 分钟K线的所有结束时间，按先后顺序排列"""
+        start = TRADE_DAY_START.hour * 60 + TRADE_DAY_START.minute
+        table = self.bar_table(m)
+        minutes = {(x + table[x].seconds // 60) % _MINUTES for x in range(_MINUTES)}
+        return [time(x // 60, x % 60) for x in sorted(minutes, key=lambda x: (x - start) % _MINUTES)]
+
+    def bar_end(self, dt, m=1):
+        """
+        dt 所在的 m 分钟K线的结束时间
+
+        :param dt: datetime
+        :param m: int
+            分钟周期，1 表示 1分钟，5 表示 5分钟 ...
+        :return: datetime
+        """
+        table = self._tables.get(m)
+        if table is None:
+            table = self._build(m)
+        return dt.replace(second=0) + table[dt.hour * 60 + dt.minute]
+
+    def bar_ends(self, dt, minutes=(1, 5, 15, 30, 60)):
+        """
+        dt 所在的多个分钟周期K线的结束时间，逐笔更新时分钟数和去掉秒的时间只计算一次
+        """
+        start = dt.replace(second=0)
+        x = dt.hour * 60 + dt.minute
+        tables = self._tables
+        return [start + (tables.get(m) or self._build(m))[x] for m in minutes]
+
+    def after_midnight(self, minute):
+        """一天中的第 minute 分钟是否在跨过午夜的夜盘中午夜之后的部分"""
+        for st, et in self.sessions:
+            if st > et and minute <= et:
+                return True
+        return False
+
+    def trade_date(self, dt):
+        """
+        dt 所属的交易日，夜盘属于下一个交易日，按交易日历跳过周末和节假日，
+        周五和节假日前夜盘中午夜之后的时间同样属于下一个交易日
+        """
+        if dt.time() >= TRADE_DAY_START:
+            day = dt.date() + timedelta(days=1)
+        elif self.after_midnight(dt.hour * 60 + dt.minute):
+            day = dt.date()
+        else:
+            return dt.date()
+
+        from czsc.Utils.trade_date import get_calendar
+
+        value = get_calendar(self.calendar).real_date(day, towards=1)
+        return day if value is None else date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+
+def register_session(name, sessions, calendar='sse'):
+    """
+    explanation:
+        注册交易所的交易时段，已经注册的会被替换
+
+    params:
+        * name->
+            含义: 交易所名称
+            类型: str
+        * sessions->
+            含义: 交易时段，按交易日内的先后顺序排列
+            类型: list of ('HH:MM', 'HH:MM')
+        * calendar->
+            含义: 交易日历名称，见 czsc.Utils.trade_date.register_calendar
+            类型: str
+    """
+    _SESSION_SOURCES[name] = sessions
+    _SESSION_CALENDARS[name] = calendar
+    _SESSIONS.pop(name, None)
+
+
+def get_session(name='sse'):
+    """
+    explanation:
+        交易所的交易时段，第一次使用时创建，之后直接返回
+    """
+    session = _SESSIONS.get(name)
+    if session is None:
+        try:
+            sessions = _SESSION_SOURCES[name]
+        except KeyError:
+            raise ValueError('Session {} is not registered'.format(name))
+        session = _SESSIONS[name] = TradeSession(name, sessions, _SESSION_CALENDARS.get(name, 'sse'))
+    return session
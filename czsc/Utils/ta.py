@@ -27,6 +27,49 @@ def SMA(close: np.array, timeperiod=5):
         res.append(seq.mean())
     return np.array(res, dtype=np.double)
 
+@numba.njit()
+def MA(close: np.array, timeperiod=5):
+    """移动平均，前 timeperiod-1 个值为 nan，之后递推计算，和 czsc.Indicator.MA 逐根计算的结果一致
+
+    :param close: np.array
+        收盘价序列
+    :param timeperiod: int
+        均线参数
+    :return: np.array
+    """
+    res = np.full(len(close), np.nan)
+    if len(close) < timeperiod:
+        return res
+    res[timeperiod - 1] = close[:timeperiod].mean()
+    for i in range(timeperiod, len(close)):
+        res[i] = res[i - 1] + (close[i] - close[i - timeperiod]) / timeperiod
+    return res
+
+
+@numba.njit()
+def BOLL(close: np.array, timeperiod=20, nbdev=2):
+    """布林线，标准差使用估算标准差，分母为 timeperiod-1
+
+    :param close: np.array
+        收盘价序列
+    :param timeperiod: int
+        均线参数
+    :param nbdev: int
+        标准差倍数
+    :return: (np.array, np.array, np.array)
+        boll, ub, lb
+    """
+    boll = MA(close, timeperiod)
+    ub = np.full(len(close), np.nan)
+    lb = np.full(len(close), np.nan)
+    for i in range(timeperiod - 1, len(close)):
+        seq = close[i - timeperiod + 1: i + 1]
+        std = np.sqrt(((seq - seq.mean()) ** 2).sum() / (timeperiod - 1))
+        ub[i] = boll[i] + nbdev * std
+        lb[i] = boll[i] - nbdev * std
+    return boll, ub, lb
+
+
 @numba.njit()
 def EMA(close: np.array, timeperiod=5):
     """
@@ -66,11 +109,64 @@ def MACD(close: np.array, fastperiod=12, slowperiod=26, signalperiod=9):
     ema12 = EMA(close, timeperiod=fastperiod)
     ema26 = EMA(close, timeperiod=slowperiod)
     diff = ema12 - ema26
-    dea = EMA(diff, timeperiod=signalperiod)
-    macd = (diff - dea) * 2
+    dea, macd, up_area, down_area = MACD_AREA(diff, signalperiod)
     return diff, dea, macd
 
 
+@numba.njit()
+def MACD_STEP(dif, dea, up_area, down_area, signalperiod=9):
+    """MACD 逐根递推一步，批量计算和 czsc.Indicator.MACD 逐根更新共用
+
+    :param dif: float
+        当前K线的 DIF
+    :param dea: float
+        上一根K线的 DEA，nan 表示第一根K线，DEA 等于 DIF
+    :param up_area: float
+        上一根K线为止红柱面积的前缀和
+    :param down_area: float
+        上一根K线为止绿柱面积的前缀和
+    :param signalperiod: int
+        信号周期
+    :return: (float, float, float, float)
+        dea, macd, up_area, down_area
+    """
+    if np.isnan(dea):
+        dea = dif
+    else:
+        dea = (2 * dif + dea * (signalperiod - 1)) / (signalperiod + 1)
+    macd = (dif - dea) * 2
+    if macd > 0:
+        up_area = up_area + macd
+    elif macd < 0:
+        down_area = down_area + macd
+    return dea, macd, up_area, down_area
+
+
+@numba.njit()
+def MACD_AREA(diff: np.array, signalperiod=9):
+    """由 DIF 序列计算 DEA、MACD 柱和红绿柱面积的前缀和
+
+    :param diff: np.array
+        DIF 序列
+    :param signalperiod: int
+        信号周期
+    :return: (np.array, np.array, np.array, np.array)
+        dea, macd, up_area, down_area
+    """
+    n = len(diff)
+    dea = np.empty(n)
+    macd = np.empty(n)
+    up_area = np.empty(n)
+    down_area = np.empty(n)
+    last_dea, up, down = np.nan, 0.0, 0.0
+    for i in range(n):
+        last_dea, macd[i], up, down = MACD_STEP(diff[i], last_dea, up, down, signalperiod)
+        dea[i] = last_dea
+        up_area[i] = up
+        down_area[i] = down
+    return dea, macd, up_area, down_area
+
+
 def KDJ(close: np.array, high: np.array, low: np.array):
     """
 
@@ -1,7602 +1,159 @@
 # coding: utf-8
 import functools
+import os
 # import time
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
 
 from czsc.Utils import util_log_info
+from czsc.Utils.sessions import TRADE_DAY_START
 
-trade_date_sse = [
-    '1990-12-19',
-    '1990-12-20',
-    '1990-12-21',
-    '1990-12-24',
-    '1990-12-25',
-    '1990-12-26',
-    '1990-12-27',
-    '1990-12-28',
-    '1990-12-31',
-    '1991-01-02',
-    '1991-01-03',
-    '1991-01-04',
-    '1991-01-07',
-    '1991-01-08',
-    '1991-01-09',
-    '1991-01-10',
-    '1991-01-11',
-    '1991-01-14',
-    '1991-01-15',
-    '1991-01-16',
-    '1991-01-17',
-    '1991-01-18',
-    '1991-01-21',
-    '1991-01-22',
-    '1991-01-23',
-    '1991-01-24',
-    '1991-01-25',
-    '1991-01-28',
-    '1991-01-29',
-    '1991-01-30',
-    '1991-01-31',
-    '1991-02-01',
-    '1991-02-04',
-    '1991-02-05',
-    '1991-02-06',
-    '1991-02-07',
-    '1991-02-08',
-    '1991-02-11',
-    '1991-02-12',
-    '1991-02-13',
-    '1991-02-14',
-    '1991-02-19',
-    '1991-02-20',
-    '1991-02-21',
-    '1991-02-22',
-    '1991-02-25',
-    '1991-02-26',
-    '1991-02-27',
-    '1991-02-28',
-    '1991-03-01',
-    '1991-03-04',
-    '1991-03-05',
-    '1991-03-06',
-    '1991-03-07',
-    '1991-03-08',
-    '1991-03-11',
-    '1991-03-12',
-    '1991-03-13',
-    '1991-03-14',
-    '1991-03-15',
-    '1991-03-18',
-    '1991-03-19',
-    '1991-03-20',
-    '1991-03-21',
-    '1991-03-22',
-    '1991-03-25',
-    '1991-03-26',
-    '1991-03-27',
-    '1991-03-28',
-    '1991-03-29',
-    '1991-04-01',
-    '1991-04-02',
-    '1991-04-03',
-    '1991-04-04',
-    '1991-04-05',
-    '1991-04-08',
-    '1991-04-09',
-    '1991-04-10',
-    '1991-04-11',
-    '1991-04-12',
-    '1991-04-15',
-    '1991-04-16',
-    '1991-04-17',
-    '1991-04-18',
-    '1991-04-19',
-    '1991-04-22',
-    '1991-04-23',
-    '1991-04-24',
-    '1991-04-25',
-    '1991-04-26',
-    '1991-04-29',
-    '1991-04-30',
-    '1991-05-02',
-    '1991-05-03',
-    '1991-05-06',
-    '1991-05-07',
-    '1991-05-08',
-    '1991-05-09',
-    '1991-05-10',
-    '1991-05-13',
-    '1991-05-14',
-    '1991-05-15',
-    '1991-05-16',
-    '1991-05-17',
-    '1991-05-20',
-    '1991-05-21',
-    '1991-05-22',
-    '1991-05-23',
-    '1991-05-24',
-    '1991-05-27',
-    '1991-05-28',
-    '1991-05-29',
-    '1991-05-30',
-    '1991-05-31',
-    '1991-06-03',
-    '1991-06-04',
-    '1991-06-05',
-    '1991-06-06',
-    '1991-06-07',
-    '1991-06-10',
-    '1991-06-11',
-    '1991-06-12',
-    '1991-06-13',
-    '1991-06-14',
-    '1991-06-17',
-    '1991-06-18',
-    '1991-06-19',
-    '1991-06-20',
-    '1991-06-21',
-    '1991-06-24',
-    '1991-06-25',
-    '1991-06-26',
-    '1991-06-27',
-    '1991-06-28',
-    '1991-07-01',
-    '1991-07-02',
-    '1991-07-03',
-    '1991-07-04',
-    '1991-07-05',
-    '1991-07-08',
-    '1991-07-09',
-    '1991-07-10',
-    '1991-07-11',
-    '1991-07-12',
-    '1991-07-15',
-    '1991-07-16',
-    '1991-07-17',
-    '1991-07-18',
-    '1991-07-19',
-    '1991-07-22',
-    '1991-07-23',
-    '1991-07-24',
-    '1991-07-25',
-    '1991-07-26',
-    '1991-07-29',
-    '1991-07-30',
-    '1991-07-31',
-    '1991-08-01',
-    '1991-08-02',
-    '1991-08-05',
-    '1991-08-06',
-    '1991-08-07',
-    '1991-08-08',
-    '1991-08-09',
-    '1991-08-12',
-    '1991-08-13',
-    '1991-08-14',
-    '1991-08-15',
-    '1991-08-16',
-    '1991-08-19',
-    '1991-08-20',
-    '1991-08-21',
-    '1991-08-22',
-    '1991-08-23',
-    '1991-08-26',
-    '1991-08-27',
-    '1991-08-28',
-    '1991-08-29',
-    '1991-08-30',
-    '1991-09-02',
-    '1991-09-03',
-    '1991-09-04',
-    '1991-09-05',
-    '1991-09-06',
-    '1991-09-09',
-    '1991-09-10',
-    '1991-09-11',
-    '1991-09-12',
-    '1991-09-13',
-    '1991-09-16',
-    '1991-09-17',
-    '1991-09-18',
-    '1991-09-19',
-    '1991-09-20',
-    '1991-09-23',
-    '1991-09-24',
-    '1991-09-25',
-    '1991-09-26',
-    '1991-09-27',
-    '1991-09-30',
-    '1991-10-03',
-    '1991-10-04',
-    '1991-10-07',
-    '1991-10-08',
-    '1991-10-09',
-    '1991-10-10',
-    '1991-10-11',
-    '1991-10-14',
-    '1991-10-15',
-    '1991-10-16',
-    '1991-10-17',
-    '1991-10-18',
-    '1991-10-21',
-    '1991-10-22',
-    '1991-10-23',
-    '1991-10-24',
-    '1991-10-25',
-    '1991-10-28',
-    '1991-10-29',
-    '1991-10-30',
-    '1991-10-31',
-    '1991-11-01',
-    '1991-11-04',
-    '1991-11-05',
-    '1991-11-06',
-    '1991-11-07',
-    '1991-11-08',
-    '1991-11-11',
-    '1991-11-12',
-    '1991-11-13',
-    '1991-11-14',
-    '1991-11-15',
-    '1991-11-18',
-    '1991-11-19',
-    '1991-11-20',
-    '1991-11-21',
-    '1991-11-22',
-    '1991-11-25',
-    '1991-11-26',
-    '1991-11-27',
-    '1991-11-28',
-    '1991-11-29',
-    '1991-12-02',
-    '1991-12-03',
-    '1991-12-04',
-    '1991-12-05',
-    '1991-12-06',
-    '1991-12-09',
-    '1991-12-10',
-    '1991-12-11',
-    '1991-12-12',
-    '1991-12-13',
-    '1991-12-16',
-    '1991-12-17',
-    '1991-12-18',
-    '1991-12-19',
-    '1991-12-20',
-    '1991-12-23',
-    '1991-12-24',
-    '1991-12-25',
-    '1991-12-26',
-    '1991-12-27',
-    '1991-12-30',
-    '1991-12-31',
-    '1992-01-02',
-    '1992-01-03',
-    '1992-01-06',
-    '1992-01-07',
-    '1992-01-08',
-    '1992-01-09',
-    '1992-01-10',
-    '1992-01-13',
-    '1992-01-14',
-    '1992-01-15',
-    '1992-01-16',
-    '1992-01-17',
-    '1992-01-20',
-    '1992-01-21',
-    '1992-01-22',
-    '1992-01-23',
-    '1992-01-24',
-    '1992-01-27',
-    '1992-01-28',
-    '1992-01-29',
-    '1992-01-30',
-    '1992-01-31',
-    '1992-02-03',
-    '1992-02-07',
-    '1992-02-10',
-    '1992-02-11',
-    '1992-02-12',
-    '1992-02-13',
-    '1992-02-14',
-    '1992-02-17',
-    '1992-02-18',
-    '1992-02-19',
-    '1992-02-20',
-    '1992-02-21',
-    '1992-02-24',
-    '1992-02-25',
-    '1992-02-26',
-    '1992-02-27',
-    '1992-02-28',
-    '1992-03-02',
-    '1992-03-03',
-    '1992-03-04',
-    '1992-03-05',
-    '1992-03-06',
-    '1992-03-09',
-    '1992-03-10',
-    '1992-03-11',
-    '1992-03-12',
-    '1992-03-13',
-    '1992-03-16',
-    '1992-03-17',
-    '1992-03-18',
-    '1992-03-19',
-    '1992-03-20',
-    '1992-03-23',
-    '1992-03-24',
-    '1992-03-25',
-    '1992-03-26',
-    '1992-03-27',
-    '1992-03-30',
-    '1992-03-31',
-    '1992-04-01',
-    '1992-04-02',
-    '1992-04-03',
-    '1992-04-06',
-    '1992-04-07',
-    '1992-04-08',
-    '1992-04-09',
-    '1992-04-10',
-    '1992-04-13',
-    '1992-04-14',
-    '1992-04-15',
-    '1992-04-16',
-    '1992-04-17',
-    '1992-04-20',
-    '1992-04-21',
-    '1992-04-22',
-    '1992-04-23',
-    '1992-04-24',
-    '1992-04-27',
-    '1992-04-28',
-    '1992-04-29',
-    '1992-04-30',
-    '1992-05-04',
-    '1992-05-05',
-    '1992-05-06',
-    '1992-05-07',
-    '1992-05-08',
-    '1992-05-11',
-    '1992-05-12',
-    '1992-05-13',
-    '1992-05-14',
-    '1992-05-15',
-    '1992-05-18',
-    '1992-05-19',
-    '1992-05-20',
-    '1992-05-21',
-    '1992-05-22',
-    '1992-05-25',
-    '1992-05-26',
-    '1992-05-27',
-    '1992-05-28',
-    '1992-05-29',
-    '1992-06-01',
-    '1992-06-02',
-    '1992-06-03',
-    '1992-06-04',
-    '1992-06-05',
-    '1992-06-08',
-    '1992-06-09',
-    '1992-06-10',
-    '1992-06-11',
-    '1992-06-12',
-    '1992-06-15',
-    '1992-06-16',
-    '1992-06-17',
-    '1992-06-18',
-    '1992-06-19',
-    '1992-06-22',
-    '1992-06-23',
-    '1992-06-24',
-    '1992-06-25',
-    '1992-06-26',
-    '1992-06-29',
-    '1992-06-30',
-    '1992-07-01',
-    '1992-07-02',
-    '1992-07-03',
-    '1992-07-06',
-    '1992-07-07',
-    '1992-07-08',
-    '1992-07-09',
-    '1992-07-10',
-    '1992-07-13',
-    '1992-07-14',
-    '1992-07-15',
-    '1992-07-16',
-    '1992-07-17',
-    '1992-07-20',
-    '1992-07-21',
-    '1992-07-22',
-    '1992-07-23',
-    '1992-07-24',
-    '1992-07-27',
-    '1992-07-28',
-    '1992-07-29',
-    '1992-07-30',
-    '1992-07-31',
-    '1992-08-03',
-    '1992-08-04',
-    '1992-08-05',
-    '1992-08-06',
-    '1992-08-07',
-    '1992-08-10',
-    '1992-08-11',
-    '1992-08-12',
-    '1992-08-13',
-    '1992-08-14',
-    '1992-08-17',
-    '1992-08-18',
-    '1992-08-19',
-    '1992-08-20',
-    '1992-08-21',
-    '1992-08-24',
-    '1992-08-25',
-    '1992-08-26',
-    '1992-08-27',
-    '1992-08-28',
-    '1992-08-31',
-    '1992-09-01',
-    '1992-09-02',
-    '1992-09-03',
-    '1992-09-04',
-    '1992-09-07',
-    '1992-09-08',
-    '1992-09-09',
-    '1992-09-10',
-    '1992-09-11',
-    '1992-09-14',
-    '1992-09-15',
-    '1992-09-16',
-    '1992-09-17',
-    '1992-09-18',
-    '1992-09-21',
-    '1992-09-22',
-    '1992-09-23',
-    '1992-09-24',
-    '1992-09-25',
-    '1992-09-28',
-    '1992-09-29',
-    '1992-09-30',
-    '1992-10-05',
-    '1992-10-06',
-    '1992-10-07',
-    '1992-10-08',
-    '1992-10-09',
-    '1992-10-12',
-    '1992-10-13',
-    '1992-10-14',
-    '1992-10-15',
-    '1992-10-16',
-    '1992-10-19',
-    '1992-10-20',
-    '1992-10-21',
-    '1992-10-22',
-    '1992-10-23',
-    '1992-10-26',
-    '1992-10-27',
-    '1992-10-28',
-    '1992-10-29',
-    '1992-10-30',
-    '1992-11-02',
-    '1992-11-03',
-    '1992-11-04',
-    '1992-11-05',
-    '1992-11-06',
-    '1992-11-09',
-    '1992-11-10',
-    '1992-11-11',
-    '1992-11-12',
-    '1992-11-13',
-    '1992-11-16',
-    '1992-11-17',
-    '1992-11-18',
-    '1992-11-19',
-    '1992-11-20',
-    '1992-11-23',
-    '1992-11-24',
-    '1992-11-25',
-    '1992-11-26',
-    '1992-11-27',
-    '1992-11-30',
-    '1992-12-01',
-    '1992-12-02',
-    '1992-12-03',
-    '1992-12-04',
-    '1992-12-07',
-    '1992-12-08',
-    '1992-12-09',
-    '1992-12-10',
-    '1992-12-11',
-    '1992-12-14',
-    '1992-12-15',
-    '1992-12-16',
-    '1992-12-17',
-    '1992-12-18',
-    '1992-12-21',
-    '1992-12-22',
-    '1992-12-23',
-    '1992-12-24',
-    '1992-12-25',
-    '1992-12-28',
-    '1992-12-29',
-    '1992-12-30',
-    '1992-12-31',
-    '1993-01-04',
-    '1993-01-05',
-    '1993-01-06',
-    '1993-01-07',
-    '1993-01-08',
-    '1993-01-11',
-    '1993-01-12',
-    '1993-01-13',
-    '1993-01-14',
-    '1993-01-15',
-    '1993-01-18',
-    '1993-01-19',
-    '1993-01-20',
-    '1993-01-21',
-    '1993-01-22',
-    '1993-01-27',
-    '1993-01-28',
-    '1993-01-29',
-    '1993-02-01',
-    '1993-02-02',
-    '1993-02-03',
-    '1993-02-04',
-    '1993-02-05',
-    '1993-02-08',
-    '1993-02-09',
-    '1993-02-10',
-    '1993-02-11',
-    '1993-02-12',
-    '1993-02-15',
-    '1993-02-16',
-    '1993-02-17',
-    '1993-02-18',
-    '1993-02-19',
-    '1993-02-22',
-    '1993-02-23',
-    '1993-02-24',
-    '1993-02-25',
-    '1993-02-26',
-    '1993-03-01',
-    '1993-03-02',
-    '1993-03-03',
-    '1993-03-04',
-    '1993-03-05',
-    '1993-03-08',
-    '1993-03-09',
-    '1993-03-10',
-    '1993-03-11',
-    '1993-03-12',
-    '1993-03-15',
-    '1993-03-16',
-    '1993-03-17',
-    '1993-03-18',
-    '1993-03-19',
-    '1993-03-22',
-    '1993-03-23',
-    '1993-03-24',
-    '1993-03-25',
-    '1993-03-26',
-    '1993-03-29',
-    '1993-03-30',
-    '1993-03-31',
-    '1993-04-01',
-    '1993-04-02',
-    '1993-04-05',
-    '1993-04-06',
-    '1993-04-07',
-    '1993-04-08',
-    '1993-04-09',
-    '1993-04-12',
-    '1993-04-13',
-    '1993-04-14',
-    '1993-04-15',
-    '1993-04-16',
-    '1993-04-19',
-    '1993-04-20',
-    '1993-04-21',
-    '1993-04-22',
-    '1993-04-23',
-    '1993-04-26',
-    '1993-04-27',
-    '1993-04-28',
-    '1993-04-29',
-    '1993-04-30',
-    '1993-05-03',
-    '1993-05-04',
-    '1993-05-05',
-    '1993-05-06',
-    '1993-05-07',
-    '1993-05-10',
-    '1993-05-11',
-    '1993-05-12',
-    '1993-05-13',
-    '1993-05-14',
-    '1993-05-17',
-    '1993-05-18',
-    '1993-05-19',
-    '1993-05-20',
-    '1993-05-21',
-    '1993-05-24',
-    '1993-05-25',
-    '1993-05-26',
-    '1993-05-27',
-    '1993-05-28',
-    '1993-05-31',
-    '1993-06-01',
-    '1993-06-02',
-    '1993-06-03',
-    '1993-06-04',
-    '1993-06-07',
-    '1993-06-08',
-    '1993-06-09',
-    '1993-06-10',
-    '1993-06-11',
-    '1993-06-14',
-    '1993-06-15',
-    '1993-06-16',
-    '1993-06-17',
-    '1993-06-18',
-    '1993-06-21',
-    '1993-06-22',
-    '1993-06-23',
-    '1993-06-24',
-    '1993-06-25',
-    '1993-06-28',
-    '1993-06-29',
-    '1993-06-30',
-    '1993-07-01',
-    '1993-07-02',
-    '1993-07-05',
-    '1993-07-06',
-    '1993-07-07',
-    '1993-07-08',
-    '1993-07-09',
-    '1993-07-12',
-    '1993-07-13',
-    '1993-07-14',
-    '1993-07-15',
-    '1993-07-16',
-    '1993-07-19',
-    '1993-07-20',
-    '1993-07-21',
-    '1993-07-22',
-    '1993-07-23',
-    '1993-07-26',
-    '1993-07-27',
-    '1993-07-28',
-    '1993-07-29',
-    '1993-07-30',
-    '1993-08-02',
-    '1993-08-03',
-    '1993-08-04',
-    '1993-08-05',
-    '1993-08-06',
-    '1993-08-09',
-    '1993-08-10',
-    '1993-08-11',
-    '1993-08-12',
-    '1993-08-13',
-    '1993-08-16',
-    '1993-08-17',
-    '1993-08-18',
-    '1993-08-19',
-    '1993-08-20',
-    '1993-08-23',
-    '1993-08-24',
-    '1993-08-25',
-    '1993-08-26',
-    '1993-08-27',
-    '1993-08-30',
-    '1993-08-31',
-    '1993-09-01',
-    '1993-09-02',
-    '1993-09-03',
-    '1993-09-06',
-    '1993-09-07',
-    '1993-09-08',
-    '1993-09-09',
-    '1993-09-10',
-    '1993-09-13',
-    '1993-09-14',
-    '1993-09-15',
-    '1993-09-16',
-    '1993-09-17',
-    '1993-09-20',
-    '1993-09-21',
-    '1993-09-22',
-    '1993-09-23',
-    '1993-09-24',
-    '1993-09-27',
-    '1993-09-28',
-    '1993-09-29',
-    '1993-09-30',
-    '1993-10-04',
-    '1993-10-05',
-    '1993-10-06',
-    '1993-10-07',
-    '1993-10-08',
-    '1993-10-11',
-    '1993-10-12',
-    '1993-10-13',
-    '1993-10-14',
-    '1993-10-15',
-    '1993-10-18',
-    '1993-10-19',
-    '1993-10-20',
-    '1993-10-21',
-    '1993-10-22',
-    '1993-10-25',
-    '1993-10-26',
-    '1993-10-27',
-    '1993-10-28',
-    '1993-10-29',
-    '1993-11-01',
-    '1993-11-02',
-    '1993-11-03',
-    '1993-11-04',
-    '1993-11-05',
-    '1993-11-08',
-    '1993-11-09',
-    '1993-11-10',
-    '1993-11-11',
-    '1993-11-12',
-    '1993-11-15',
-    '1993-11-16',
-    '1993-11-17',
-    '1993-11-18',
-    '1993-11-19',
-    '1993-11-22',
-    '1993-11-23',
-    '1993-11-24',
-    '1993-11-25',
-    '1993-11-26',
-    '1993-11-29',
-    '1993-11-30',
-    '1993-12-01',
-    '1993-12-02',
-    '1993-12-03',
-    '1993-12-06',
-    '1993-12-07',
-    '1993-12-08',
-    '1993-12-09',
-    '1993-12-10',
-    '1993-12-13',
-    '1993-12-14',
-    '1993-12-15',
-    '1993-12-16',
-    '1993-12-17',
-    '1993-12-20',
-    '1993-12-21',
-    '1993-12-22',
-    '1993-12-23',
-    '1993-12-24',
-    '1993-12-27',
-    '1993-12-28',
-    '1993-12-29',
-    '1993-12-30',
-    '1993-12-31',
-    '1994-01-03',
-    '1994-01-04',
-    '1994-01-05',
-    '1994-01-06',
-    '1994-01-07',
-    '1994-01-10',
-    '1994-01-11',
-    '1994-01-12',
-    '1994-01-13',
-    '1994-01-14',
-    '1994-01-17',
-    '1994-01-18',
-    '1994-01-19',
-    '1994-01-20',
-    '1994-01-21',
-    '1994-01-24',
-    '1994-01-25',
-    '1994-01-26',
-    '1994-01-27',
-    '1994-01-28',
-    '1994-01-31',
-    '1994-02-01',
-    '1994-02-02',
-    '1994-02-03',
-    '1994-02-04',
-    '1994-02-14',
-    '1994-02-15',
-    '1994-02-16',
-    '1994-02-17',
-    '1994-02-18',
-    '1994-02-21',
-    '1994-02-22',
-    '1994-02-23',
-    '1994-02-24',
-    '1994-02-25',
-    '1994-02-28',
-    '1994-03-01',
-    '1994-03-02',
-    '1994-03-03',
-    '1994-03-04',
-    '1994-03-07',
-    '1994-03-08',
-    '1994-03-09',
-    '1994-03-10',
-    '1994-03-11',
-    '1994-03-14',
-    '1994-03-15',
-    '1994-03-16',
-    '1994-03-17',
-    '1994-03-18',
-    '1994-03-21',
-    '1994-03-22',
-    '1994-03-23',
-    '1994-03-24',
-    '1994-03-25',
-    '1994-03-28',
-    '1994-03-29',
-    '1994-03-30',
-    '1994-03-31',
-    '1994-04-01',
-    '1994-04-04',
-    '1994-04-05',
-    '1994-04-06',
-    '1994-04-07',
-    '1994-04-08',
-    '1994-04-11',
-    '1994-04-12',
-    '1994-04-13',
-    '1994-04-14',
-    '1994-04-15',
-    '1994-04-18',
-    '1994-04-19',
-    '1994-04-20',
-    '1994-04-21',
-    '1994-04-22',
-    '1994-04-25',
-    '1994-04-26',
-    '1994-04-27',
-    '1994-04-28',
-    '1994-04-29',
-    '1994-05-03',
-    '1994-05-04',
-    '1994-05-05',
-    '1994-05-06',
-    '1994-05-09',
-    '1994-05-10',
-    '1994-05-11',
-    '1994-05-12',
-    '1994-05-13',
-    '1994-05-16',
-    '1994-05-17',
-    '1994-05-18',
-    '1994-05-19',
-    '1994-05-20',
-    '1994-05-23',
-    '1994-05-24',
-    '1994-05-25',
-    '1994-05-26',
-    '1994-05-27',
-    '1994-05-30',
-    '1994-05-31',
-    '1994-06-01',
-    '1994-06-02',
-    '1994-06-03',
-    '1994-06-06',
-    '1994-06-07',
-    '1994-06-08',
-    '1994-06-09',
-    '1994-06-10',
-    '1994-06-13',
-    '1994-06-14',
-    '1994-06-15',
-    '1994-06-16',
-    '1994-06-17',
-    '1994-06-20',
-    '1994-06-21',
-    '1994-06-22',
-    '1994-06-23',
-    '1994-06-24',
-    '1994-06-27',
-    '1994-06-28',
-    '1994-06-29',
-    '1994-06-30',
-    '1994-07-01',
-    '1994-07-04',
-    '1994-07-05',
-    '1994-07-06',
-    '1994-07-07',
-    '1994-07-08',
-    '1994-07-11',
-    '1994-07-12',
-    '1994-07-13',
-    '1994-07-14',
-    '1994-07-15',
-    '1994-07-18',
-    '1994-07-19',
-    '1994-07-20',
-    '1994-07-21',
-    '1994-07-22',
-    '1994-07-25',
-    '1994-07-26',
-    '1994-07-27',
-    '1994-07-28',
-    '1994-07-29',
-    '1994-08-01',
-    '1994-08-02',
-    '1994-08-03',
-    '1994-08-04',
-    '1994-08-05',
-    '1994-08-08',
-    '1994-08-09',
-    '1994-08-10',
-    '1994-08-11',
-    '1994-08-12',
-    '1994-08-15',
-    '1994-08-16',
-    '1994-08-17',
-    '1994-08-18',
-    '1994-08-19',
-    '1994-08-22',
-    '1994-08-23',
-    '1994-08-24',
-    '1994-08-25',
-    '1994-08-26',
-    '1994-08-29',
-    '1994-08-30',
-    '1994-08-31',
-    '1994-09-01',
-    '1994-09-02',
-    '1994-09-05',
-    '1994-09-06',
-    '1994-09-07',
-    '1994-09-08',
-    '1994-09-09',
-    '1994-09-12',
-    '1994-09-13',
-    '1994-09-14',
-    '1994-09-15',
-    '1994-09-16',
-    '1994-09-19',
-    '1994-09-20',
-    '1994-09-21',
-    '1994-09-22',
-    '1994-09-23',
-    '1994-09-26',
-    '1994-09-27',
-    '1994-09-28',
-    '1994-09-29',
-    '1994-09-30',
-    '1994-10-05',
-    '1994-10-06',
-    '1994-10-07',
-    '1994-10-10',
-    '1994-10-11',
-    '1994-10-12',
-    '1994-10-13',
-    '1994-10-14',
-    '1994-10-17',
-    '1994-10-18',
-    '1994-10-19',
-    '1994-10-20',
-    '1994-10-21',
-    '1994-10-24',
-    '1994-10-25',
-    '1994-10-26',
-    '1994-10-27',
-    '1994-10-28',
-    '1994-10-31',
-    '1994-11-01',
-    '1994-11-02',
-    '1994-11-03',
-    '1994-11-04',
-    '1994-11-07',
-    '1994-11-08',
-    '1994-11-09',
-    '1994-11-10',
-    '1994-11-11',
-    '1994-11-14',
-    '1994-11-15',
-    '1994-11-16',
-    '1994-11-17',
-    '1994-11-18',
-    '1994-11-21',
-    '1994-11-22',
-    '1994-11-23',
-    '1994-11-24',
-    '1994-11-25',
-    '1994-11-28',
-    '1994-11-29',
-    '1994-11-30',
-    '1994-12-01',
-    '1994-12-02',
-    '1994-12-05',
-    '1994-12-06',
-    '1994-12-07',
-    '1994-12-08',
-    '1994-12-09',
-    '1994-12-12',
-    '1994-12-13',
-    '1994-12-14',
-    '1994-12-15',
-    '1994-12-16',
-    '1994-12-19',
-    '1994-12-20',
-    '1994-12-21',
-    '1994-12-22',
-    '1994-12-23',
-    '1994-12-26',
-    '1994-12-27',
-    '1994-12-28',
-    '1994-12-29',
-    '1994-12-30',
-    '1995-01-03',
-    '1995-01-04',
-    '1995-01-05',
-    '1995-01-06',
-    '1995-01-09',
-    '1995-01-10',
-    '1995-01-11',
-    '1995-01-12',
-    '1995-01-13',
-    '1995-01-16',
-    '1995-01-17',
-    '1995-01-18',
-    '1995-01-19',
-    '1995-01-20',
-    '1995-01-23',
-    '1995-01-24',
-    '1995-01-25',
-    '1995-01-26',
-    '1995-01-27',
-    '1995-02-06',
-    '1995-02-07',
-    '1995-02-08',
-    '1995-02-09',
-    '1995-02-10',
-    '1995-02-13',
-    '1995-02-14',
-    '1995-02-15',
-    '1995-02-16',
-    '1995-02-17',
-    '1995-02-20',
-    '1995-02-21',
-    '1995-02-22',
-    '1995-02-23',
-    '1995-02-24',
-    '1995-02-27',
-    '1995-02-28',
-    '1995-03-01',
-    '1995-03-02',
-    '1995-03-03',
-    '1995-03-06',
-    '1995-03-07',
-    '1995-03-08',
-    '1995-03-09',
-    '1995-03-10',
-    '1995-03-13',
-    '1995-03-14',
-    '1995-03-15',
-    '1995-03-16',
-    '1995-03-17',
-    '1995-03-20',
-    '1995-03-21',
-    '1995-03-22',
-    '1995-03-23',
-    '1995-03-24',
-    '1995-03-27',
-    '1995-03-28',
-    '1995-03-29',
-    '1995-03-30',
-    '1995-03-31',
-    '1995-04-03',
-    '1995-04-04',
-    '1995-04-05',
-    '1995-04-06',
-    '1995-04-07',
-    '1995-04-10',
-    '1995-04-11',
-    '1995-04-12',
-    '1995-04-13',
-    '1995-04-14',
-    '1995-04-17',
-    '1995-04-18',
-    '1995-04-19',
-    '1995-04-20',
-    '1995-04-21',
-    '1995-04-24',
-    '1995-04-25',
-    '1995-04-26',
-    '1995-04-27',
-    '1995-04-28',
-    '1995-05-02',
-    '1995-05-03',
-    '1995-05-04',
-    '1995-05-05',
-    '1995-05-08',
-    '1995-05-09',
-    '1995-05-10',
-    '1995-05-11',
-    '1995-05-12',
-    '1995-05-15',
-    '1995-05-16',
-    '1995-05-17',
-    '1995-05-18',
-    '1995-05-19',
-    '1995-05-22',
-    '1995-05-23',
-    '1995-05-24',
-    '1995-05-25',
-    '1995-05-26',
-    '1995-05-29',
-    '1995-05-30',
-    '1995-05-31',
-    '1995-06-01',
-    '1995-06-02',
-    '1995-06-05',
-    '1995-06-06',
-    '1995-06-07',
-    '1995-06-08',
-    '1995-06-09',
-    '1995-06-12',
-    '1995-06-13',
-    '1995-06-14',
-    '1995-06-15',
-    '1995-06-16',
-    '1995-06-19',
-    '1995-06-20',
-    '1995-06-21',
-    '1995-06-22',
-    '1995-06-23',
-    '1995-06-26',
-    '1995-06-27',
-    '1995-06-28',
-    '1995-06-29',
-    '1995-06-30',
-    '1995-07-03',
-    '1995-07-04',
-    '1995-07-05',
-    '1995-07-06',
-    '1995-07-07',
-    '1995-07-10',
-    '1995-07-11',
-    '1995-07-12',
-    '1995-07-13',
-    '1995-07-14',
-    '1995-07-17',
-    '1995-07-18',
-    '1995-07-19',
-    '1995-07-20',
-    '1995-07-21',
-    '1995-07-24',
-    '1995-07-25',
-    '1995-07-26',
-    '1995-07-27',
-    '1995-07-28',
-    '1995-07-31',
-    '1995-08-01',
-    '1995-08-02',
-    '1995-08-03',
-    '1995-08-04',
-    '1995-08-07',
-    '1995-08-08',
-    '1995-08-09',
-    '1995-08-10',
-    '1995-08-11',
-    '1995-08-14',
-    '1995-08-15',
-    '1995-08-16',
-    '1995-08-17',
-    '1995-08-18',
-    '1995-08-21',
-    '1995-08-22',
-    '1995-08-23',
-    '1995-08-24',
-    '1995-08-25',
-    '1995-08-28',
-    '1995-08-29',
-    '1995-08-30',
-    '1995-08-31',
-    '1995-09-01',
-    '1995-09-04',
-    '1995-09-05',
-    '1995-09-06',
-    '1995-09-07',
-    '1995-09-08',
-    '1995-09-11',
-    '1995-09-12',
-    '1995-09-13',
-    '1995-09-14',
-    '1995-09-15',
-    '1995-09-18',
-    '1995-09-19',
-    '1995-09-20',
-    '1995-09-21',
-    '1995-09-22',
-    '1995-09-25',
-    '1995-09-26',
-    '1995-09-27',
-    '1995-09-28',
-    '1995-09-29',
-    '1995-10-04',
-    '1995-10-05',
-    '1995-10-06',
-    '1995-10-09',
-    '1995-10-10',
-    '1995-10-11',
-    '1995-10-12',
-    '1995-10-13',
-    '1995-10-16',
-    '1995-10-17',
-    '1995-10-18',
-    '1995-10-19',
-    '1995-10-20',
-    '1995-10-23',
-    '1995-10-24',
-    '1995-10-25',
-    '1995-10-26',
-    '1995-10-27',
-    '1995-10-30',
-    '1995-10-31',
-    '1995-11-01',
-    '1995-11-02',
-    '1995-11-03',
-    '1995-11-06',
-    '1995-11-07',
-    '1995-11-08',
-    '1995-11-09',
-    '1995-11-10',
-    '1995-11-13',
-    '1995-11-14',
-    '1995-11-15',
-    '1995-11-16',
-    '1995-11-17',
-    '1995-11-20',
-    '1995-11-21',
-    '1995-11-22',
-    '1995-11-23',
-    '1995-11-24',
-    '1995-11-27',
-    '1995-11-28',
-    '1995-11-29',
-    '1995-11-30',
-    '1995-12-01',
-    '1995-12-04',
-    '1995-12-05',
-    '1995-12-06',
-    '1995-12-07',
-    '1995-12-08',
-    '1995-12-11',
-    '1995-12-12',
-    '1995-12-13',
-    '1995-12-14',
-    '1995-12-15',
-    '1995-12-18',
-    '1995-12-19',
-    '1995-12-20',
-    '1995-12-21',
-    '1995-12-22',
-    '1995-12-25',
-    '1995-12-26',
-    '1995-12-27',
-    '1995-12-28',
-    '1995-12-29',
-    '1996-01-02',
-    '1996-01-03',
-    '1996-01-04',
-    '1996-01-05',
-    '1996-01-08',
-    '1996-01-09',
-    '1996-01-10',
-    '1996-01-11',
-    '1996-01-12',
-    '1996-01-15',
-    '1996-01-16',
-    '1996-01-17',
-    '1996-01-18',
-    '1996-01-19',
-    '1996-01-22',
-    '1996-01-23',
-    '1996-01-24',
-    '1996-01-25',
-    '1996-01-26',
-    '1996-01-29',
-    '1996-01-30',
-    '1996-01-31',
-    '1996-02-01',
-    '1996-02-02',
-    '1996-02-05',
-    '1996-02-06',
-    '1996-02-07',
-    '1996-02-08',
-    '1996-02-09',
-    '1996-02-12',
-    '1996-02-13',
-    '1996-02-14',
-    '1996-02-15',
-    '1996-02-16',
-    '1996-03-04',
-    '1996-03-05',
-    '1996-03-06',
-    '1996-03-07',
-    '1996-03-08',
-    '1996-03-11',
-    '1996-03-12',
-    '1996-03-13',
-    '1996-03-14',
-    '1996-03-15',
-    '1996-03-18',
-    '1996-03-19',
-    '1996-03-20',
-    '1996-03-21',
-    '1996-03-22',
-    '1996-03-25',
-    '1996-03-26',
-    '1996-03-27',
-    '1996-03-28',
-    '1996-03-29',
-    '1996-04-01',
-    '1996-04-02',
-    '1996-04-03',
-    '1996-04-04',
-    '1996-04-05',
-    '1996-04-08',
-    '1996-04-09',
-    '1996-04-10',
-    '1996-04-11',
-    '1996-04-12',
-    '1996-04-15',
-    '1996-04-16',
-    '1996-04-17',
-    '1996-04-18',
-    '1996-04-19',
-    '1996-04-22',
-    '1996-04-23',
-    '1996-04-24',
-    '1996-04-25',
-    '1996-04-26',
-    '1996-04-29',
-    '1996-04-30',
-    '1996-05-02',
-    '1996-05-03',
-    '1996-05-06',
-    '1996-05-07',
-    '1996-05-08',
-    '1996-05-09',
-    '1996-05-10',
-    '1996-05-13',
-    '1996-05-14',
-    '1996-05-15',
-    '1996-05-16',
-    '1996-05-17',
-    '1996-05-20',
-    '1996-05-21',
-    '1996-05-22',
-    '1996-05-23',
-    '1996-05-24',
-    '1996-05-27',
-    '1996-05-28',
-    '1996-05-29',
-    '1996-05-30',
-    '1996-05-31',
-    '1996-06-03',
-    '1996-06-04',
-    '1996-06-05',
-    '1996-06-06',
-    '1996-06-07',
-    '1996-06-10',
-    '1996-06-11',
-    '1996-06-12',
-    '1996-06-13',
-    '1996-06-14',
-    '1996-06-17',
-    '1996-06-18',
-    '1996-06-19',
-    '1996-06-20',
-    '1996-06-21',
-    '1996-06-24',
-    '1996-06-25',
-    '1996-06-26',
-    '1996-06-27',
-    '1996-06-28',
-    '1996-07-01',
-    '1996-07-02',
-    '1996-07-03',
-    '1996-07-04',
-    '1996-07-05',
-    '1996-07-08',
-    '1996-07-09',
-    '1996-07-10',
-    '1996-07-11',
-    '1996-07-12',
-    '1996-07-15',
-    '1996-07-16',
-    '1996-07-17',
-    '1996-07-18',
-    '1996-07-19',
-    '1996-07-22',
-    '1996-07-23',
-    '1996-07-24',
-    '1996-07-25',
-    '1996-07-26',
-    '1996-07-29',
-    '1996-07-30',
-    '1996-07-31',
-    '1996-08-01',
-    '1996-08-02',
-    '1996-08-05',
-    '1996-08-06',
-    '1996-08-07',
-    '1996-08-08',
-    '1996-08-09',
-    '1996-08-12',
-    '1996-08-13',
-    '1996-08-14',
-    '1996-08-15',
-    '1996-08-16',
-    '1996-08-19',
-    '1996-08-20',
-    '1996-08-21',
-    '1996-08-22',
-    '1996-08-23',
-    '1996-08-26',
-    '1996-08-27',
-    '1996-08-28',
-    '1996-08-29',
-    '1996-08-30',
-    '1996-09-02',
-    '1996-09-03',
-    '1996-09-04',
-    '1996-09-05',
-    '1996-09-06',
-    '1996-09-09',
-    '1996-09-10',
-    '1996-09-11',
-    '1996-09-12',
-    '1996-09-13',
-    '1996-09-16',
-    '1996-09-17',
-    '1996-09-18',
-    '1996-09-19',
-    '1996-09-20',
-    '1996-09-23',
-    '1996-09-24',
-    '1996-09-25',
-    '1996-09-26',
-    '1996-09-27',
-    '1996-10-03',
-    '1996-10-04',
-    '1996-10-07',
-    '1996-10-08',
-    '1996-10-09',
-    '1996-10-10',
-    '1996-10-11',
-    '1996-10-14',
-    '1996-10-15',
-    '1996-10-16',
-    '1996-10-17',
-    '1996-10-18',
-    '1996-10-21',
-    '1996-10-22',
-    '1996-10-23',
-    '1996-10-24',
-    '1996-10-25',
-    '1996-10-28',
-    '1996-10-29',
-    '1996-10-30',
-    '1996-10-31',
-    '1996-11-01',
-    '1996-11-04',
-    '1996-11-05',
-    '1996-11-06',
-    '1996-11-07',
-    '1996-11-08',
-    '1996-11-11',
-    '1996-11-12',
-    '1996-11-13',
-    '1996-11-14',
-    '1996-11-15',
-    '1996-11-18',
-    '1996-11-19',
-    '1996-11-20',
-    '1996-11-21',
-    '1996-11-22',
-    '1996-11-25',
-    '1996-11-26',
-    '1996-11-27',
-    '1996-11-28',
-    '1996-11-29',
-    '1996-12-02',
-    '1996-12-03',
-    '1996-12-04',
-    '1996-12-05',
-    '1996-12-06',
-    '1996-12-09',
-    '1996-12-10',
-    '1996-12-11',
-    '1996-12-12',
-    '1996-12-13',
-    '1996-12-16',
-    '1996-12-17',
-    '1996-12-18',
-    '1996-12-19',
-    '1996-12-20',
-    '1996-12-23',
-    '1996-12-24',
-    '1996-12-25',
-    '1996-12-26',
-    '1996-12-27',
-    '1996-12-30',
-    '1996-12-31',
-    '1997-01-02',
-    '1997-01-03',
-    '1997-01-06',
-    '1997-01-07',
-    '1997-01-08',
-    '1997-01-09',
-    '1997-01-10',
-    '1997-01-13',
-    '1997-01-14',
-    '1997-01-15',
-    '1997-01-16',
-    '1997-01-17',
-    '1997-01-20',
-    '1997-01-21',
-    '1997-01-22',
-    '1997-01-23',
-    '1997-01-24',
-    '1997-01-27',
-    '1997-01-28',
-    '1997-01-29',
-    '1997-01-30',
-    '1997-01-31',
-    '1997-02-17',
-    '1997-02-18',
-    '1997-02-19',
-    '1997-02-20',
-    '1997-02-21',
-    '1997-02-24',
-    '1997-02-25',
-    '1997-02-26',
-    '1997-02-27',
-    '1997-02-28',
-    '1997-03-03',
-    '1997-03-04',
-    '1997-03-05',
-    '1997-03-06',
-    '1997-03-07',
-    '1997-03-10',
-    '1997-03-11',
-    '1997-03-12',
-    '1997-03-13',
-    '1997-03-14',
-    '1997-03-17',
-    '1997-03-18',
-    '1997-03-19',
-    '1997-03-20',
-    '1997-03-21',
-    '1997-03-24',
-    '1997-03-25',
-    '1997-03-26',
-    '1997-03-27',
-    '1997-03-28',
-    '1997-03-31',
-    '1997-04-01',
-    '1997-04-02',
-    '1997-04-03',
-    '1997-04-04',
-    '1997-04-07',
-    '1997-04-08',
-    '1997-04-09',
-    '1997-04-10',
-    '1997-04-11',
-    '1997-04-14',
-    '1997-04-15',
-    '1997-04-16',
-    '1997-04-17',
-    '1997-04-18',
-    '1997-04-21',
-    '1997-04-22',
-    '1997-04-23',
-    '1997-04-24',
-    '1997-04-25',
-    '1997-04-28',
-    '1997-04-29',
-    '1997-04-30',
-    '1997-05-05',
-    '1997-05-06',
-    '1997-05-07',
-    '1997-05-08',
-    '1997-05-09',
-    '1997-05-12',
-    '1997-05-13',
-    '1997-05-14',
-    '1997-05-15',
-    '1997-05-16',
-    '1997-05-19',
-    '1997-05-20',
-    '1997-05-21',
-    '1997-05-22',
-    '1997-05-23',
-    '1997-05-26',
-    '1997-05-27',
-    '1997-05-28',
-    '1997-05-29',
-    '1997-05-30',
-    '1997-06-02',
-    '1997-06-03',
-    '1997-06-04',
-    '1997-06-05',
-    '1997-06-06',
-    '1997-06-09',
-    '1997-06-10',
-    '1997-06-11',
-    '1997-06-12',
-    '1997-06-13',
-    '1997-06-16',
-    '1997-06-17',
-    '1997-06-18',
-    '1997-06-19',
-    '1997-06-20',
-    '1997-06-23',
-    '1997-06-24',
-    '1997-06-25',
-    '1997-06-26',
-    '1997-06-27',
-    '1997-07-02',
-    '1997-07-03',
-    '1997-07-04',
-    '1997-07-07',
-    '1997-07-08',
-    '1997-07-09',
-    '1997-07-10',
-    '1997-07-11',
-    '1997-07-14',
-    '1997-07-15',
-    '1997-07-16',
-    '1997-07-17',
-    '1997-07-18',
-    '1997-07-21',
-    '1997-07-22',
-    '1997-07-23',
-    '1997-07-24',
-    '1997-07-25',
-    '1997-07-28',
-    '1997-07-29',
-    '1997-07-30',
-    '1997-07-31',
-    '1997-08-01',
-    '1997-08-04',
-    '1997-08-05',
-    '1997-08-06',
-    '1997-08-07',
-    '1997-08-08',
-    '1997-08-11',
-    '1997-08-12',
-    '1997-08-13',
-    '1997-08-14',
-    '1997-08-15',
-    '1997-08-18',
-    '1997-08-19',
-    '1997-08-20',
-    '1997-08-21',
-    '1997-08-22',
-    '1997-08-25',
-    '1997-08-26',
-    '1997-08-27',
-    '1997-08-28',
-    '1997-08-29',
-    '1997-09-01',
-    '1997-09-02',
-    '1997-09-03',
-    '1997-09-04',
-    '1997-09-05',
-    '1997-09-08',
-    '1997-09-09',
-    '1997-09-10',
-    '1997-09-11',
-    '1997-09-12',
-    '1997-09-15',
-    '1997-09-16',
-    '1997-09-17',
-    '1997-09-18',
-    '1997-09-19',
-    '1997-09-22',
-    '1997-09-23',
-    '1997-09-24',
-    '1997-09-25',
-    '1997-09-26',
-    '1997-09-29',
-    '1997-09-30',
-    '1997-10-06',
-    '1997-10-07',
-    '1997-10-08',
-    '1997-10-09',
-    '1997-10-10',
-    '1997-10-13',
-    '1997-10-14',
-    '1997-10-15',
-    '1997-10-16',
-    '1997-10-17',
-    '1997-10-20',
-    '1997-10-21',
-    '1997-10-22',
-    '1997-10-23',
-    '1997-10-24',
-    '1997-10-27',
-    '1997-10-28',
-    '1997-10-29',
-    '1997-10-30',
-    '1997-10-31',
-    '1997-11-03',
-    '1997-11-04',
-    '1997-11-05',
-    '1997-11-06',
-    '1997-11-07',
-    '1997-11-10',
-    '1997-11-11',
-    '1997-11-12',
-    '1997-11-13',
-    '1997-11-14',
-    '1997-11-17',
-    '1997-11-18',
-    '1997-11-19',
-    '1997-11-20',
-    '1997-11-21',
-    '1997-11-24',
-    '1997-11-25',
-    '1997-11-26',
-    '1997-11-27',
-    '1997-11-28',
-    '1997-12-01',
-    '1997-12-02',
-    '1997-12-03',
-    '1997-12-04',
-    '1997-12-05',
-    '1997-12-08',
-    '1997-12-09',
-    '1997-12-10',
-    '1997-12-11',
-    '1997-12-12',
-    '1997-12-15',
-    '1997-12-16',
-    '1997-12-17',
-    '1997-12-18',
-    '1997-12-19',
-    '1997-12-22',
-    '1997-12-23',
-    '1997-12-24',
-    '1997-12-25',
-    '1997-12-26',
-    '1997-12-29',
-    '1997-12-30',
-    '1997-12-31',
-    '1998-01-05',
-    '1998-01-06',
-    '1998-01-07',
-    '1998-01-08',
-    '1998-01-09',
-    '1998-01-12',
-    '1998-01-13',
-    '1998-01-14',
-    '1998-01-15',
-    '1998-01-16',
-    '1998-01-19',
-    '1998-01-20',
-    '1998-01-21',
-    '1998-01-22',
-    '1998-01-23',
-    '1998-02-09',
-    '1998-02-10',
-    '1998-02-11',
-    '1998-02-12',
-    '1998-02-13',
-    '1998-02-16',
-    '1998-02-17',
-    '1998-02-18',
-    '1998-02-19',
-    '1998-02-20',
-    '1998-02-23',
-    '1998-02-24',
-    '1998-02-25',
-    '1998-02-26',
-    '1998-02-27',
-    '1998-03-02',
-    '1998-03-03',
-    '1998-03-04',
-    '1998-03-05',
-    '1998-03-06',
-    '1998-03-09',
-    '1998-03-10',
-    '1998-03-11',
-    '1998-03-12',
-    '1998-03-13',
-    '1998-03-16',
-    '1998-03-17',
-    '1998-03-18',
-    '1998-03-19',
-    '1998-03-20',
-    '1998-03-23',
-    '1998-03-24',
-    '1998-03-25',
-    '1998-03-26',
-    '1998-03-27',
-    '1998-03-30',
-    '1998-03-31',
-    '1998-04-01',
-    '1998-04-02',
-    '1998-04-03',
-    '1998-04-06',
-    '1998-04-07',
-    '1998-04-08',
-    '1998-04-09',
-    '1998-04-10',
-    '1998-04-13',
-    '1998-04-14',
-    '1998-04-15',
-    '1998-04-16',
-    '1998-04-17',
-    '1998-04-20',
-    '1998-04-21',
-    '1998-04-22',
-    '1998-04-23',
-    '1998-04-24',
-    '1998-04-27',
-    '1998-04-28',
-    '1998-04-29',
-    '1998-04-30',
-    '1998-05-04',
-    '1998-05-05',
-    '1998-05-06',
-    '1998-05-07',
-    '1998-05-08',
-    '1998-05-11',
-    '1998-05-12',
-    '1998-05-13',
-    '1998-05-14',
-    '1998-05-15',
-    '1998-05-18',
-    '1998-05-19',
-    '1998-05-20',
-    '1998-05-21',
-    '1998-05-22',
-    '1998-05-25',
-    '1998-05-26',
-    '1998-05-27',
-    '1998-05-28',
-    '1998-05-29',
-    '1998-06-01',
-    '1998-06-02',
-    '1998-06-03',
-    '1998-06-04',
-    '1998-06-05',
-    '1998-06-08',
-    '1998-06-09',
-    '1998-06-10',
-    '1998-06-11',
-    '1998-06-12',
-    '1998-06-15',
-    '1998-06-16',
-    '1998-06-17',
-    '1998-06-18',
-    '1998-06-19',
-    '1998-06-22',
-    '1998-06-23',
-    '1998-06-24',
-    '1998-06-25',
-    '1998-06-26',
-    '1998-06-29',
-    '1998-06-30',
-    '1998-07-01',
-    '1998-07-02',
-    '1998-07-03',
-    '1998-07-06',
-    '1998-07-07',
-    '1998-07-08',
-    '1998-07-09',
-    '1998-07-10',
-    '1998-07-13',
-    '1998-07-14',
-    '1998-07-15',
-    '1998-07-16',
-    '1998-07-17',
-    '1998-07-20',
-    '1998-07-21',
-    '1998-07-22',
-    '1998-07-23',
-    '1998-07-24',
-    '1998-07-27',
-    '1998-07-28',
-    '1998-07-29',
-    '1998-07-30',
-    '1998-07-31',
-    '1998-08-03',
-    '1998-08-04',
-    '1998-08-05',
-    '1998-08-06',
-    '1998-08-07',
-    '1998-08-10',
-    '1998-08-11',
-    '1998-08-12',
-    '1998-08-13',
-    '1998-08-14',
-    '1998-08-17',
-    '1998-08-18',
-    '1998-08-19',
-    '1998-08-20',
-    '1998-08-21',
-    '1998-08-24',
-    '1998-08-25',
-    '1998-08-26',
-    '1998-08-27',
-    '1998-08-28',
-    '1998-08-31',
-    '1998-09-01',
-    '1998-09-02',
-    '1998-09-03',
-    '1998-09-04',
-    '1998-09-07',
-    '1998-09-08',
-    '1998-09-09',
-    '1998-09-10',
-    '1998-09-11',
-    '1998-09-14',
-    '1998-09-15',
-    '1998-09-16',
-    '1998-09-17',
-    '1998-09-18',
-    '1998-09-21',
-    '1998-09-22',
-    '1998-09-23',
-    '1998-09-24',
-    '1998-09-25',
-    '1998-09-28',
-    '1998-09-29',
-    '1998-09-30',
-    '1998-10-05',
-    '1998-10-06',
-    '1998-10-07',
-    '1998-10-08',
-    '1998-10-09',
-    '1998-10-12',
-    '1998-10-13',
-    '1998-10-14',
-    '1998-10-15',
-    '1998-10-16',
-    '1998-10-19',
-    '1998-10-20',
-    '1998-10-21',
-    '1998-10-22',
-    '1998-10-23',
-    '1998-10-26',
-    '1998-10-27',
-    '1998-10-28',
-    '1998-10-29',
-    '1998-10-30',
-    '1998-11-02',
-    '1998-11-03',
-    '1998-11-04',
-    '1998-11-05',
-    '1998-11-06',
-    '1998-11-09',
-    '1998-11-10',
-    '1998-11-11',
-    '1998-11-12',
-    '1998-11-13',
-    '1998-11-16',
-    '1998-11-17',
-    '1998-11-18',
-    '1998-11-19',
-    '1998-11-20',
-    '1998-11-23',
-    '1998-11-24',
-    '1998-11-25',
-    '1998-11-26',
-    '1998-11-27',
-    '1998-11-30',
-    '1998-12-01',
-    '1998-12-02',
-    '1998-12-03',
-    '1998-12-04',
-    '1998-12-07',
-    '1998-12-08',
-    '1998-12-09',
-    '1998-12-10',
-    '1998-12-11',
-    '1998-12-14',
-    '1998-12-15',
-    '1998-12-16',
-    '1998-12-17',
-    '1998-12-18',
-    '1998-12-21',
-    '1998-12-22',
-    '1998-12-23',
-    '1998-12-24',
-    '1998-12-25',
-    '1998-12-28',
-    '1998-12-29',
-    '1998-12-30',
-    '1998-12-31',
-    '1999-01-04',
-    '1999-01-05',
-    '1999-01-06',
-    '1999-01-07',
-    '1999-01-08',
-    '1999-01-11',
-    '1999-01-12',
-    '1999-01-13',
-    '1999-01-14',
-    '1999-01-15',
-    '1999-01-18',
-    '1999-01-19',
-    '1999-01-20',
-    '1999-01-21',
-    '1999-01-22',
-    '1999-01-25',
-    '1999-01-26',
-    '1999-01-27',
-    '1999-01-28',
-    '1999-01-29',
-    '1999-02-01',
-    '1999-02-02',
-    '1999-02-03',
-    '1999-02-04',
-    '1999-02-05',
-    '1999-02-08',
-    '1999-02-09',
-    '1999-03-01',
-    '1999-03-02',
-    '1999-03-03',
-    '1999-03-04',
-    '1999-03-05',
-    '1999-03-08',
-    '1999-03-09',
-    '1999-03-10',
-    '1999-03-11',
-    '1999-03-12',
-    '1999-03-15',
-    '1999-03-16',
-    '1999-03-17',
-    '1999-03-18',
-    '1999-03-19',
-    '1999-03-22',
-    '1999-03-23',
-    '1999-03-24',
-    '1999-03-25',
-    '1999-03-26',
-    '1999-03-29',
-    '1999-03-30',
-    '1999-03-31',
-    '1999-04-01',
-    '1999-04-02',
-    '1999-04-05',
-    '1999-04-06',
-    '1999-04-07',
-    '1999-04-08',
-    '1999-04-09',
-    '1999-04-12',
-    '1999-04-13',
-    '1999-04-14',
-    '1999-04-15',
-    '1999-04-16',
-    '1999-04-19',
-    '1999-04-20',
-    '1999-04-21',
-    '1999-04-22',
-    '1999-04-23',
-    '1999-04-26',
-    '1999-04-27',
-    '1999-04-28',
-    '1999-04-29',
-    '1999-04-30',
-    '1999-05-04',
-    '1999-05-05',
-    '1999-05-06',
-    '1999-05-07',
-    '1999-05-10',
-    '1999-05-11',
-    '1999-05-12',
-    '1999-05-13',
-    '1999-05-14',
-    '1999-05-17',
-    '1999-05-18',
-    '1999-05-19',
-    '1999-05-20',
-    '1999-05-21',
-    '1999-05-24',
-    '1999-05-25',
-    '1999-05-26',
-    '1999-05-27',
-    '1999-05-28',
-    '1999-05-31',
-    '1999-06-01',
-    '1999-06-02',
-    '1999-06-03',
-    '1999-06-04',
-    '1999-06-07',
-    '1999-06-08',
-    '1999-06-09',
-    '1999-06-10',
-    '1999-06-11',
-    '1999-06-14',
-    '1999-06-15',
-    '1999-06-16',
-    '1999-06-17',
-    '1999-06-18',
-    '1999-06-21',
-    '1999-06-22',
-    '1999-06-23',
-    '1999-06-24',
-    '1999-06-25',
-    '1999-06-28',
-    '1999-06-29',
-    '1999-06-30',
-    '1999-07-01',
-    '1999-07-02',
-    '1999-07-05',
-    '1999-07-06',
-    '1999-07-07',
-    '1999-07-08',
-    '1999-07-09',
-    '1999-07-12',
-    '1999-07-13',
-    '1999-07-14',
-    '1999-07-15',
-    '1999-07-16',
-    '1999-07-19',
-    '1999-07-20',
-    '1999-07-21',
-    '1999-07-22',
-    '1999-07-23',
-    '1999-07-26',
-    '1999-07-27',
-    '1999-07-28',
-    '1999-07-29',
-    '1999-07-30',
-    '1999-08-02',
-    '1999-08-03',
-    '1999-08-04',
-    '1999-08-05',
-    '1999-08-06',
-    '1999-08-09',
-    '1999-08-10',
-    '1999-08-11',
-    '1999-08-12',
-    '1999-08-13',
-    '1999-08-16',
-    '1999-08-17',
-    '1999-08-18',
-    '1999-08-19',
-    '1999-08-20',
-    '1999-08-23',
-    '1999-08-24',
-    '1999-08-25',
-    '1999-08-26',
-    '1999-08-27',
-    '1999-08-30',
-    '1999-08-31',
-    '1999-09-01',
-    '1999-09-02',
-    '1999-09-03',
-    '1999-09-06',
-    '1999-09-07',
-    '1999-09-08',
-    '1999-09-09',
-    '1999-09-10',
-    '1999-09-13',
-    '1999-09-14',
-    '1999-09-15',
-    '1999-09-16',
-    '1999-09-17',
-    '1999-09-20',
-    '1999-09-21',
-    '1999-09-22',
-    '1999-09-23',
-    '1999-09-24',
-    '1999-09-27',
-    '1999-09-28',
-    '1999-09-29',
-    '1999-09-30',
-    '1999-10-08',
-    '1999-10-11',
-    '1999-10-12',
-    '1999-10-13',
-    '1999-10-14',
-    '1999-10-15',
-    '1999-10-18',
-    '1999-10-19',
-    '1999-10-20',
-    '1999-10-21',
-    '1999-10-22',
-    '1999-10-25',
-    '1999-10-26',
-    '1999-10-27',
-    '1999-10-28',
-    '1999-10-29',
-    '1999-11-01',
-    '1999-11-02',
-    '1999-11-03',
-    '1999-11-04',
-    '1999-11-05',
-    '1999-11-08',
-    '1999-11-09',
-    '1999-11-10',
-    '1999-11-11',
-    '1999-11-12',
-    '1999-11-15',
-    '1999-11-16',
-    '1999-11-17',
-    '1999-11-18',
-    '1999-11-19',
-    '1999-11-22',
-    '1999-11-23',
-    '1999-11-24',
-    '1999-11-25',
-    '1999-11-26',
-    '1999-11-29',
-    '1999-11-30',
-    '1999-12-01',
-    '1999-12-02',
-    '1999-12-03',
-    '1999-12-06',
-    '1999-12-07',
-    '1999-12-08',
-    '1999-12-09',
-    '1999-12-10',
-    '1999-12-13',
-    '1999-12-14',
-    '1999-12-15',
-    '1999-12-16',
-    '1999-12-17',
-    '1999-12-21',
-    '1999-12-22',
-    '1999-12-23',
-    '1999-12-24',
-    '1999-12-27',
-    '1999-12-28',
-    '1999-12-29',
-    '1999-12-30',
-    '2000-01-04',
-    '2000-01-05',
-    '2000-01-06',
-    '2000-01-07',
-    '2000-01-10',
-    '2000-01-11',
-    '2000-01-12',
-    '2000-01-13',
-    '2000-01-14',
-    '2000-01-17',
-    '2000-01-18',
-    '2000-01-19',
-    '2000-01-20',
-    '2000-01-21',
-    '2000-01-24',
-    '2000-01-25',
-    '2000-01-26',
-    '2000-01-27',
-    '2000-01-28',
-    '2000-02-14',
-    '2000-02-15',
-    '2000-02-16',
-    '2000-02-17',
-    '2000-02-18',
-    '2000-02-21',
-    '2000-02-22',
-    '2000-02-23',
-    '2000-02-24',
-    '2000-02-25',
-    '2000-02-28',
-    '2000-02-29',
-    '2000-03-01',
-    '2000-03-02',
-    '2000-03-03',
-    '2000-03-06',
-    '2000-03-07',
-    '2000-03-08',
-    '2000-03-09',
-    '2000-03-10',
-    '2000-03-13',
-    '2000-03-14',
-    '2000-03-15',
-    '2000-03-16',
-    '2000-03-17',
-    '2000-03-20',
-    '2000-03-21',
-    '2000-03-22',
-    '2000-03-23',
-    '2000-03-24',
-    '2000-03-27',
-    '2000-03-28',
-    '2000-03-29',
-    '2000-03-30',
-    '2000-03-31',
-    '2000-04-03',
-    '2000-04-04',
-    '2000-04-05',
-    '2000-04-06',
-    '2000-04-07',
-    '2000-04-10',
-    '2000-04-11',
-    '2000-04-12',
-    '2000-04-13',
-    '2000-04-14',
-    '2000-04-17',
-    '2000-04-18',
-    '2000-04-19',
-    '2000-04-20',
-    '2000-04-21',
-    '2000-04-24',
-    '2000-04-25',
-    '2000-04-26',
-    '2000-04-27',
-    '2000-04-28',
-    '2000-05-08',
-    '2000-05-09',
-    '2000-05-10',
-    '2000-05-11',
-    '2000-05-12',
-    '2000-05-15',
-    '2000-05-16',
-    '2000-05-17',
-    '2000-05-18',
-    '2000-05-19',
-    '2000-05-22',
-    '2000-05-23',
-    '2000-05-24',
-    '2000-05-25',
-    '2000-05-26',
-    '2000-05-29',
-    '2000-05-30',
-    '2000-05-31',
-    '2000-06-01',
-    '2000-06-02',
-    '2000-06-05',
-    '2000-06-06',
-    '2000-06-07',
-    '2000-06-08',
-    '2000-06-09',
-    '2000-06-12',
-    '2000-06-13',
-    '2000-06-14',
-    '2000-06-15',
-    '2000-06-16',
-    '2000-06-19',
-    '2000-06-20',
-    '2000-06-21',
-    '2000-06-22',
-    '2000-06-23',
-    '2000-06-26',
-    '2000-06-27',
-    '2000-06-28',
-    '2000-06-29',
-    '2000-06-30',
-    '2000-07-03',
-    '2000-07-04',
-    '2000-07-05',
-    '2000-07-06',
-    '2000-07-07',
-    '2000-07-10',
-    '2000-07-11',
-    '2000-07-12',
-    '2000-07-13',
-    '2000-07-14',
-    '2000-07-17',
-    '2000-07-18',
-    '2000-07-19',
-    '2000-07-20',
-    '2000-07-21',
-    '2000-07-24',
-    '2000-07-25',
-    '2000-07-26',
-    '2000-07-27',
-    '2000-07-28',
-    '2000-07-31',
-    '2000-08-01',
-    '2000-08-02',
-    '2000-08-03',
-    '2000-08-04',
-    '2000-08-07',
-    '2000-08-08',
-    '2000-08-09',
-    '2000-08-10',
-    '2000-08-11',
-    '2000-08-14',
-    '2000-08-15',
-    '2000-08-16',
-    '2000-08-17',
-    '2000-08-18',
-    '2000-08-21',
-    '2000-08-22',
-    '2000-08-23',
-    '2000-08-24',
-    '2000-08-25',
-    '2000-08-28',
-    '2000-08-29',
-    '2000-08-30',
-    '2000-08-31',
-    '2000-09-01',
-    '2000-09-04',
-    '2000-09-05',
-    '2000-09-06',
-    '2000-09-07',
-    '2000-09-08',
-    '2000-09-11',
-    '2000-09-12',
-    '2000-09-13',
-    '2000-09-14',
-    '2000-09-15',
-    '2000-09-18',
-    '2000-09-19',
-    '2000-09-20',
-    '2000-09-21',
-    '2000-09-22',
-    '2000-09-25',
-    '2000-09-26',
-    '2000-09-27',
-    '2000-09-28',
-    '2000-09-29',
-    '2000-10-09',
-    '2000-10-10',
-    '2000-10-11',
-    '2000-10-12',
-    '2000-10-13',
-    '2000-10-16',
-    '2000-10-17',
-    '2000-10-18',
-    '2000-10-19',
-    '2000-10-20',
-    '2000-10-23',
-    '2000-10-24',
-    '2000-10-25',
-    '2000-10-26',
-    '2000-10-27',
-    '2000-10-30',
-    '2000-10-31',
-    '2000-11-01',
-    '2000-11-02',
-    '2000-11-03',
-    '2000-11-06',
-    '2000-11-07',
-    '2000-11-08',
-    '2000-11-09',
-    '2000-11-10',
-    '2000-11-13',
-    '2000-11-14',
-    '2000-11-15',
-    '2000-11-16',
-    '2000-11-17',
-    '2000-11-20',
-    '2000-11-21',
-    '2000-11-22',
-    '2000-11-23',
-    '2000-11-24',
-    '2000-11-27',
-    '2000-11-28',
-    '2000-11-29',
-    '2000-11-30',
-    '2000-12-01',
-    '2000-12-04',
-    '2000-12-05',
-    '2000-12-06',
-    '2000-12-07',
-    '2000-12-08',
-    '2000-12-11',
-    '2000-12-12',
-    '2000-12-13',
-    '2000-12-14',
-    '2000-12-15',
-    '2000-12-18',
-    '2000-12-19',
-    '2000-12-20',
-    '2000-12-21',
-    '2000-12-22',
-    '2000-12-25',
-    '2000-12-26',
-    '2000-12-27',
-    '2000-12-28',
-    '2000-12-29',
-    '2001-01-02',
-    '2001-01-03',
-    '2001-01-04',
-    '2001-01-05',
-    '2001-01-08',
-    '2001-01-09',
-    '2001-01-10',
-    '2001-01-11',
-    '2001-01-12',
-    '2001-01-15',
-    '2001-01-16',
-    '2001-01-17',
-    '2001-01-18',
-    '2001-01-19',
-    '2001-02-05',
-    '2001-02-06',
-    '2001-02-07',
-    '2001-02-08',
-    '2001-02-09',
-    '2001-02-12',
-    '2001-02-13',
-    '2001-02-14',
-    '2001-02-15',
-    '2001-02-16',
-    '2001-02-19',
-    '2001-02-20',
-    '2001-02-21',
-    '2001-02-22',
-    '2001-02-23',
-    '2001-02-26',
-    '2001-02-27',
-    '2001-02-28',
-    '2001-03-01',
-    '2001-03-02',
-    '2001-03-05',
-    '2001-03-06',
-    '2001-03-07',
-    '2001-03-08',
-    '2001-03-09',
-    '2001-03-12',
-    '2001-03-13',
-    '2001-03-14',
-    '2001-03-15',
-    '2001-03-16',
-    '2001-03-19',
-    '2001-03-20',
-    '2001-03-21',
-    '2001-03-22',
-    '2001-03-23',
-    '2001-03-26',
-    '2001-03-27',
-    '2001-03-28',
-    '2001-03-29',
-    '2001-03-30',
-    '2001-04-02',
-    '2001-04-03',
-    '2001-04-04',
-    '2001-04-05',
-    '2001-04-06',
-    '2001-04-09',
-    '2001-04-10',
-    '2001-04-11',
-    '2001-04-12',
-    '2001-04-13',
-    '2001-04-16',
-    '2001-04-17',
-    '2001-04-18',
-    '2001-04-19',
-    '2001-04-20',
-    '2001-04-23',
-    '2001-04-24',
-    '2001-04-25',
-    '2001-04-26',
-    '2001-04-27',
-    '2001-04-30',
-    '2001-05-08',
-    '2001-05-09',
-    '2001-05-10',
-    '2001-05-11',
-    '2001-05-14',
-    '2001-05-15',
-    '2001-05-16',
-    '2001-05-17',
-    '2001-05-18',
-    '2001-05-21',
-    '2001-05-22',
-    '2001-05-23',
-    '2001-05-24',
-    '2001-05-25',
-    '2001-05-28',
-    '2001-05-29',
-    '2001-05-30',
-    '2001-05-31',
-    '2001-06-01',
-    '2001-06-04',
-    '2001-06-05',
-    '2001-06-06',
-    '2001-06-07',
-    '2001-06-08',
-    '2001-06-11',
-    '2001-06-12',
-    '2001-06-13',
-    '2001-06-14',
-    '2001-06-15',
-    '2001-06-18',
-    '2001-06-19',
-    '2001-06-20',
-    '2001-06-21',
-    '2001-06-22',
-    '2001-06-25',
-    '2001-06-26',
-    '2001-06-27',
-    '2001-06-28',
-    '2001-06-29',
-    '2001-07-02',
-    '2001-07-03',
-    '2001-07-04',
-    '2001-07-05',
-    '2001-07-06',
-    '2001-07-09',
-    '2001-07-10',
-    '2001-07-11',
-    '2001-07-12',
-    '2001-07-13',
-    '2001-07-16',
-    '2001-07-17',
-    '2001-07-18',
-    '2001-07-19',
-    '2001-07-20',
-    '2001-07-23',
-    '2001-07-24',
-    '2001-07-25',
-    '2001-07-26',
-    '2001-07-27',
-    '2001-07-30',
-    '2001-07-31',
-    '2001-08-01',
-    '2001-08-02',
-    '2001-08-03',
-    '2001-08-06',
-    '2001-08-07',
-    '2001-08-08',
-    '2001-08-09',
-    '2001-08-10',
-    '2001-08-13',
-    '2001-08-14',
-    '2001-08-15',
-    '2001-08-16',
-    '2001-08-17',
-    '2001-08-20',
-    '2001-08-21',
-    '2001-08-22',
-    '2001-08-23',
-    '2001-08-24',
-    '2001-08-27',
-    '2001-08-28',
-    '2001-08-29',
-    '2001-08-30',
-    '2001-08-31',
-    '2001-09-03',
-    '2001-09-04',
-    '2001-09-05',
-    '2001-09-06',
-    '2001-09-07',
-    '2001-09-10',
-    '2001-09-11',
-    '2001-09-12',
-    '2001-09-13',
-    '2001-09-14',
-    '2001-09-17',
-    '2001-09-18',
-    '2001-09-19',
-    '2001-09-20',
-    '2001-09-21',
-    '2001-09-24',
-    '2001-09-25',
-    '2001-09-26',
-    '2001-09-27',
-    '2001-09-28',
-    '2001-10-08',
-    '2001-10-09',
-    '2001-10-10',
-    '2001-10-11',
-    '2001-10-12',
-    '2001-10-15',
-    '2001-10-16',
-    '2001-10-17',
-    '2001-10-18',
-    '2001-10-19',
-    '2001-10-22',
-    '2001-10-23',
-    '2001-10-24',
-    '2001-10-25',
-    '2001-10-26',
-    '2001-10-29',
-    '2001-10-30',
-    '2001-10-31',
-    '2001-11-01',
-    '2001-11-02',
-    '2001-11-05',
-    '2001-11-06',
-    '2001-11-07',
-    '2001-11-08',
-    '2001-11-09',
-    '2001-11-12',
-    '2001-11-13',
-    '2001-11-14',
-    '2001-11-15',
-    '2001-11-16',
-    '2001-11-19',
-    '2001-11-20',
-    '2001-11-21',
-    '2001-11-22',
-    '2001-11-23',
-    '2001-11-26',
-    '2001-11-27',
-    '2001-11-28',
-    '2001-11-29',
-    '2001-11-30',
-    '2001-12-03',
-    '2001-12-04',
-    '2001-12-05',
-    '2001-12-06',
-    '2001-12-07',
-    '2001-12-10',
-    '2001-12-11',
-    '2001-12-12',
-    '2001-12-13',
-    '2001-12-14',
-    '2001-12-17',
-    '2001-12-18',
-    '2001-12-19',
-    '2001-12-20',
-    '2001-12-21',
-    '2001-12-24',
-    '2001-12-25',
-    '2001-12-26',
-    '2001-12-27',
-    '2001-12-28',
-    '2001-12-31',
-    '2002-01-04',
-    '2002-01-07',
-    '2002-01-08',
-    '2002-01-09',
-    '2002-01-10',
-    '2002-01-11',
-    '2002-01-14',
-    '2002-01-15',
-    '2002-01-16',
-    '2002-01-17',
-    '2002-01-18',
-    '2002-01-21',
-    '2002-01-22',
-    '2002-01-23',
-    '2002-01-24',
-    '2002-01-25',
-    '2002-01-28',
-    '2002-01-29',
-    '2002-01-30',
-    '2002-01-31',
-    '2002-02-01',
-    '2002-02-04',
-    '2002-02-05',
-    '2002-02-06',
-    '2002-02-07',
-    '2002-02-08',
-    '2002-02-25',
-    '2002-02-26',
-    '2002-02-27',
-    '2002-02-28',
-    '2002-03-01',
-    '2002-03-04',
-    '2002-03-05',
-    '2002-03-06',
-    '2002-03-07',
-    '2002-03-08',
-    '2002-03-11',
-    '2002-03-12',
-    '2002-03-13',
-    '2002-03-14',
-    '2002-03-15',
-    '2002-03-18',
-    '2002-03-19',
-    '2002-03-20',
-    '2002-03-21',
-    '2002-03-22',
-    '2002-03-25',
-    '2002-03-26',
-    '2002-03-27',
-    '2002-03-28',
-    '2002-03-29',
-    '2002-04-01',
-    '2002-04-02',
-    '2002-04-03',
-    '2002-04-04',
-    '2002-04-05',
-    '2002-04-08',
-    '2002-04-09',
-    '2002-04-10',
-    '2002-04-11',
-    '2002-04-12',
-    '2002-04-15',
-    '2002-04-16',
-    '2002-04-17',
-    '2002-04-18',
-    '2002-04-19',
-    '2002-04-22',
-    '2002-04-23',
-    '2002-04-24',
-    '2002-04-25',
-    '2002-04-26',
-    '2002-04-29',
-    '2002-04-30',
-    '2002-05-08',
-    '2002-05-09',
-    '2002-05-10',
-    '2002-05-13',
-    '2002-05-14',
-    '2002-05-15',
-    '2002-05-16',
-    '2002-05-17',
-    '2002-05-20',
-    '2002-05-21',
-    '2002-05-22',
-    '2002-05-23',
-    '2002-05-24',
-    '2002-05-27',
-    '2002-05-28',
-    '2002-05-29',
-    '2002-05-30',
-    '2002-05-31',
-    '2002-06-03',
-    '2002-06-04',
-    '2002-06-05',
-    '2002-06-06',
-    '2002-06-07',
-    '2002-06-10',
-    '2002-06-11',
-    '2002-06-12',
-    '2002-06-13',
-    '2002-06-14',
-    '2002-06-17',
-    '2002-06-18',
-    '2002-06-19',
-    '2002-06-20',
-    '2002-06-21',
-    '2002-06-24',
-    '2002-06-25',
-    '2002-06-26',
-    '2002-06-27',
-    '2002-06-28',
-    '2002-07-01',
-    '2002-07-02',
-    '2002-07-03',
-    '2002-07-04',
-    '2002-07-05',
-    '2002-07-08',
-    '2002-07-09',
-    '2002-07-10',
-    '2002-07-11',
-    '2002-07-12',
-    '2002-07-15',
-    '2002-07-16',
-    '2002-07-17',
-    '2002-07-18',
-    '2002-07-19',
-    '2002-07-22',
-    '2002-07-23',
-    '2002-07-24',
-    '2002-07-25',
-    '2002-07-26',
-    '2002-07-29',
-    '2002-07-30',
-    '2002-07-31',
-    '2002-08-01',
-    '2002-08-02',
-    '2002-08-05',
-    '2002-08-06',
-    '2002-08-07',
-    '2002-08-08',
-    '2002-08-09',
-    '2002-08-12',
-    '2002-08-13',
-    '2002-08-14',
-    '2002-08-15',
-    '2002-08-16',
-    '2002-08-19',
-    '2002-08-20',
-    '2002-08-21',
-    '2002-08-22',
-    '2002-08-23',
-    '2002-08-26',
-    '2002-08-27',
-    '2002-08-28',
-    '2002-08-29',
-    '2002-08-30',
-    '2002-09-02',
-    '2002-09-03',
-    '2002-09-04',
-    '2002-09-05',
-    '2002-09-06',
-    '2002-09-09',
-    '2002-09-10',
-    '2002-09-11',
-    '2002-09-12',
-    '2002-09-13',
-    '2002-09-16',
-    '2002-09-17',
-    '2002-09-18',
-    '2002-09-19',
-    '2002-09-20',
-    '2002-09-23',
-    '2002-09-24',
-    '2002-09-25',
-    '2002-09-26',
-    '2002-09-27',
-    '2002-10-08',
-    '2002-10-09',
-    '2002-10-10',
-    '2002-10-11',
-    '2002-10-14',
-    '2002-10-15',
-    '2002-10-16',
-    '2002-10-17',
-    '2002-10-18',
-    '2002-10-21',
-    '2002-10-22',
-    '2002-10-23',
-    '2002-10-24',
-    '2002-10-25',
-    '2002-10-28',
-    '2002-10-29',
-    '2002-10-30',
-    '2002-10-31',
-    '2002-11-01',
-    '2002-11-04',
-    '2002-11-05',
-    '2002-11-06',
-    '2002-11-07',
-    '2002-11-08',
-    '2002-11-11',
-    '2002-11-12',
-    '2002-11-13',
-    '2002-11-14',
-    '2002-11-15',
-    '2002-11-18',
-    '2002-11-19',
-    '2002-11-20',
-    '2002-11-21',
-    '2002-11-22',
-    '2002-11-25',
-    '2002-11-26',
-    '2002-11-27',
-    '2002-11-28',
-    '2002-11-29',
-    '2002-12-02',
-    '2002-12-03',
-    '2002-12-04',
-    '2002-12-05',
-    '2002-12-06',
-    '2002-12-09',
-    '2002-12-10',
-    '2002-12-11',
-    '2002-12-12',
-    '2002-12-13',
-    '2002-12-16',
-    '2002-12-17',
-    '2002-12-18',
-    '2002-12-19',
-    '2002-12-20',
-    '2002-12-23',
-    '2002-12-24',
-    '2002-12-25',
-    '2002-12-26',
-    '2002-12-27',
-    '2002-12-30',
-    '2002-12-31',
-    '2003-01-02',
-    '2003-01-03',
-    '2003-01-06',
-    '2003-01-07',
-    '2003-01-08',
-    '2003-01-09',
-    '2003-01-10',
-    '2003-01-13',
-    '2003-01-14',
-    '2003-01-15',
-    '2003-01-16',
-    '2003-01-17',
-    '2003-01-20',
-    '2003-01-21',
-    '2003-01-22',
-    '2003-01-23',
-    '2003-01-24',
-    '2003-01-27',
-    '2003-01-28',
-    '2003-01-29',
-    '2003-02-10',
-    '2003-02-11',
-    '2003-02-12',
-    '2003-02-13',
-    '2003-02-14',
-    '2003-02-17',
-    '2003-02-18',
-    '2003-02-19',
-    '2003-02-20',
-    '2003-02-21',
-    '2003-02-24',
-    '2003-02-25',
-    '2003-02-26',
-    '2003-02-27',
-    '2003-02-28',
-    '2003-03-03',
-    '2003-03-04',
-    '2003-03-05',
-    '2003-03-06',
-    '2003-03-07',
-    '2003-03-10',
-    '2003-03-11',
-    '2003-03-12',
-    '2003-03-13',
-    '2003-03-14',
-    '2003-03-17',
-    '2003-03-18',
-    '2003-03-19',
-    '2003-03-20',
-    '2003-03-21',
-    '2003-03-24',
-    '2003-03-25',
-    '2003-03-26',
-    '2003-03-27',
-    '2003-03-28',
-    '2003-03-31',
-    '2003-04-01',
-    '2003-04-02',
-    '2003-04-03',
-    '2003-04-04',
-    '2003-04-07',
-    '2003-04-08',
-    '2003-04-09',
-    '2003-04-10',
-    '2003-04-11',
-    '2003-04-14',
-    '2003-04-15',
-    '2003-04-16',
-    '2003-04-17',
-    '2003-04-18',
-    '2003-04-21',
-    '2003-04-22',
-    '2003-04-23',
-    '2003-04-24',
-    '2003-04-25',
-    '2003-04-28',
-    '2003-04-29',
-    '2003-04-30',
-    '2003-05-12',
-    '2003-05-13',
-    '2003-05-14',
-    '2003-05-15',
-    '2003-05-16',
-    '2003-05-19',
-    '2003-05-20',
-    '2003-05-21',
-    '2003-05-22',
-    '2003-05-23',
-    '2003-05-26',
-    '2003-05-27',
-    '2003-05-28',
-    '2003-05-29',
-    '2003-05-30',
-    '2003-06-02',
-    '2003-06-03',
-    '2003-06-04',
-    '2003-06-05',
-    '2003-06-06',
-    '2003-06-09',
-    '2003-06-10',
-    '2003-06-11',
-    '2003-06-12',
-    '2003-06-13',
-    '2003-06-16',
-    '2003-06-17',
-    '2003-06-18',
-    '2003-06-19',
-    '2003-06-20',
-    '2003-06-23',
-    '2003-06-24',
-    '2003-06-25',
-    '2003-06-26',
-    '2003-06-27',
-    '2003-06-30',
-    '2003-07-01',
-    '2003-07-02',
-    '2003-07-03',
-    '2003-07-04',
-    '2003-07-07',
-    '2003-07-08',
-    '2003-07-09',
-    '2003-07-10',
-    '2003-07-11',
-    '2003-07-14',
-    '2003-07-15',
-    '2003-07-16',
-    '2003-07-17',
-    '2003-07-18',
-    '2003-07-21',
-    '2003-07-22',
-    '2003-07-23',
-    '2003-07-24',
-    '2003-07-25',
-    '2003-07-28',
-    '2003-07-29',
-    '2003-07-30',
-    '2003-07-31',
-    '2003-08-01',
-    '2003-08-04',
-    '2003-08-05',
-    '2003-08-06',
-    '2003-08-07',
-    '2003-08-08',
-    '2003-08-11',
-    '2003-08-12',
-    '2003-08-13',
-    '2003-08-14',
-    '2003-08-15',
-    '2003-08-18',
-    '2003-08-19',
-    '2003-08-20',
-    '2003-08-21',
-    '2003-08-22',
-    '2003-08-25',
-    '2003-08-26',
-    '2003-08-27',
-    '2003-08-28',
-    '2003-08-29',
-    '2003-09-01',
-    '2003-09-02',
-    '2003-09-03',
-    '2003-09-04',
-    '2003-09-05',
-    '2003-09-08',
-    '2003-09-09',
-    '2003-09-10',
-    '2003-09-11',
-    '2003-09-12',
-    '2003-09-15',
-    '2003-09-16',
-    '2003-09-17',
-    '2003-09-18',
-    '2003-09-19',
-    '2003-09-22',
-    '2003-09-23',
-    '2003-09-24',
-    '2003-09-25',
-    '2003-09-26',
-    '2003-09-29',
-    '2003-09-30',
-    '2003-10-08',
-    '2003-10-09',
-    '2003-10-10',
-    '2003-10-13',
-    '2003-10-14',
-    '2003-10-15',
-    '2003-10-16',
-    '2003-10-17',
-    '2003-10-20',
-    '2003-10-21',
-    '2003-10-22',
-    '2003-10-23',
-    '2003-10-24',
-    '2003-10-27',
-    '2003-10-28',
-    '2003-10-29',
-    '2003-10-30',
-    '2003-10-31',
-    '2003-11-03',
-    '2003-11-04',
-    '2003-11-05',
-    '2003-11-06',
-    '2003-11-07',
-    '2003-11-10',
-    '2003-11-11',
-    '2003-11-12',
-    '2003-11-13',
-    '2003-11-14',
-    '2003-11-17',
-    '2003-11-18',
-    '2003-11-19',
-    '2003-11-20',
-    '2003-11-21',
-    '2003-11-24',
-    '2003-11-25',
-    '2003-11-26',
-    '2003-11-27',
-    '2003-11-28',
-    '2003-12-01',
-    '2003-12-02',
-    '2003-12-03',
-    '2003-12-04',
-    '2003-12-05',
-    '2003-12-08',
-    '2003-12-09',
-    '2003-12-10',
-    '2003-12-11',
-    '2003-12-12',
-    '2003-12-15',
-    '2003-12-16',
-    '2003-12-17',
-    '2003-12-18',
-    '2003-12-19',
-    '2003-12-22',
-    '2003-12-23',
-    '2003-12-24',
-    '2003-12-25',
-    '2003-12-26',
-    '2003-12-29',
-    '2003-12-30',
-    '2003-12-31',
-    '2004-01-02',
-    '2004-01-05',
-    '2004-01-06',
-    '2004-01-07',
-    '2004-01-08',
-    '2004-01-09',
-    '2004-01-12',
-    '2004-01-13',
-    '2004-01-14',
-    '2004-01-15',
-    '2004-01-16',
-    '2004-01-29',
-    '2004-01-30',
-    '2004-02-02',
-    '2004-02-03',
-    '2004-02-04',
-    '2004-02-05',
-    '2004-02-06',
-    '2004-02-09',
-    '2004-02-10',
-    '2004-02-11',
-    '2004-02-12',
-    '2004-02-13',
-    '2004-02-16',
-    '2004-02-17',
-    '2004-02-18',
-    '2004-02-19',
-    '2004-02-20',
-    '2004-02-23',
-    '2004-02-24',
-    '2004-02-25',
-    '2004-02-26',
-    '2004-02-27',
-    '2004-03-01',
-    '2004-03-02',
-    '2004-03-03',
-    '2004-03-04',
-    '2004-03-05',
-    '2004-03-08',
-    '2004-03-09',
-    '2004-03-10',
-    '2004-03-11',
-    '2004-03-12',
-    '2004-03-15',
-    '2004-03-16',
-    '2004-03-17',
-    '2004-03-18',
-    '2004-03-19',
-    '2004-03-22',
-    '2004-03-23',
-    '2004-03-24',
-    '2004-03-25',
-    '2004-03-26',
-    '2004-03-29',
-    '2004-03-30',
-    '2004-03-31',
-    '2004-04-01',
-    '2004-04-02',
-    '2004-04-05',
-    '2004-04-06',
-    '2004-04-07',
-    '2004-04-08',
-    '2004-04-09',
-    '2004-04-12',
-    '2004-04-13',
-    '2004-04-14',
-    '2004-04-15',
-    '2004-04-16',
-    '2004-04-19',
-    '2004-04-20',
-    '2004-04-21',
-    '2004-04-22',
-    '2004-04-23',
-    '2004-04-26',
-    '2004-04-27',
-    '2004-04-28',
-    '2004-04-29',
-    '2004-04-30',
-    '2004-05-10',
-    '2004-05-11',
-    '2004-05-12',
-    '2004-05-13',
-    '2004-05-14',
-    '2004-05-17',
-    '2004-05-18',
-    '2004-05-19',
-    '2004-05-20',
-    '2004-05-21',
-    '2004-05-24',
-    '2004-05-25',
-    '2004-05-26',
-    '2004-05-27',
-    '2004-05-28',
-    '2004-05-31',
-    '2004-06-01',
-    '2004-06-02',
-    '2004-06-03',
-    '2004-06-04',
-    '2004-06-07',
-    '2004-06-08',
-    '2004-06-09',
-    '2004-06-10',
-    '2004-06-11',
-    '2004-06-14',
-    '2004-06-15',
-    '2004-06-16',
-    '2004-06-17',
-    '2004-06-18',
-    '2004-06-21',
-    '2004-06-22',
-    '2004-06-23',
-    '2004-06-24',
-    '2004-06-25',
-    '2004-06-28',
-    '2004-06-29',
-    '2004-06-30',
-    '2004-07-01',
-    '2004-07-02',
-    '2004-07-05',
-    '2004-07-06',
-    '2004-07-07',
-    '2004-07-08',
-    '2004-07-09',
-    '2004-07-12',
-    '2004-07-13',
-    '2004-07-14',
-    '2004-07-15',
-    '2004-07-16',
-    '2004-07-19',
-    '2004-07-20',
-    '2004-07-21',
-    '2004-07-22',
-    '2004-07-23',
-    '2004-07-26',
-    '2004-07-27',
-    '2004-07-28',
-    '2004-07-29',
-    '2004-07-30',
-    '2004-08-02',
-    '2004-08-03',
-    '2004-08-04',
-    '2004-08-05',
-    '2004-08-06',
-    '2004-08-09',
-    '2004-08-10',
-    '2004-08-11',
-    '2004-08-12',
-    '2004-08-13',
-    '2004-08-16',
-    '2004-08-17',
-    '2004-08-18',
-    '2004-08-19',
-    '2004-08-20',
-    '2004-08-23',
-    '2004-08-24',
-    '2004-08-25',
-    '2004-08-26',
-    '2004-08-27',
-    '2004-08-30',
-    '2004-08-31',
-    '2004-09-01',
-    '2004-09-02',
-    '2004-09-03',
-    '2004-09-06',
-    '2004-09-07',
-    '2004-09-08',
-    '2004-09-09',
-    '2004-09-10',
-    '2004-09-13',
-    '2004-09-14',
-    '2004-09-15',
-    '2004-09-16',
-    '2004-09-17',
-    '2004-09-20',
-    '2004-09-21',
-    '2004-09-22',
-    '2004-09-23',
-    '2004-09-24',
-    '2004-09-27',
-    '2004-09-28',
-    '2004-09-29',
-    '2004-09-30',
-    '2004-10-08',
-    '2004-10-11',
-    '2004-10-12',
-    '2004-10-13',
-    '2004-10-14',
-    '2004-10-15',
-    '2004-10-18',
-    '2004-10-19',
-    '2004-10-20',
-    '2004-10-21',
-    '2004-10-22',
-    '2004-10-25',
-    '2004-10-26',
-    '2004-10-27',
-    '2004-10-28',
-    '2004-10-29',
-    '2004-11-01',
-    '2004-11-02',
-    '2004-11-03',
-    '2004-11-04',
-    '2004-11-05',
-    '2004-11-08',
-    '2004-11-09',
-    '2004-11-10',
-    '2004-11-11',
-    '2004-11-12',
-    '2004-11-15',
-    '2004-11-16',
-    '2004-11-17',
-    '2004-11-18',
-    '2004-11-19',
-    '2004-11-22',
-    '2004-11-23',
-    '2004-11-24',
-    '2004-11-25',
-    '2004-11-26',
-    '2004-11-29',
-    '2004-11-30',
-    '2004-12-01',
-    '2004-12-02',
-    '2004-12-03',
-    '2004-12-06',
-    '2004-12-07',
-    '2004-12-08',
-    '2004-12-09',
-    '2004-12-10',
-    '2004-12-13',
-    '2004-12-14',
-    '2004-12-15',
-    '2004-12-16',
-    '2004-12-17',
-    '2004-12-20',
-    '2004-12-21',
-    '2004-12-22',
-    '2004-12-23',
-    '2004-12-24',
-    '2004-12-27',
-    '2004-12-28',
-    '2004-12-29',
-    '2004-12-30',
-    '2004-12-31',
-    '2005-01-04',
-    '2005-01-05',
-    '2005-01-06',
-    '2005-01-07',
-    '2005-01-10',
-    '2005-01-11',
-    '2005-01-12',
-    '2005-01-13',
-    '2005-01-14',
-    '2005-01-17',
-    '2005-01-18',
-    '2005-01-19',
-    '2005-01-20',
-    '2005-01-21',
-    '2005-01-24',
-    '2005-01-25',
-    '2005-01-26',
-    '2005-01-27',
-    '2005-01-28',
-    '2005-01-31',
-    '2005-02-01',
-    '2005-02-02',
-    '2005-02-03',
-    '2005-02-04',
-    '2005-02-16',
-    '2005-02-17',
-    '2005-02-18',
-    '2005-02-21',
-    '2005-02-22',
-    '2005-02-23',
-    '2005-02-24',
-    '2005-02-25',
-    '2005-02-28',
-    '2005-03-01',
-    '2005-03-02',
-    '2005-03-03',
-    '2005-03-04',
-    '2005-03-07',
-    '2005-03-08',
-    '2005-03-09',
-    '2005-03-10',
-    '2005-03-11',
-    '2005-03-14',
-    '2005-03-15',
-    '2005-03-16',
-    '2005-03-17',
-    '2005-03-18',
-    '2005-03-21',
-    '2005-03-22',
-    '2005-03-23',
-    '2005-03-24',
-    '2005-03-25',
-    '2005-03-28',
-    '2005-03-29',
-    '2005-03-30',
-    '2005-03-31',
-    '2005-04-01',
-    '2005-04-04',
-    '2005-04-05',
-    '2005-04-06',
-    '2005-04-07',
-    '2005-04-08',
-    '2005-04-11',
-    '2005-04-12',
-    '2005-04-13',
-    '2005-04-14',
-    '2005-04-15',
-    '2005-04-18',
-    '2005-04-19',
-    '2005-04-20',
-    '2005-04-21',
-    '2005-04-22',
-    '2005-04-25',
-    '2005-04-26',
-    '2005-04-27',
-    '2005-04-28',
-    '2005-04-29',
-    '2005-05-09',
-    '2005-05-10',
-    '2005-05-11',
-    '2005-05-12',
-    '2005-05-13',
-    '2005-05-16',
-    '2005-05-17',
-    '2005-05-18',
-    '2005-05-19',
-    '2005-05-20',
-    '2005-05-23',
-    '2005-05-24',
-    '2005-05-25',
-    '2005-05-26',
-    '2005-05-27',
-    '2005-05-30',
-    '2005-05-31',
-    '2005-06-01',
-    '2005-06-02',
-    '2005-06-03',
-    '2005-06-06',
-    '2005-06-07',
-    '2005-06-08',
-    '2005-06-09',
-    '2005-06-10',
-    '2005-06-13',
-    '2005-06-14',
-    '2005-06-15',
-    '2005-06-16',
-    '2005-06-17',
-    '2005-06-20',
-    '2005-06-21',
-    '2005-06-22',
-    '2005-06-23',
-    '2005-06-24',
-    '2005-06-27',
-    '2005-06-28',
-    '2005-06-29',
-    '2005-06-30',
-    '2005-07-01',
-    '2005-07-04',
-    '2005-07-05',
-    '2005-07-06',
-    '2005-07-07',
-    '2005-07-08',
-    '2005-07-11',
-    '2005-07-12',
-    '2005-07-13',
-    '2005-07-14',
-    '2005-07-15',
-    '2005-07-18',
-    '2005-07-19',
-    '2005-07-20',
-    '2005-07-21',
-    '2005-07-22',
-    '2005-07-25',
-    '2005-07-26',
-    '2005-07-27',
-    '2005-07-28',
-    '2005-07-29',
-    '2005-08-01',
-    '2005-08-02',
-    '2005-08-03',
-    '2005-08-04',
-    '2005-08-05',
-    '2005-08-08',
-    '2005-08-09',
-    '2005-08-10',
-    '2005-08-11',
-    '2005-08-12',
-    '2005-08-15',
-    '2005-08-16',
-    '2005-08-17',
-    '2005-08-18',
-    '2005-08-19',
-    '2005-08-22',
-    '2005-08-23',
-    '2005-08-24',
-    '2005-08-25',
-    '2005-08-26',
-    '2005-08-29',
-    '2005-08-30',
-    '2005-08-31',
-    '2005-09-01',
-    '2005-09-02',
-    '2005-09-05',
-    '2005-09-06',
-    '2005-09-07',
-    '2005-09-08',
-    '2005-09-09',
-    '2005-09-12',
-    '2005-09-13',
-    '2005-09-14',
-    '2005-09-15',
-    '2005-09-16',
-    '2005-09-19',
-    '2005-09-20',
-    '2005-09-21',
-    '2005-09-22',
-    '2005-09-23',
-    '2005-09-26',
-    '2005-09-27',
-    '2005-09-28',
-    '2005-09-29',
-    '2005-09-30',
-    '2005-10-10',
-    '2005-10-11',
-    '2005-10-12',
-    '2005-10-13',
-    '2005-10-14',
-    '2005-10-17',
-    '2005-10-18',
-    '2005-10-19',
-    '2005-10-20',
-    '2005-10-21',
-    '2005-10-24',
-    '2005-10-25',
-    '2005-10-26',
-    '2005-10-27',
-    '2005-10-28',
-    '2005-10-31',
-    '2005-11-01',
-    '2005-11-02',
-    '2005-11-03',
-    '2005-11-04',
-    '2005-11-07',
-    '2005-11-08',
-    '2005-11-09',
-    '2005-11-10',
-    '2005-11-11',
-    '2005-11-14',
-    '2005-11-15',
-    '2005-11-16',
-    '2005-11-17',
-    '2005-11-18',
-    '2005-11-21',
-    '2005-11-22',
-    '2005-11-23',
-    '2005-11-24',
-    '2005-11-25',
-    '2005-11-28',
-    '2005-11-29',
-    '2005-11-30',
-    '2005-12-01',
-    '2005-12-02',
-    '2005-12-05',
-    '2005-12-06',
-    '2005-12-07',
-    '2005-12-08',
-    '2005-12-09',
-    '2005-12-12',
-    '2005-12-13',
-    '2005-12-14',
-    '2005-12-15',
-    '2005-12-16',
-    '2005-12-19',
-    '2005-12-20',
-    '2005-12-21',
-    '2005-12-22',
-    '2005-12-23',
-    '2005-12-26',
-    '2005-12-27',
-    '2005-12-28',
-    '2005-12-29',
-    '2005-12-30',
-    '2006-01-04',
-    '2006-01-05',
-    '2006-01-06',
-    '2006-01-09',
-    '2006-01-10',
-    '2006-01-11',
-    '2006-01-12',
-    '2006-01-13',
-    '2006-01-16',
-    '2006-01-17',
-    '2006-01-18',
-    '2006-01-19',
-    '2006-01-20',
-    '2006-01-23',
-    '2006-01-24',
-    '2006-01-25',
-    '2006-02-06',
-    '2006-02-07',
-    '2006-02-08',
-    '2006-02-09',
-    '2006-02-10',
-    '2006-02-13',
-    '2006-02-14',
-    '2006-02-15',
-    '2006-02-16',
-    '2006-02-17',
-    '2006-02-20',
-    '2006-02-21',
-    '2006-02-22',
-    '2006-02-23',
-    '2006-02-24',
-    '2006-02-27',
-    '2006-02-28',
-    '2006-03-01',
-    '2006-03-02',
-    '2006-03-03',
-    '2006-03-06',
-    '2006-03-07',
-    '2006-03-08',
-    '2006-03-09',
-    '2006-03-10',
-    '2006-03-13',
-    '2006-03-14',
-    '2006-03-15',
-    '2006-03-16',
-    '2006-03-17',
-    '2006-03-20',
-    '2006-03-21',
-    '2006-03-22',
-    '2006-03-23',
-    '2006-03-24',
-    '2006-03-27',
-    '2006-03-28',
-    '2006-03-29',
-    '2006-03-30',
-    '2006-03-31',
-    '2006-04-03',
-    '2006-04-04',
-    '2006-04-05',
-    '2006-04-06',
-    '2006-04-07',
-    '2006-04-10',
-    '2006-04-11',
-    '2006-04-12',
-    '2006-04-13',
-    '2006-04-14',
-    '2006-04-17',
-    '2006-04-18',
-    '2006-04-19',
-    '2006-04-20',
-    '2006-04-21',
-    '2006-04-24',
-    '2006-04-25',
-    '2006-04-26',
-    '2006-04-27',
-    '2006-04-28',
-    '2006-05-08',
-    '2006-05-09',
-    '2006-05-10',
-    '2006-05-11',
-    '2006-05-12',
-    '2006-05-15',
-    '2006-05-16',
-    '2006-05-17',
-    '2006-05-18',
-    '2006-05-19',
-    '2006-05-22',
-    '2006-05-23',
-    '2006-05-24',
-    '2006-05-25',
-    '2006-05-26',
-    '2006-05-29',
-    '2006-05-30',
-    '2006-05-31',
-    '2006-06-01',
-    '2006-06-02',
-    '2006-06-05',
-    '2006-06-06',
-    '2006-06-07',
-    '2006-06-08',
-    '2006-06-09',
-    '2006-06-12',
-    '2006-06-13',
-    '2006-06-14',
-    '2006-06-15',
-    '2006-06-16',
-    '2006-06-19',
-    '2006-06-20',
-    '2006-06-21',
-    '2006-06-22',
-    '2006-06-23',
-    '2006-06-26',
-    '2006-06-27',
-    '2006-06-28',
-    '2006-06-29',
-    '2006-06-30',
-    '2006-07-03',
-    '2006-07-04',
-    '2006-07-05',
-    '2006-07-06',
-    '2006-07-07',
-    '2006-07-10',
-    '2006-07-11',
-    '2006-07-12',
-    '2006-07-13',
-    '2006-07-14',
-    '2006-07-17',
-    '2006-07-18',
-    '2006-07-19',
-    '2006-07-20',
-    '2006-07-21',
-    '2006-07-24',
-    '2006-07-25',
-    '2006-07-26',
-    '2006-07-27',
-    '2006-07-28',
-    '2006-07-31',
-    '2006-08-01',
-    '2006-08-02',
-    '2006-08-03',
-    '2006-08-04',
-    '2006-08-07',
-    '2006-08-08',
-    '2006-08-09',
-    '2006-08-10',
-    '2006-08-11',
-    '2006-08-14',
-    '2006-08-15',
-    '2006-08-16',
-    '2006-08-17',
-    '2006-08-18',
-    '2006-08-21',
-    '2006-08-22',
-    '2006-08-23',
-    '2006-08-24',
-    '2006-08-25',
-    '2006-08-28',
-    '2006-08-29',
-    '2006-08-30',
-    '2006-08-31',
-    '2006-09-01',
-    '2006-09-04',
-    '2006-09-05',
-    '2006-09-06',
-    '2006-09-07',
-    '2006-09-08',
-    '2006-09-11',
-    '2006-09-12',
-    '2006-09-13',
-    '2006-09-14',
-    '2006-09-15',
-    '2006-09-18',
-    '2006-09-19',
-    '2006-09-20',
-    '2006-09-21',
-    '2006-09-22',
-    '2006-09-25',
-    '2006-09-26',
-    '2006-09-27',
-    '2006-09-28',
-    '2006-09-29',
-    '2006-10-09',
-    '2006-10-10',
-    '2006-10-11',
-    '2006-10-12',
-    '2006-10-13',
-    '2006-10-16',
-    '2006-10-17',
-    '2006-10-18',
-    '2006-10-19',
-    '2006-10-20',
-    '2006-10-23',
-    '2006-10-24',
-    '2006-10-25',
-    '2006-10-26',
-    '2006-10-27',
-    '2006-10-30',
-    '2006-10-31',
-    '2006-11-01',
-    '2006-11-02',
-    '2006-11-03',
-    '2006-11-06',
-    '2006-11-07',
-    '2006-11-08',
-    '2006-11-09',
-    '2006-11-10',
-    '2006-11-13',
-    '2006-11-14',
-    '2006-11-15',
-    '2006-11-16',
-    '2006-11-17',
-    '2006-11-20',
-    '2006-11-21',
-    '2006-11-22',
-    '2006-11-23',
-    '2006-11-24',
-    '2006-11-27',
-    '2006-11-28',
-    '2006-11-29',
-    '2006-11-30',
-    '2006-12-01',
-    '2006-12-04',
-    '2006-12-05',
-    '2006-12-06',
-    '2006-12-07',
-    '2006-12-08',
-    '2006-12-11',
-    '2006-12-12',
-    '2006-12-13',
-    '2006-12-14',
-    '2006-12-15',
-    '2006-12-18',
-    '2006-12-19',
-    '2006-12-20',
-    '2006-12-21',
-    '2006-12-22',
-    '2006-12-25',
-    '2006-12-26',
-    '2006-12-27',
-    '2006-12-28',
-    '2006-12-29',
-    '2007-01-04',
-    '2007-01-05',
-    '2007-01-08',
-    '2007-01-09',
-    '2007-01-10',
-    '2007-01-11',
-    '2007-01-12',
-    '2007-01-15',
-    '2007-01-16',
-    '2007-01-17',
-    '2007-01-18',
-    '2007-01-19',
-    '2007-01-22',
-    '2007-01-23',
-    '2007-01-24',
-    '2007-01-25',
-    '2007-01-26',
-    '2007-01-29',
-    '2007-01-30',
-    '2007-01-31',
-    '2007-02-01',
-    '2007-02-02',
-    '2007-02-05',
-    '2007-02-06',
-    '2007-02-07',
-    '2007-02-08',
-    '2007-02-09',
-    '2007-02-12',
-    '2007-02-13',
-    '2007-02-14',
-    '2007-02-15',
-    '2007-02-16',
-    '2007-02-26',
-    '2007-02-27',
-    '2007-02-28',
-    '2007-03-01',
-    '2007-03-02',
-    '2007-03-05',
-    '2007-03-06',
-    '2007-03-07',
-    '2007-03-08',
-    '2007-03-09',
-    '2007-03-12',
-    '2007-03-13',
-    '2007-03-14',
-    '2007-03-15',
-    '2007-03-16',
-    '2007-03-19',
-    '2007-03-20',
-    '2007-03-21',
-    '2007-03-22',
-    '2007-03-23',
-    '2007-03-26',
-    '2007-03-27',
-    '2007-03-28',
-    '2007-03-29',
-    '2007-03-30',
-    '2007-04-02',
-    '2007-04-03',
-    '2007-04-04',
-    '2007-04-05',
-    '2007-04-06',
-    '2007-04-09',
-    '2007-04-10',
-    '2007-04-11',
-    '2007-04-12',
-    '2007-04-13',
-    '2007-04-16',
-    '2007-04-17',
-    '2007-04-18',
-    '2007-04-19',
-    '2007-04-20',
-    '2007-04-23',
-    '2007-04-24',
-    '2007-04-25',
-    '2007-04-26',
-    '2007-04-27',
-    '2007-04-30',
-    '2007-05-08',
-    '2007-05-09',
-    '2007-05-10',
-    '2007-05-11',
-    '2007-05-14',
-    '2007-05-15',
-    '2007-05-16',
-    '2007-05-17',
-    '2007-05-18',
-    '2007-05-21',
-    '2007-05-22',
-    '2007-05-23',
-    '2007-05-24',
-    '2007-05-25',
-    '2007-05-28',
-    '2007-05-29',
-    '2007-05-30',
-    '2007-05-31',
-    '2007-06-01',
-    '2007-06-04',
-    '2007-06-05',
-    '2007-06-06',
-    '2007-06-07',
-    '2007-06-08',
-    '2007-06-11',
-    '2007-06-12',
-    '2007-06-13',
-    '2007-06-14',
-    '2007-06-15',
-    '2007-06-18',
-    '2007-06-19',
-    '2007-06-20',
-    '2007-06-21',
-    '2007-06-22',
-    '2007-06-25',
-    '2007-06-26',
-    '2007-06-27',
-    '2007-06-28',
-    '2007-06-29',
-    '2007-07-02',
-    '2007-07-03',
-    '2007-07-04',
-    '2007-07-05',
-    '2007-07-06',
-    '2007-07-09',
-    '2007-07-10',
-    '2007-07-11',
-    '2007-07-12',
-    '2007-07-13',
-    '2007-07-16',
-    '2007-07-17',
-    '2007-07-18',
-    '2007-07-19',
-    '2007-07-20',
-    '2007-07-23',
-    '2007-07-24',
-    '2007-07-25',
-    '2007-07-26',
-    '2007-07-27',
-    '2007-07-30',
-    '2007-07-31',
-    '2007-08-01',
-    '2007-08-02',
-    '2007-08-03',
-    '2007-08-06',
-    '2007-08-07',
-    '2007-08-08',
-    '2007-08-09',
-    '2007-08-10',
-    '2007-08-13',
-    '2007-08-14',
-    '2007-08-15',
-    '2007-08-16',
-    '2007-08-17',
-    '2007-08-20',
-    '2007-08-21',
-    '2007-08-22',
-    '2007-08-23',
-    '2007-08-24',
-    '2007-08-27',
-    '2007-08-28',
-    '2007-08-29',
-    '2007-08-30',
-    '2007-08-31',
-    '2007-09-03',
-    '2007-09-04',
-    '2007-09-05',
-    '2007-09-06',
-    '2007-09-07',
-    '2007-09-10',
-    '2007-09-11',
-    '2007-09-12',
-    '2007-09-13',
-    '2007-09-14',
-    '2007-09-17',
-    '2007-09-18',
-    '2007-09-19',
-    '2007-09-20',
-    '2007-09-21',
-    '2007-09-24',
-    '2007-09-25',
-    '2007-09-26',
-    '2007-09-27',
-    '2007-09-28',
-    '2007-10-08',
-    '2007-10-09',
-    '2007-10-10',
-    '2007-10-11',
-    '2007-10-12',
-    '2007-10-15',
-    '2007-10-16',
-    '2007-10-17',
-    '2007-10-18',
-    '2007-10-19',
-    '2007-10-22',
-    '2007-10-23',
-    '2007-10-24',
-    '2007-10-25',
-    '2007-10-26',
-    '2007-10-29',
-    '2007-10-30',
-    '2007-10-31',
-    '2007-11-01',
-    '2007-11-02',
-    '2007-11-05',
-    '2007-11-06',
-    '2007-11-07',
-    '2007-11-08',
-    '2007-11-09',
-    '2007-11-12',
-    '2007-11-13',
-    '2007-11-14',
-    '2007-11-15',
-    '2007-11-16',
-    '2007-11-19',
-    '2007-11-20',
-    '2007-11-21',
-    '2007-11-22',
-    '2007-11-23',
-    '2007-11-26',
-    '2007-11-27',
-    '2007-11-28',
-    '2007-11-29',
-    '2007-11-30',
-    '2007-12-03',
-    '2007-12-04',
-    '2007-12-05',
-    '2007-12-06',
-    '2007-12-07',
-    '2007-12-10',
-    '2007-12-11',
-    '2007-12-12',
-    '2007-12-13',
-    '2007-12-14',
-    '2007-12-17',
-    '2007-12-18',
-    '2007-12-19',
-    '2007-12-20',
-    '2007-12-21',
-    '2007-12-24',
-    '2007-12-25',
-    '2007-12-26',
-    '2007-12-27',
-    '2007-12-28',
-    '2008-01-02',
-    '2008-01-03',
-    '2008-01-04',
-    '2008-01-07',
-    '2008-01-08',
-    '2008-01-09',
-    '2008-01-10',
-    '2008-01-11',
-    '2008-01-14',
-    '2008-01-15',
-    '2008-01-16',
-    '2008-01-17',
-    '2008-01-18',
-    '2008-01-21',
-    '2008-01-22',
-    '2008-01-23',
-    '2008-01-24',
-    '2008-01-25',
-    '2008-01-28',
-    '2008-01-29',
-    '2008-01-30',
-    '2008-01-31',
-    '2008-02-01',
-    '2008-02-04',
-    '2008-02-05',
-    '2008-02-13',
-    '2008-02-14',
-    '2008-02-15',
-    '2008-02-18',
-    '2008-02-19',
-    '2008-02-20',
-    '2008-02-21',
-    '2008-02-22',
-    '2008-02-25',
-    '2008-02-26',
-    '2008-02-27',
-    '2008-02-28',
-    '2008-02-29',
-    '2008-03-03',
-    '2008-03-04',
-    '2008-03-05',
-    '2008-03-06',
-    '2008-03-07',
-    '2008-03-10',
-    '2008-03-11',
-    '2008-03-12',
-    '2008-03-13',
-    '2008-03-14',
-    '2008-03-17',
-    '2008-03-18',
-    '2008-03-19',
-    '2008-03-20',
-    '2008-03-21',
-    '2008-03-24',
-    '2008-03-25',
-    '2008-03-26',
-    '2008-03-27',
-    '2008-03-28',
-    '2008-03-31',
-    '2008-04-01',
-    '2008-04-02',
-    '2008-04-03',
-    '2008-04-07',
-    '2008-04-08',
-    '2008-04-09',
-    '2008-04-10',
-    '2008-04-11',
-    '2008-04-14',
-    '2008-04-15',
-    '2008-04-16',
-    '2008-04-17',
-    '2008-04-18',
-    '2008-04-21',
-    '2008-04-22',
-    '2008-04-23',
-    '2008-04-24',
-    '2008-04-25',
-    '2008-04-28',
-    '2008-04-29',
-    '2008-04-30',
-    '2008-05-05',
-    '2008-05-06',
-    '2008-05-07',
-    '2008-05-08',
-    '2008-05-09',
-    '2008-05-12',
-    '2008-05-13',
-    '2008-05-14',
-    '2008-05-15',
-    '2008-05-16',
-    '2008-05-19',
-    '2008-05-20',
-    '2008-05-21',
-    '2008-05-22',
-    '2008-05-23',
-    '2008-05-26',
-    '2008-05-27',
-    '2008-05-28',
-    '2008-05-29',
-    '2008-05-30',
-    '2008-06-02',
-    '2008-06-03',
-    '2008-06-04',
-    '2008-06-05',
-    '2008-06-06',
-    '2008-06-10',
-    '2008-06-11',
-    '2008-06-12',
-    '2008-06-13',
-    '2008-06-16',
-    '2008-06-17',
-    '2008-06-18',
-    '2008-06-19',
-    '2008-06-20',
-    '2008-06-23',
-    '2008-06-24',
-    '2008-06-25',
-    '2008-06-26',
-    '2008-06-27',
-    '2008-06-30',
-    '2008-07-01',
-    '2008-07-02',
-    '2008-07-03',
-    '2008-07-04',
-    '2008-07-07',
-    '2008-07-08',
-    '2008-07-09',
-    '2008-07-10',
-    '2008-07-11',
-    '2008-07-14',
-    '2008-07-15',
-    '2008-07-16',
-    '2008-07-17',
-    '2008-07-18',
-    '2008-07-21',
-    '2008-07-22',
-    '2008-07-23',
-    '2008-07-24',
-    '2008-07-25',
-    '2008-07-28',
-    '2008-07-29',
-    '2008-07-30',
-    '2008-07-31',
-    '2008-08-01',
-    '2008-08-04',
-    '2008-08-05',
-    '2008-08-06',
-    '2008-08-07',
-    '2008-08-08',
-    '2008-08-11',
-    '2008-08-12',
-    '2008-08-13',
-    '2008-08-14',
-    '2008-08-15',
-    '2008-08-18',
-    '2008-08-19',
-    '2008-08-20',
-    '2008-08-21',
-    '2008-08-22',
-    '2008-08-25',
-    '2008-08-26',
-    '2008-08-27',
-    '2008-08-28',
-    '2008-08-29',
-    '2008-09-01',
-    '2008-09-02',
-    '2008-09-03',
-    '2008-09-04',
-    '2008-09-05',
-    '2008-09-08',
-    '2008-09-09',
-    '2008-09-10',
-    '2008-09-11',
-    '2008-09-12',
-    '2008-09-16',
-    '2008-09-17',
-    '2008-09-18',
-    '2008-09-19',
-    '2008-09-22',
-    '2008-09-23',
-    '2008-09-24',
-    '2008-09-25',
-    '2008-09-26',
-    '2008-10-06',
-    '2008-10-07',
-    '2008-10-08',
-    '2008-10-09',
-    '2008-10-10',
-    '2008-10-13',
-    '2008-10-14',
-    '2008-10-15',
-    '2008-10-16',
-    '2008-10-17',
-    '2008-10-20',
-    '2008-10-21',
-    '2008-10-22',
-    '2008-10-23',
-    '2008-10-24',
-    '2008-10-27',
-    '2008-10-28',
-    '2008-10-29',
-    '2008-10-30',
-    '2008-10-31',
-    '2008-11-03',
-    '2008-11-04',
-    '2008-11-05',
-    '2008-11-06',
-    '2008-11-07',
-    '2008-11-10',
-    '2008-11-11',
-    '2008-11-12',
-    '2008-11-13',
-    '2008-11-14',
-    '2008-11-17',
-    '2008-11-18',
-    '2008-11-19',
-    '2008-11-20',
-    '2008-11-21',
-    '2008-11-24',
-    '2008-11-25',
-    '2008-11-26',
-    '2008-11-27',
-    '2008-11-28',
-    '2008-12-01',
-    '2008-12-02',
-    '2008-12-03',
-    '2008-12-04',
-    '2008-12-05',
-    '2008-12-08',
-    '2008-12-09',
-    '2008-12-10',
-    '2008-12-11',
-    '2008-12-12',
-    '2008-12-15',
-    '2008-12-16',
-    '2008-12-17',
-    '2008-12-18',
-    '2008-12-19',
-    '2008-12-22',
-    '2008-12-23',
-    '2008-12-24',
-    '2008-12-25',
-    '2008-12-26',
-    '2008-12-29',
-    '2008-12-30',
-    '2008-12-31',
-    '2009-01-05',
-    '2009-01-06',
-    '2009-01-07',
-    '2009-01-08',
-    '2009-01-09',
-    '2009-01-12',
-    '2009-01-13',
-    '2009-01-14',
-    '2009-01-15',
-    '2009-01-16',
-    '2009-01-19',
-    '2009-01-20',
-    '2009-01-21',
-    '2009-01-22',
-    '2009-01-23',
-    '2009-02-02',
-    '2009-02-03',
-    '2009-02-04',
-    '2009-02-05',
-    '2009-02-06',
-    '2009-02-09',
-    '2009-02-10',
-    '2009-02-11',
-    '2009-02-12',
-    '2009-02-13',
-    '2009-02-16',
-    '2009-02-17',
-    '2009-02-18',
-    '2009-02-19',
-    '2009-02-20',
-    '2009-02-23',
-    '2009-02-24',
-    '2009-02-25',
-    '2009-02-26',
-    '2009-02-27',
-    '2009-03-02',
-    '2009-03-03',
-    '2009-03-04',
-    '2009-03-05',
-    '2009-03-06',
-    '2009-03-09',
-    '2009-03-10',
-    '2009-03-11',
-    '2009-03-12',
-    '2009-03-13',
-    '2009-03-16',
-    '2009-03-17',
-    '2009-03-18',
-    '2009-03-19',
-    '2009-03-20',
-    '2009-03-23',
-    '2009-03-24',
-    '2009-03-25',
-    '2009-03-26',
-    '2009-03-27',
-    '2009-03-30',
-    '2009-03-31',
-    '2009-04-01',
-    '2009-04-02',
-    '2009-04-03',
-    '2009-04-07',
-    '2009-04-08',
-    '2009-04-09',
-    '2009-04-10',
-    '2009-04-13',
-    '2009-04-14',
-    '2009-04-15',
-    '2009-04-16',
-    '2009-04-17',
-    '2009-04-20',
-    '2009-04-21',
-    '2009-04-22',
-    '2009-04-23',
-    '2009-04-24',
-    '2009-04-27',
-    '2009-04-28',
-    '2009-04-29',
-    '2009-04-30',
-    '2009-05-04',
-    '2009-05-05',
-    '2009-05-06',
-    '2009-05-07',
-    '2009-05-08',
-    '2009-05-11',
-    '2009-05-12',
-    '2009-05-13',
-    '2009-05-14',
-    '2009-05-15',
-    '2009-05-18',
-    '2009-05-19',
-    '2009-05-20',
-    '2009-05-21',
-    '2009-05-22',
-    '2009-05-25',
-    '2009-05-26',
-    '2009-05-27',
-    '2009-06-01',
-    '2009-06-02',
-    '2009-06-03',
-    '2009-06-04',
-    '2009-06-05',
-    '2009-06-08',
-    '2009-06-09',
-    '2009-06-10',
-    '2009-06-11',
-    '2009-06-12',
-    '2009-06-15',
-    '2009-06-16',
-    '2009-06-17',
-    '2009-06-18',
-    '2009-06-19',
-    '2009-06-22',
-    '2009-06-23',
-    '2009-06-24',
-    '2009-06-25',
-    '2009-06-26',
-    '2009-06-29',
-    '2009-06-30',
-    '2009-07-01',
-    '2009-07-02',
-    '2009-07-03',
-    '2009-07-06',
-    '2009-07-07',
-    '2009-07-08',
-    '2009-07-09',
-    '2009-07-10',
-    '2009-07-13',
-    '2009-07-14',
-    '2009-07-15',
-    '2009-07-16',
-    '2009-07-17',
-    '2009-07-20',
-    '2009-07-21',
-    '2009-07-22',
-    '2009-07-23',
-    '2009-07-24',
-    '2009-07-27',
-    '2009-07-28',
-    '2009-07-29',
-    '2009-07-30',
-    '2009-07-31',
-    '2009-08-03',
-    '2009-08-04',
-    '2009-08-05',
-    '2009-08-06',
-    '2009-08-07',
-    '2009-08-10',
-    '2009-08-11',
-    '2009-08-12',
-    '2009-08-13',
-    '2009-08-14',
-    '2009-08-17',
-    '2009-08-18',
-    '2009-08-19',
-    '2009-08-20',
-    '2009-08-21',
-    '2009-08-24',
-    '2009-08-25',
-    '2009-08-26',
-    '2009-08-27',
-    '2009-08-28',
-    '2009-08-31',
-    '2009-09-01',
-    '2009-09-02',
-    '2009-09-03',
-    '2009-09-04',
-    '2009-09-07',
-    '2009-09-08',
-    '2009-09-09',
-    '2009-09-10',
-    '2009-09-11',
-    '2009-09-14',
-    '2009-09-15',
-    '2009-09-16',
-    '2009-09-17',
-    '2009-09-18',
-    '2009-09-21',
-    '2009-09-22',
-    '2009-09-23',
-    '2009-09-24',
-    '2009-09-25',
-    '2009-09-28',
-    '2009-09-29',
-    '2009-09-30',
-    '2009-10-09',
-    '2009-10-12',
-    '2009-10-13',
-    '2009-10-14',
-    '2009-10-15',
-    '2009-10-16',
-    '2009-10-19',
-    '2009-10-20',
-    '2009-10-21',
-    '2009-10-22',
-    '2009-10-23',
-    '2009-10-26',
-    '2009-10-27',
-    '2009-10-28',
-    '2009-10-29',
-    '2009-10-30',
-    '2009-11-02',
-    '2009-11-03',
-    '2009-11-04',
-    '2009-11-05',
-    '2009-11-06',
-    '2009-11-09',
-    '2009-11-10',
-    '2009-11-11',
-    '2009-11-12',
-    '2009-11-13',
-    '2009-11-16',
-    '2009-11-17',
-    '2009-11-18',
-    '2009-11-19',
-    '2009-11-20',
-    '2009-11-23',
-    '2009-11-24',
-    '2009-11-25',
-    '2009-11-26',
-    '2009-11-27',
-    '2009-11-30',
-    '2009-12-01',
-    '2009-12-02',
-    '2009-12-03',
-    '2009-12-04',
-    '2009-12-07',
-    '2009-12-08',
-    '2009-12-09',
-    '2009-12-10',
-    '2009-12-11',
-    '2009-12-14',
-    '2009-12-15',
-    '2009-12-16',
-    '2009-12-17',
-    '2009-12-18',
-    '2009-12-21',
-    '2009-12-22',
-    '2009-12-23',
-    '2009-12-24',
-    '2009-12-25',
-    '2009-12-28',
-    '2009-12-29',
-    '2009-12-30',
-    '2009-12-31',
-    '2010-01-04',
-    '2010-01-05',
-    '2010-01-06',
-    '2010-01-07',
-    '2010-01-08',
-    '2010-01-11',
-    '2010-01-12',
-    '2010-01-13',
-    '2010-01-14',
-    '2010-01-15',
-    '2010-01-18',
-    '2010-01-19',
-    '2010-01-20',
-    '2010-01-21',
-    '2010-01-22',
-    '2010-01-25',
-    '2010-01-26',
-    '2010-01-27',
-    '2010-01-28',
-    '2010-01-29',
-    '2010-02-01',
-    '2010-02-02',
-    '2010-02-03',
-    '2010-02-04',
-    '2010-02-05',
-    '2010-02-08',
-    '2010-02-09',
-    '2010-02-10',
-    '2010-02-11',
-    '2010-02-12',
-    '2010-02-22',
-    '2010-02-23',
-    '2010-02-24',
-    '2010-02-25',
-    '2010-02-26',
-    '2010-03-01',
-    '2010-03-02',
-    '2010-03-03',
-    '2010-03-04',
-    '2010-03-05',
-    '2010-03-08',
-    '2010-03-09',
-    '2010-03-10',
-    '2010-03-11',
-    '2010-03-12',
-    '2010-03-15',
-    '2010-03-16',
-    '2010-03-17',
-    '2010-03-18',
-    '2010-03-19',
-    '2010-03-22',
-    '2010-03-23',
-    '2010-03-24',
-    '2010-03-25',
-    '2010-03-26',
-    '2010-03-29',
-    '2010-03-30',
-    '2010-03-31',
-    '2010-04-01',
-    '2010-04-02',
-    '2010-04-06',
-    '2010-04-07',
-    '2010-04-08',
-    '2010-04-09',
-    '2010-04-12',
-    '2010-04-13',
-    '2010-04-14',
-    '2010-04-15',
-    '2010-04-16',
-    '2010-04-19',
-    '2010-04-20',
-    '2010-04-21',
-    '2010-04-22',
-    '2010-04-23',
-    '2010-04-26',
-    '2010-04-27',
-    '2010-04-28',
-    '2010-04-29',
-    '2010-04-30',
-    '2010-05-04',
-    '2010-05-05',
-    '2010-05-06',
-    '2010-05-07',
-    '2010-05-10',
-    '2010-05-11',
-    '2010-05-12',
-    '2010-05-13',
-    '2010-05-14',
-    '2010-05-17',
-    '2010-05-18',
-    '2010-05-19',
-    '2010-05-20',
-    '2010-05-21',
-    '2010-05-24',
-    '2010-05-25',
-    '2010-05-26',
-    '2010-05-27',
-    '2010-05-28',
-    '2010-05-31',
-    '2010-06-01',
-    '2010-06-02',
-    '2010-06-03',
-    '2010-06-04',
-    '2010-06-07',
-    '2010-06-08',
-    '2010-06-09',
-    '2010-06-10',
-    '2010-06-11',
-    '2010-06-17',
-    '2010-06-18',
-    '2010-06-21',
-    '2010-06-22',
-    '2010-06-23',
-    '2010-06-24',
-    '2010-06-25',
-    '2010-06-28',
-    '2010-06-29',
-    '2010-06-30',
-    '2010-07-01',
-    '2010-07-02',
-    '2010-07-05',
-    '2010-07-06',
-    '2010-07-07',
-    '2010-07-08',
-    '2010-07-09',
-    '2010-07-12',
-    '2010-07-13',
-    '2010-07-14',
-    '2010-07-15',
-    '2010-07-16',
-    '2010-07-19',
-    '2010-07-20',
-    '2010-07-21',
-    '2010-07-22',
-    '2010-07-23',
-    '2010-07-26',
-    '2010-07-27',
-    '2010-07-28',
-    '2010-07-29',
-    '2010-07-30',
-    '2010-08-02',
-    '2010-08-03',
-    '2010-08-04',
-    '2010-08-05',
-    '2010-08-06',
-    '2010-08-09',
-    '2010-08-10',
-    '2010-08-11',
-    '2010-08-12',
-    '2010-08-13',
-    '2010-08-16',
-    '2010-08-17',
-    '2010-08-18',
-    '2010-08-19',
-    '2010-08-20',
-    '2010-08-23',
-    '2010-08-24',
-    '2010-08-25',
-    '2010-08-26',
-    '2010-08-27',
-    '2010-08-30',
-    '2010-08-31',
-    '2010-09-01',
-    '2010-09-02',
-    '2010-09-03',
-    '2010-09-06',
-    '2010-09-07',
-    '2010-09-08',
-    '2010-09-09',
-    '2010-09-10',
-    '2010-09-13',
-    '2010-09-14',
-    '2010-09-15',
-    '2010-09-16',
-    '2010-09-17',
-    '2010-09-20',
-    '2010-09-21',
-    '2010-09-27',
-    '2010-09-28',
-    '2010-09-29',
-    '2010-09-30',
-    '2010-10-08',
-    '2010-10-11',
-    '2010-10-12',
-    '2010-10-13',
-    '2010-10-14',
-    '2010-10-15',
-    '2010-10-18',
-    '2010-10-19',
-    '2010-10-20',
-    '2010-10-21',
-    '2010-10-22',
-    '2010-10-25',
-    '2010-10-26',
-    '2010-10-27',
-    '2010-10-28',
-    '2010-10-29',
-    '2010-11-01',
-    '2010-11-02',
-    '2010-11-03',
-    '2010-11-04',
-    '2010-11-05',
-    '2010-11-08',
-    '2010-11-09',
-    '2010-11-10',
-    '2010-11-11',
-    '2010-11-12',
-    '2010-11-15',
-    '2010-11-16',
-    '2010-11-17',
-    '2010-11-18',
-    '2010-11-19',
-    '2010-11-22',
-    '2010-11-23',
-    '2010-11-24',
-    '2010-11-25',
-    '2010-11-26',
-    '2010-11-29',
-    '2010-11-30',
-    '2010-12-01',
-    '2010-12-02',
-    '2010-12-03',
-    '2010-12-06',
-    '2010-12-07',
-    '2010-12-08',
-    '2010-12-09',
-    '2010-12-10',
-    '2010-12-13',
-    '2010-12-14',
-    '2010-12-15',
-    '2010-12-16',
-    '2010-12-17',
-    '2010-12-20',
-    '2010-12-21',
-    '2010-12-22',
-    '2010-12-23',
-    '2010-12-24',
-    '2010-12-27',
-    '2010-12-28',
-    '2010-12-29',
-    '2010-12-30',
-    '2010-12-31',
-    '2011-01-04',
-    '2011-01-05',
-    '2011-01-06',
-    '2011-01-07',
-    '2011-01-10',
-    '2011-01-11',
-    '2011-01-12',
-    '2011-01-13',
-    '2011-01-14',
-    '2011-01-17',
-    '2011-01-18',
-    '2011-01-19',
-    '2011-01-20',
-    '2011-01-21',
-    '2011-01-24',
-    '2011-01-25',
-    '2011-01-26',
-    '2011-01-27',
-    '2011-01-28',
-    '2011-01-31',
-    '2011-02-01',
-    '2011-02-09',
-    '2011-02-10',
-    '2011-02-11',
-    '2011-02-14',
-    '2011-02-15',
-    '2011-02-16',
-    '2011-02-17',
-    '2011-02-18',
-    '2011-02-21',
-    '2011-02-22',
-    '2011-02-23',
-    '2011-02-24',
-    '2011-02-25',
-    '2011-02-28',
-    '2011-03-01',
-    '2011-03-02',
-    '2011-03-03',
-    '2011-03-04',
-    '2011-03-07',
-    '2011-03-08',
-    '2011-03-09',
-    '2011-03-10',
-    '2011-03-11',
-    '2011-03-14',
-    '2011-03-15',
-    '2011-03-16',
-    '2011-03-17',
-    '2011-03-18',
-    '2011-03-21',
-    '2011-03-22',
-    '2011-03-23',
-    '2011-03-24',
-    '2011-03-25',
-    '2011-03-28',
-    '2011-03-29',
-    '2011-03-30',
-    '2011-03-31',
-    '2011-04-01',
-    '2011-04-06',
-    '2011-04-07',
-    '2011-04-08',
-    '2011-04-11',
-    '2011-04-12',
-    '2011-04-13',
-    '2011-04-14',
-    '2011-04-15',
-    '2011-04-18',
-    '2011-04-19',
-    '2011-04-20',
-    '2011-04-21',
-    '2011-04-22',
-    '2011-04-25',
-    '2011-04-26',
-    '2011-04-27',
-    '2011-04-28',
-    '2011-04-29',
-    '2011-05-03',
-    '2011-05-04',
-    '2011-05-05',
-    '2011-05-06',
-    '2011-05-09',
-    '2011-05-10',
-    '2011-05-11',
-    '2011-05-12',
-    '2011-05-13',
-    '2011-05-16',
-    '2011-05-17',
-    '2011-05-18',
-    '2011-05-19',
-    '2011-05-20',
-    '2011-05-23',
-    '2011-05-24',
-    '2011-05-25',
-    '2011-05-26',
-    '2011-05-27',
-    '2011-05-30',
-    '2011-05-31',
-    '2011-06-01',
-    '2011-06-02',
-    '2011-06-03',
-    '2011-06-07',
-    '2011-06-08',
-    '2011-06-09',
-    '2011-06-10',
-    '2011-06-13',
-    '2011-06-14',
-    '2011-06-15',
-    '2011-06-16',
-    '2011-06-17',
-    '2011-06-20',
-    '2011-06-21',
-    '2011-06-22',
-    '2011-06-23',
-    '2011-06-24',
-    '2011-06-27',
-    '2011-06-28',
-    '2011-06-29',
-    '2011-06-30',
-    '2011-07-01',
-    '2011-07-04',
-    '2011-07-05',
-    '2011-07-06',
-    '2011-07-07',
-    '2011-07-08',
-    '2011-07-11',
-    '2011-07-12',
-    '2011-07-13',
-    '2011-07-14',
-    '2011-07-15',
-    '2011-07-18',
-    '2011-07-19',
-    '2011-07-20',
-    '2011-07-21',
-    '2011-07-22',
-    '2011-07-25',
-    '2011-07-26',
-    '2011-07-27',
-    '2011-07-28',
-    '2011-07-29',
-    '2011-08-01',
-    '2011-08-02',
-    '2011-08-03',
-    '2011-08-04',
-    '2011-08-05',
-    '2011-08-08',
-    '2011-08-09',
-    '2011-08-10',
-    '2011-08-11',
-    '2011-08-12',
-    '2011-08-15',
-    '2011-08-16',
-    '2011-08-17',
-    '2011-08-18',
-    '2011-08-19',
-    '2011-08-22',
-    '2011-08-23',
-    '2011-08-24',
-    '2011-08-25',
-    '2011-08-26',
-    '2011-08-29',
-    '2011-08-30',
-    '2011-08-31',
-    '2011-09-01',
-    '2011-09-02',
-    '2011-09-05',
-    '2011-09-06',
-    '2011-09-07',
-    '2011-09-08',
-    '2011-09-09',
-    '2011-09-13',
-    '2011-09-14',
-    '2011-09-15',
-    '2011-09-16',
-    '2011-09-19',
-    '2011-09-20',
-    '2011-09-21',
-    '2011-09-22',
-    '2011-09-23',
-    '2011-09-26',
-    '2011-09-27',
-    '2011-09-28',
-    '2011-09-29',
-    '2011-09-30',
-    '2011-10-10',
-    '2011-10-11',
-    '2011-10-12',
-    '2011-10-13',
-    '2011-10-14',
-    '2011-10-17',
-    '2011-10-18',
-    '2011-10-19',
-    '2011-10-20',
-    '2011-10-21',
-    '2011-10-24',
-    '2011-10-25',
-    '2011-10-26',
-    '2011-10-27',
-    '2011-10-28',
-    '2011-10-31',
-    '2011-11-01',
-    '2011-11-02',
-    '2011-11-03',
-    '2011-11-04',
-    '2011-11-07',
-    '2011-11-08',
-    '2011-11-09',
-    '2011-11-10',
-    '2011-11-11',
-    '2011-11-14',
-    '2011-11-15',
-    '2011-11-16',
-    '2011-11-17',
-    '2011-11-18',
-    '2011-11-21',
-    '2011-11-22',
-    '2011-11-23',
-    '2011-11-24',
-    '2011-11-25',
-    '2011-11-28',
-    '2011-11-29',
-    '2011-11-30',
-    '2011-12-01',
-    '2011-12-02',
-    '2011-12-05',
-    '2011-12-06',
-    '2011-12-07',
-    '2011-12-08',
-    '2011-12-09',
-    '2011-12-12',
-    '2011-12-13',
-    '2011-12-14',
-    '2011-12-15',
-    '2011-12-16',
-    '2011-12-19',
-    '2011-12-20',
-    '2011-12-21',
-    '2011-12-22',
-    '2011-12-23',
-    '2011-12-26',
-    '2011-12-27',
-    '2011-12-28',
-    '2011-12-29',
-    '2011-12-30',
-    '2012-01-04',
-    '2012-01-05',
-    '2012-01-06',
-    '2012-01-09',
-    '2012-01-10',
-    '2012-01-11',
-    '2012-01-12',
-    '2012-01-13',
-    '2012-01-16',
-    '2012-01-17',
-    '2012-01-18',
-    '2012-01-19',
-    '2012-01-20',
-    '2012-01-30',
-    '2012-01-31',
-    '2012-02-01',
-    '2012-02-02',
-    '2012-02-03',
-    '2012-02-06',
-    '2012-02-07',
-    '2012-02-08',
-    '2012-02-09',
-    '2012-02-10',
-    '2012-02-13',
-    '2012-02-14',
-    '2012-02-15',
-    '2012-02-16',
-    '2012-02-17',
-    '2012-02-20',
-    '2012-02-21',
-    '2012-02-22',
-    '2012-02-23',
-    '2012-02-24',
-    '2012-02-27',
-    '2012-02-28',
-    '2012-02-29',
-    '2012-03-01',
-    '2012-03-02',
-    '2012-03-05',
-    '2012-03-06',
-    '2012-03-07',
-    '2012-03-08',
-    '2012-03-09',
-    '2012-03-12',
-    '2012-03-13',
-    '2012-03-14',
-    '2012-03-15',
-    '2012-03-16',
-    '2012-03-19',
-    '2012-03-20',
-    '2012-03-21',
-    '2012-03-22',
-    '2012-03-23',
-    '2012-03-26',
-    '2012-03-27',
-    '2012-03-28',
-    '2012-03-29',
-    '2012-03-30',
-    '2012-04-05',
-    '2012-04-06',
-    '2012-04-09',
-    '2012-04-10',
-    '2012-04-11',
-    '2012-04-12',
-    '2012-04-13',
-    '2012-04-16',
-    '2012-04-17',
-    '2012-04-18',
-    '2012-04-19',
-    '2012-04-20',
-    '2012-04-23',
-    '2012-04-24',
-    '2012-04-25',
-    '2012-04-26',
-    '2012-04-27',
-    '2012-05-02',
-    '2012-05-03',
-    '2012-05-04',
-    '2012-05-07',
-    '2012-05-08',
-    '2012-05-09',
-    '2012-05-10',
-    '2012-05-11',
-    '2012-05-14',
-    '2012-05-15',
-    '2012-05-16',
-    '2012-05-17',
-    '2012-05-18',
-    '2012-05-21',
-    '2012-05-22',
-    '2012-05-23',
-    '2012-05-24',
-    '2012-05-25',
-    '2012-05-28',
-    '2012-05-29',
-    '2012-05-30',
-    '2012-05-31',
-    '2012-06-01',
-    '2012-06-04',
-    '2012-06-05',
-    '2012-06-06',
-    '2012-06-07',
-    '2012-06-08',
-    '2012-06-11',
-    '2012-06-12',
-    '2012-06-13',
-    '2012-06-14',
-    '2012-06-15',
-    '2012-06-18',
-    '2012-06-19',
-    '2012-06-20',
-    '2012-06-21',
-    '2012-06-25',
-    '2012-06-26',
-    '2012-06-27',
-    '2012-06-28',
-    '2012-06-29',
-    '2012-07-02',
-    '2012-07-03',
-    '2012-07-04',
-    '2012-07-05',
-    '2012-07-06',
-    '2012-07-09',
-    '2012-07-10',
-    '2012-07-11',
-    '2012-07-12',
-    '2012-07-13',
-    '2012-07-16',
-    '2012-07-17',
-    '2012-07-18',
-    '2012-07-19',
-    '2012-07-20',
-    '2012-07-23',
-    '2012-07-24',
-    '2012-07-25',
-    '2012-07-26',
-    '2012-07-27',
-    '2012-07-30',
-    '2012-07-31',
-    '2012-08-01',
-    '2012-08-02',
-    '2012-08-03',
-    '2012-08-06',
-    '2012-08-07',
-    '2012-08-08',
-    '2012-08-09',
-    '2012-08-10',
-    '2012-08-13',
-    '2012-08-14',
-    '2012-08-15',
-    '2012-08-16',
-    '2012-08-17',
-    '2012-08-20',
-    '2012-08-21',
-    '2012-08-22',
-    '2012-08-23',
-    '2012-08-24',
-    '2012-08-27',
-    '2012-08-28',
-    '2012-08-29',
-    '2012-08-30',
-    '2012-08-31',
-    '2012-09-03',
-    '2012-09-04',
-    '2012-09-05',
-    '2012-09-06',
-    '2012-09-07',
-    '2012-09-10',
-    '2012-09-11',
-    '2012-09-12',
-    '2012-09-13',
-    '2012-09-14',
-    '2012-09-17',
-    '2012-09-18',
-    '2012-09-19',
-    '2012-09-20',
-    '2012-09-21',
-    '2012-09-24',
-    '2012-09-25',
-    '2012-09-26',
-    '2012-09-27',
-    '2012-09-28',
-    '2012-10-08',
-    '2012-10-09',
-    '2012-10-10',
-    '2012-10-11',
-    '2012-10-12',
-    '2012-10-15',
-    '2012-10-16',
-    '2012-10-17',
-    '2012-10-18',
-    '2012-10-19',
-    '2012-10-22',
-    '2012-10-23',
-    '2012-10-24',
-    '2012-10-25',
-    '2012-10-26',
-    '2012-10-29',
-    '2012-10-30',
-    '2012-10-31',
-    '2012-11-01',
-    '2012-11-02',
-    '2012-11-05',
-    '2012-11-06',
-    '2012-11-07',
-    '2012-11-08',
-    '2012-11-09',
-    '2012-11-12',
-    '2012-11-13',
-    '2012-11-14',
-    '2012-11-15',
-    '2012-11-16',
-    '2012-11-19',
-    '2012-11-20',
-    '2012-11-21',
-    '2012-11-22',
-    '2012-11-23',
-    '2012-11-26',
-    '2012-11-27',
-    '2012-11-28',
-    '2012-11-29',
-    '2012-11-30',
-    '2012-12-03',
-    '2012-12-04',
-    '2012-12-05',
-    '2012-12-06',
-    '2012-12-07',
-    '2012-12-10',
-    '2012-12-11',
-    '2012-12-12',
-    '2012-12-13',
-    '2012-12-14',
-    '2012-12-17',
-    '2012-12-18',
-    '2012-12-19',
-    '2012-12-20',
-    '2012-12-21',
-    '2012-12-24',
-    '2012-12-25',
-    '2012-12-26',
-    '2012-12-27',
-    '2012-12-28',
-    '2012-12-31',
-    '2013-01-04',
-    '2013-01-07',
-    '2013-01-08',
-    '2013-01-09',
-    '2013-01-10',
-    '2013-01-11',
-    '2013-01-14',
-    '2013-01-15',
-    '2013-01-16',
-    '2013-01-17',
-    '2013-01-18',
-    '2013-01-21',
-    '2013-01-22',
-    '2013-01-23',
-    '2013-01-24',
-    '2013-01-25',
-    '2013-01-28',
-    '2013-01-29',
-    '2013-01-30',
-    '2013-01-31',
-    '2013-02-01',
-    '2013-02-04',
-    '2013-02-05',
-    '2013-02-06',
-    '2013-02-07',
-    '2013-02-08',
-    '2013-02-18',
-    '2013-02-19',
-    '2013-02-20',
-    '2013-02-21',
-    '2013-02-22',
-    '2013-02-25',
-    '2013-02-26',
-    '2013-02-27',
-    '2013-02-28',
-    '2013-03-01',
-    '2013-03-04',
-    '2013-03-05',
-    '2013-03-06',
-    '2013-03-07',
-    '2013-03-08',
-    '2013-03-11',
-    '2013-03-12',
-    '2013-03-13',
-    '2013-03-14',
-    '2013-03-15',
-    '2013-03-18',
-    '2013-03-19',
-    '2013-03-20',
-    '2013-03-21',
-    '2013-03-22',
-    '2013-03-25',
-    '2013-03-26',
-    '2013-03-27',
-    '2013-03-28',
-    '2013-03-29',
-    '2013-04-01',
-    '2013-04-02',
-    '2013-04-03',
-    '2013-04-08',
-    '2013-04-09',
-    '2013-04-10',
-    '2013-04-11',
-    '2013-04-12',
-    '2013-04-15',
-    '2013-04-16',
-    '2013-04-17',
-    '2013-04-18',
-    '2013-04-19',
-    '2013-04-22',
-    '2013-04-23',
-    '2013-04-24',
-    '2013-04-25',
-    '2013-04-26',
-    '2013-05-02',
-    '2013-05-03',
-    '2013-05-06',
-    '2013-05-07',
-    '2013-05-08',
-    '2013-05-09',
-    '2013-05-10',
-    '2013-05-13',
-    '2013-05-14',
-    '2013-05-15',
-    '2013-05-16',
-    '2013-05-17',
-    '2013-05-20',
-    '2013-05-21',
-    '2013-05-22',
-    '2013-05-23',
-    '2013-05-24',
-    '2013-05-27',
-    '2013-05-28',
-    '2013-05-29',
-    '2013-05-30',
-    '2013-05-31',
-    '2013-06-03',
-    '2013-06-04',
-    '2013-06-05',
-    '2013-06-06',
-    '2013-06-07',
-    '2013-06-13',
-    '2013-06-14',
-    '2013-06-17',
-    '2013-06-18',
-    '2013-06-19',
-    '2013-06-20',
-    '2013-06-21',
-    '2013-06-24',
-    '2013-06-25',
-    '2013-06-26',
-    '2013-06-27',
-    '2013-06-28',
-    '2013-07-01',
-    '2013-07-02',
-    '2013-07-03',
-    '2013-07-04',
-    '2013-07-05',
-    '2013-07-08',
-    '2013-07-09',
-    '2013-07-10',
-    '2013-07-11',
-    '2013-07-12',
-    '2013-07-15',
-    '2013-07-16',
-    '2013-07-17',
-    '2013-07-18',
-    '2013-07-19',
-    '2013-07-22',
-    '2013-07-23',
-    '2013-07-24',
-    '2013-07-25',
-    '2013-07-26',
-    '2013-07-29',
-    '2013-07-30',
-    '2013-07-31',
-    '2013-08-01',
-    '2013-08-02',
-    '2013-08-05',
-    '2013-08-06',
-    '2013-08-07',
-    '2013-08-08',
-    '2013-08-09',
-    '2013-08-12',
-    '2013-08-13',
-    '2013-08-14',
-    '2013-08-15',
-    '2013-08-16',
-    '2013-08-19',
-    '2013-08-20',
-    '2013-08-21',
-    '2013-08-22',
-    '2013-08-23',
-    '2013-08-26',
-    '2013-08-27',
-    '2013-08-28',
-    '2013-08-29',
-    '2013-08-30',
-    '2013-09-02',
-    '2013-09-03',
-    '2013-09-04',
-    '2013-09-05',
-    '2013-09-06',
-    '2013-09-09',
-    '2013-09-10',
-    '2013-09-11',
-    '2013-09-12',
-    '2013-09-13',
-    '2013-09-16',
-    '2013-09-17',
-    '2013-09-18',
-    '2013-09-23',
-    '2013-09-24',
-    '2013-09-25',
-    '2013-09-26',
-    '2013-09-27',
-    '2013-09-30',
-    '2013-10-08',
-    '2013-10-09',
-    '2013-10-10',
-    '2013-10-11',
-    '2013-10-14',
-    '2013-10-15',
-    '2013-10-16',
-    '2013-10-17',
-    '2013-10-18',
-    '2013-10-21',
-    '2013-10-22',
-    '2013-10-23',
-    '2013-10-24',
-    '2013-10-25',
-    '2013-10-28',
-    '2013-10-29',
-    '2013-10-30',
-    '2013-10-31',
-    '2013-11-01',
-    '2013-11-04',
-    '2013-11-05',
-    '2013-11-06',
-    '2013-11-07',
-    '2013-11-08',
-    '2013-11-11',
-    '2013-11-12',
-    '2013-11-13',
-    '2013-11-14',
-    '2013-11-15',
-    '2013-11-18',
-    '2013-11-19',
-    '2013-11-20',
-    '2013-11-21',
-    '2013-11-22',
-    '2013-11-25',
-    '2013-11-26',
-    '2013-11-27',
-    '2013-11-28',
-    '2013-11-29',
-    '2013-12-02',
-    '2013-12-03',
-    '2013-12-04',
-    '2013-12-05',
-    '2013-12-06',
-    '2013-12-09',
-    '2013-12-10',
-    '2013-12-11',
-    '2013-12-12',
-    '2013-12-13',
-    '2013-12-16',
-    '2013-12-17',
-    '2013-12-18',
-    '2013-12-19',
-    '2013-12-20',
-    '2013-12-23',
-    '2013-12-24',
-    '2013-12-25',
-    '2013-12-26',
-    '2013-12-27',
-    '2013-12-30',
-    '2013-12-31',
-    '2014-01-02',
-    '2014-01-03',
-    '2014-01-06',
-    '2014-01-07',
-    '2014-01-08',
-    '2014-01-09',
-    '2014-01-10',
-    '2014-01-13',
-    '2014-01-14',
-    '2014-01-15',
-    '2014-01-16',
-    '2014-01-17',
-    '2014-01-20',
-    '2014-01-21',
-    '2014-01-22',
-    '2014-01-23',
-    '2014-01-24',
-    '2014-01-27',
-    '2014-01-28',
-    '2014-01-29',
-    '2014-01-30',
-    '2014-02-07',
-    '2014-02-10',
-    '2014-02-11',
-    '2014-02-12',
-    '2014-02-13',
-    '2014-02-14',
-    '2014-02-17',
-    '2014-02-18',
-    '2014-02-19',
-    '2014-02-20',
-    '2014-02-21',
-    '2014-02-24',
-    '2014-02-25',
-    '2014-02-26',
-    '2014-02-27',
-    '2014-02-28',
-    '2014-03-03',
-    '2014-03-04',
-    '2014-03-05',
-    '2014-03-06',
-    '2014-03-07',
-    '2014-03-10',
-    '2014-03-11',
-    '2014-03-12',
-    '2014-03-13',
-    '2014-03-14',
-    '2014-03-17',
-    '2014-03-18',
-    '2014-03-19',
-    '2014-03-20',
-    '2014-03-21',
-    '2014-03-24',
-    '2014-03-25',
-    '2014-03-26',
-    '2014-03-27',
-    '2014-03-28',
-    '2014-03-31',
-    '2014-04-01',
-    '2014-04-02',
-    '2014-04-03',
-    '2014-04-04',
-    '2014-04-08',
-    '2014-04-09',
-    '2014-04-10',
-    '2014-04-11',
-    '2014-04-14',
-    '2014-04-15',
-    '2014-04-16',
-    '2014-04-17',
-    '2014-04-18',
-    '2014-04-21',
-    '2014-04-22',
-    '2014-04-23',
-    '2014-04-24',
-    '2014-04-25',
-    '2014-04-28',
-    '2014-04-29',
-    '2014-04-30',
-    '2014-05-05',
-    '2014-05-06',
-    '2014-05-07',
-    '2014-05-08',
-    '2014-05-09',
-    '2014-05-12',
-    '2014-05-13',
-    '2014-05-14',
-    '2014-05-15',
-    '2014-05-16',
-    '2014-05-19',
-    '2014-05-20',
-    '2014-05-21',
-    '2014-05-22',
-    '2014-05-23',
-    '2014-05-26',
-    '2014-05-27',
-    '2014-05-28',
-    '2014-05-29',
-    '2014-05-30',
-    '2014-06-03',
-    '2014-06-04',
-    '2014-06-05',
-    '2014-06-06',
-    '2014-06-09',
-    '2014-06-10',
-    '2014-06-11',
-    '2014-06-12',
-    '2014-06-13',
-    '2014-06-16',
-    '2014-06-17',
-    '2014-06-18',
-    '2014-06-19',
-    '2014-06-20',
-    '2014-06-23',
-    '2014-06-24',
-    '2014-06-25',
-    '2014-06-26',
-    '2014-06-27',
-    '2014-06-30',
-    '2014-07-01',
-    '2014-07-02',
-    '2014-07-03',
-    '2014-07-04',
-    '2014-07-07',
-    '2014-07-08',
-    '2014-07-09',
-    '2014-07-10',
-    '2014-07-11',
-    '2014-07-14',
-    '2014-07-15',
-    '2014-07-16',
-    '2014-07-17',
-    '2014-07-18',
-    '2014-07-21',
-    '2014-07-22',
-    '2014-07-23',
-    '2014-07-24',
-    '2014-07-25',
-    '2014-07-28',
-    '2014-07-29',
-    '2014-07-30',
-    '2014-07-31',
-    '2014-08-01',
-    '2014-08-04',
-    '2014-08-05',
-    '2014-08-06',
-    '2014-08-07',
-    '2014-08-08',
-    '2014-08-11',
-    '2014-08-12',
-    '2014-08-13',
-    '2014-08-14',
-    '2014-08-15',
-    '2014-08-18',
-    '2014-08-19',
-    '2014-08-20',
-    '2014-08-21',
-    '2014-08-22',
-    '2014-08-25',
-    '2014-08-26',
-    '2014-08-27',
-    '2014-08-28',
-    '2014-08-29',
-    '2014-09-01',
-    '2014-09-02',
-    '2014-09-03',
-    '2014-09-04',
-    '2014-09-05',
-    '2014-09-09',
-    '2014-09-10',
-    '2014-09-11',
-    '2014-09-12',
-    '2014-09-15',
-    '2014-09-16',
-    '2014-09-17',
-    '2014-09-18',
-    '2014-09-19',
-    '2014-09-22',
-    '2014-09-23',
-    '2014-09-24',
-    '2014-09-25',
-    '2014-09-26',
-    '2014-09-29',
-    '2014-09-30',
-    '2014-10-08',
-    '2014-10-09',
-    '2014-10-10',
-    '2014-10-13',
-    '2014-10-14',
-    '2014-10-15',
-    '2014-10-16',
-    '2014-10-17',
-    '2014-10-20',
-    '2014-10-21',
-    '2014-10-22',
-    '2014-10-23',
-    '2014-10-24',
-    '2014-10-27',
-    '2014-10-28',
-    '2014-10-29',
-    '2014-10-30',
-    '2014-10-31',
-    '2014-11-03',
-    '2014-11-04',
-    '2014-11-05',
-    '2014-11-06',
-    '2014-11-07',
-    '2014-11-10',
-    '2014-11-11',
-    '2014-11-12',
-    '2014-11-13',
-    '2014-11-14',
-    '2014-11-17',
-    '2014-11-18',
-    '2014-11-19',
-    '2014-11-20',
-    '2014-11-21',
-    '2014-11-24',
-    '2014-11-25',
-    '2014-11-26',
-    '2014-11-27',
-    '2014-11-28',
-    '2014-12-01',
-    '2014-12-02',
-    '2014-12-03',
-    '2014-12-04',
-    '2014-12-05',
-    '2014-12-08',
-    '2014-12-09',
-    '2014-12-10',
-    '2014-12-11',
-    '2014-12-12',
-    '2014-12-15',
-    '2014-12-16',
-    '2014-12-17',
-    '2014-12-18',
-    '2014-12-19',
-    '2014-12-22',
-    '2014-12-23',
-    '2014-12-24',
-    '2014-12-25',
-    '2014-12-26',
-    '2014-12-29',
-    '2014-12-30',
-    '2014-12-31',
-    '2015-01-05',
-    '2015-01-06',
-    '2015-01-07',
-    '2015-01-08',
-    '2015-01-09',
-    '2015-01-12',
-    '2015-01-13',
-    '2015-01-14',
-    '2015-01-15',
-    '2015-01-16',
-    '2015-01-19',
-    '2015-01-20',
-    '2015-01-21',
-    '2015-01-22',
-    '2015-01-23',
-    '2015-01-26',
-    '2015-01-27',
-    '2015-01-28',
-    '2015-01-29',
-    '2015-01-30',
-    '2015-02-02',
-    '2015-02-03',
-    '2015-02-04',
-    '2015-02-05',
-    '2015-02-06',
-    '2015-02-09',
-    '2015-02-10',
-    '2015-02-11',
-    '2015-02-12',
-    '2015-02-13',
-    '2015-02-16',
-    '2015-02-17',
-    '2015-02-25',
-    '2015-02-26',
-    '2015-02-27',
-    '2015-03-02',
-    '2015-03-03',
-    '2015-03-04',
-    '2015-03-05',
-    '2015-03-06',
-    '2015-03-09',
-    '2015-03-10',
-    '2015-03-11',
-    '2015-03-12',
-    '2015-03-13',
-    '2015-03-16',
-    '2015-03-17',
-    '2015-03-18',
-    '2015-03-19',
-    '2015-03-20',
-    '2015-03-23',
-    '2015-03-24',
-    '2015-03-25',
-    '2015-03-26',
-    '2015-03-27',
-    '2015-03-30',
-    '2015-03-31',
-    '2015-04-01',
-    '2015-04-02',
-    '2015-04-03',
-    '2015-04-07',
-    '2015-04-08',
-    '2015-04-09',
-    '2015-04-10',
-    '2015-04-13',
-    '2015-04-14',
-    '2015-04-15',
-    '2015-04-16',
-    '2015-04-17',
-    '2015-04-20',
-    '2015-04-21',
-    '2015-04-22',
-    '2015-04-23',
-    '2015-04-24',
-    '2015-04-27',
-    '2015-04-28',
-    '2015-04-29',
-    '2015-04-30',
-    '2015-05-04',
-    '2015-05-05',
-    '2015-05-06',
-    '2015-05-07',
-    '2015-05-08',
-    '2015-05-11',
-    '2015-05-12',
-    '2015-05-13',
-    '2015-05-14',
-    '2015-05-15',
-    '2015-05-18',
-    '2015-05-19',
-    '2015-05-20',
-    '2015-05-21',
-    '2015-05-22',
-    '2015-05-25',
-    '2015-05-26',
-    '2015-05-27',
-    '2015-05-28',
-    '2015-05-29',
-    '2015-06-01',
-    '2015-06-02',
-    '2015-06-03',
-    '2015-06-04',
-    '2015-06-05',
-    '2015-06-08',
-    '2015-06-09',
-    '2015-06-10',
-    '2015-06-11',
-    '2015-06-12',
-    '2015-06-15',
-    '2015-06-16',
-    '2015-06-17',
-    '2015-06-18',
-    '2015-06-19',
-    '2015-06-23',
-    '2015-06-24',
-    '2015-06-25',
-    '2015-06-26',
-    '2015-06-29',
-    '2015-06-30',
-    '2015-07-01',
-    '2015-07-02',
-    '2015-07-03',
-    '2015-07-06',
-    '2015-07-07',
-    '2015-07-08',
-    '2015-07-09',
-    '2015-07-10',
-    '2015-07-13',
-    '2015-07-14',
-    '2015-07-15',
-    '2015-07-16',
-    '2015-07-17',
-    '2015-07-20',
-    '2015-07-21',
-    '2015-07-22',
-    '2015-07-23',
-    '2015-07-24',
-    '2015-07-27',
-    '2015-07-28',
-    '2015-07-29',
-    '2015-07-30',
-    '2015-07-31',
-    '2015-08-03',
-    '2015-08-04',
-    '2015-08-05',
-    '2015-08-06',
-    '2015-08-07',
-    '2015-08-10',
-    '2015-08-11',
-    '2015-08-12',
-    '2015-08-13',
-    '2015-08-14',
-    '2015-08-17',
-    '2015-08-18',
-    '2015-08-19',
-    '2015-08-20',
-    '2015-08-21',
-    '2015-08-24',
-    '2015-08-25',
-    '2015-08-26',
-    '2015-08-27',
-    '2015-08-28',
-    '2015-08-31',
-    '2015-09-01',
-    '2015-09-02',
-    '2015-09-07',
-    '2015-09-08',
-    '2015-09-09',
-    '2015-09-10',
-    '2015-09-11',
-    '2015-09-14',
-    '2015-09-15',
-    '2015-09-16',
-    '2015-09-17',
-    '2015-09-18',
-    '2015-09-21',
-    '2015-09-22',
-    '2015-09-23',
-    '2015-09-24',
-    '2015-09-25',
-    '2015-09-28',
-    '2015-09-29',
-    '2015-09-30',
-    '2015-10-08',
-    '2015-10-09',
-    '2015-10-12',
-    '2015-10-13',
-    '2015-10-14',
-    '2015-10-15',
-    '2015-10-16',
-    '2015-10-19',
-    '2015-10-20',
-    '2015-10-21',
-    '2015-10-22',
-    '2015-10-23',
-    '2015-10-26',
-    '2015-10-27',
-    '2015-10-28',
-    '2015-10-29',
-    '2015-10-30',
-    '2015-11-02',
-    '2015-11-03',
-    '2015-11-04',
-    '2015-11-05',
-    '2015-11-06',
-    '2015-11-09',
-    '2015-11-10',
-    '2015-11-11',
-    '2015-11-12',
-    '2015-11-13',
-    '2015-11-16',
-    '2015-11-17',
-    '2015-11-18',
-    '2015-11-19',
-    '2015-11-20',
-    '2015-11-23',
-    '2015-11-24',
-    '2015-11-25',
-    '2015-11-26',
-    '2015-11-27',
-    '2015-11-30',
-    '2015-12-01',
-    '2015-12-02',
-    '2015-12-03',
-    '2015-12-04',
-    '2015-12-07',
-    '2015-12-08',
-    '2015-12-09',
-    '2015-12-10',
-    '2015-12-11',
-    '2015-12-14',
-    '2015-12-15',
-    '2015-12-16',
-    '2015-12-17',
-    '2015-12-18',
-    '2015-12-21',
-    '2015-12-22',
-    '2015-12-23',
-    '2015-12-24',
-    '2015-12-25',
-    '2015-12-28',
-    '2015-12-29',
-    '2015-12-30',
-    '2015-12-31',
-    '2016-01-04',
-    '2016-01-05',
-    '2016-01-06',
-    '2016-01-07',
-    '2016-01-08',
-    '2016-01-11',
-    '2016-01-12',
-    '2016-01-13',
-    '2016-01-14',
-    '2016-01-15',
-    '2016-01-18',
-    '2016-01-19',
-    '2016-01-20',
-    '2016-01-21',
-    '2016-01-22',
-    '2016-01-25',
-    '2016-01-26',
-    '2016-01-27',
-    '2016-01-28',
-    '2016-01-29',
-    '2016-02-01',
-    '2016-02-02',
-    '2016-02-03',
-    '2016-02-04',
-    '2016-02-05',
-    '2016-02-15',
-    '2016-02-16',
-    '2016-02-17',
-    '2016-02-18',
-    '2016-02-19',
-    '2016-02-22',
-    '2016-02-23',
-    '2016-02-24',
-    '2016-02-25',
-    '2016-02-26',
-    '2016-02-29',
-    '2016-03-01',
-    '2016-03-02',
-    '2016-03-03',
-    '2016-03-04',
-    '2016-03-07',
-    '2016-03-08',
-    '2016-03-09',
-    '2016-03-10',
-    '2016-03-11',
-    '2016-03-14',
-    '2016-03-15',
-    '2016-03-16',
-    '2016-03-17',
-    '2016-03-18',
-    '2016-03-21',
-    '2016-03-22',
-    '2016-03-23',
-    '2016-03-24',
-    '2016-03-25',
-    '2016-03-28',
-    '2016-03-29',
-    '2016-03-30',
-    '2016-03-31',
-    '2016-04-01',
-    '2016-04-05',
-    '2016-04-06',
-    '2016-04-07',
-    '2016-04-08',
-    '2016-04-11',
-    '2016-04-12',
-    '2016-04-13',
-    '2016-04-14',
-    '2016-04-15',
-    '2016-04-18',
-    '2016-04-19',
-    '2016-04-20',
-    '2016-04-21',
-    '2016-04-22',
-    '2016-04-25',
-    '2016-04-26',
-    '2016-04-27',
-    '2016-04-28',
-    '2016-04-29',
-    '2016-05-03',
-    '2016-05-04',
-    '2016-05-05',
-    '2016-05-06',
-    '2016-05-09',
-    '2016-05-10',
-    '2016-05-11',
-    '2016-05-12',
-    '2016-05-13',
-    '2016-05-16',
-    '2016-05-17',
-    '2016-05-18',
-    '2016-05-19',
-    '2016-05-20',
-    '2016-05-23',
-    '2016-05-24',
-    '2016-05-25',
-    '2016-05-26',
-    '2016-05-27',
-    '2016-05-30',
-    '2016-05-31',
-    '2016-06-01',
-    '2016-06-02',
-    '2016-06-03',
-    '2016-06-06',
-    '2016-06-07',
-    '2016-06-08',
-    '2016-06-13',
-    '2016-06-14',
-    '2016-06-15',
-    '2016-06-16',
-    '2016-06-17',
-    '2016-06-20',
-    '2016-06-21',
-    '2016-06-22',
-    '2016-06-23',
-    '2016-06-24',
-    '2016-06-27',
-    '2016-06-28',
-    '2016-06-29',
-    '2016-06-30',
-    '2016-07-01',
-    '2016-07-04',
-    '2016-07-05',
-    '2016-07-06',
-    '2016-07-07',
-    '2016-07-08',
-    '2016-07-11',
-    '2016-07-12',
-    '2016-07-13',
-    '2016-07-14',
-    '2016-07-15',
-    '2016-07-18',
-    '2016-07-19',
-    '2016-07-20',
-    '2016-07-21',
-    '2016-07-22',
-    '2016-07-25',
-    '2016-07-26',
-    '2016-07-27',
-    '2016-07-28',
-    '2016-07-29',
-    '2016-08-01',
-    '2016-08-02',
-    '2016-08-03',
-    '2016-08-04',
-    '2016-08-05',
-    '2016-08-08',
-    '2016-08-09',
-    '2016-08-10',
-    '2016-08-11',
-    '2016-08-12',
-    '2016-08-15',
-    '2016-08-16',
-    '2016-08-17',
-    '2016-08-18',
-    '2016-08-19',
-    '2016-08-22',
-    '2016-08-23',
-    '2016-08-24',
-    '2016-08-25',
-    '2016-08-26',
-    '2016-08-29',
-    '2016-08-30',
-    '2016-08-31',
-    '2016-09-01',
-    '2016-09-02',
-    '2016-09-05',
-    '2016-09-06',
-    '2016-09-07',
-    '2016-09-08',
-    '2016-09-09',
-    '2016-09-12',
-    '2016-09-13',
-    '2016-09-14',
-    '2016-09-19',
-    '2016-09-20',
-    '2016-09-21',
-    '2016-09-22',
-    '2016-09-23',
-    '2016-09-26',
-    '2016-09-27',
-    '2016-09-28',
-    '2016-09-29',
-    '2016-09-30',
-    '2016-10-10',
-    '2016-10-11',
-    '2016-10-12',
-    '2016-10-13',
-    '2016-10-14',
-    '2016-10-17',
-    '2016-10-18',
-    '2016-10-19',
-    '2016-10-20',
-    '2016-10-21',
-    '2016-10-24',
-    '2016-10-25',
-    '2016-10-26',
-    '2016-10-27',
-    '2016-10-28',
-    '2016-10-31',
-    '2016-11-01',
-    '2016-11-02',
-    '2016-11-03',
-    '2016-11-04',
-    '2016-11-07',
-    '2016-11-08',
-    '2016-11-09',
-    '2016-11-10',
-    '2016-11-11',
-    '2016-11-14',
-    '2016-11-15',
-    '2016-11-16',
-    '2016-11-17',
-    '2016-11-18',
-    '2016-11-21',
-    '2016-11-22',
-    '2016-11-23',
-    '2016-11-24',
-    '2016-11-25',
-    '2016-11-28',
-    '2016-11-29',
-    '2016-11-30',
-    '2016-12-01',
-    '2016-12-02',
-    '2016-12-05',
-    '2016-12-06',
-    '2016-12-07',
-    '2016-12-08',
-    '2016-12-09',
-    '2016-12-12',
-    '2016-12-13',
-    '2016-12-14',
-    '2016-12-15',
-    '2016-12-16',
-    '2016-12-19',
-    '2016-12-20',
-    '2016-12-21',
-    '2016-12-22',
-    '2016-12-23',
-    '2016-12-26',
-    '2016-12-27',
-    '2016-12-28',
-    '2016-12-29',
-    '2016-12-30',
-    '2017-01-03',
-    '2017-01-04',
-    '2017-01-05',
-    '2017-01-06',
-    '2017-01-09',
-    '2017-01-10',
-    '2017-01-11',
-    '2017-01-12',
-    '2017-01-13',
-    '2017-01-16',
-    '2017-01-17',
-    '2017-01-18',
-    '2017-01-19',
-    '2017-01-20',
-    '2017-01-23',
-    '2017-01-24',
-    '2017-01-25',
-    '2017-01-26',
-    '2017-02-03',
-    '2017-02-06',
-    '2017-02-07',
-    '2017-02-08',
-    '2017-02-09',
-    '2017-02-10',
-    '2017-02-13',
-    '2017-02-14',
-    '2017-02-15',
-    '2017-02-16',
-    '2017-02-17',
-    '2017-02-20',
-    '2017-02-21',
-    '2017-02-22',
-    '2017-02-23',
-    '2017-02-24',
-    '2017-02-27',
-    '2017-02-28',
-    '2017-03-01',
-    '2017-03-02',
-    '2017-03-03',
-    '2017-03-06',
-    '2017-03-07',
-    '2017-03-08',
-    '2017-03-09',
-    '2017-03-10',
-    '2017-03-13',
-    '2017-03-14',
-    '2017-03-15',
-    '2017-03-16',
-    '2017-03-17',
-    '2017-03-20',
-    '2017-03-21',
-    '2017-03-22',
-    '2017-03-23',
-    '2017-03-24',
-    '2017-03-27',
-    '2017-03-28',
-    '2017-03-29',
-    '2017-03-30',
-    '2017-03-31',
-    '2017-04-05',
-    '2017-04-06',
-    '2017-04-07',
-    '2017-04-10',
-    '2017-04-11',
-    '2017-04-12',
-    '2017-04-13',
-    '2017-04-14',
-    '2017-04-17',
-    '2017-04-18',
-    '2017-04-19',
-    '2017-04-20',
-    '2017-04-21',
-    '2017-04-24',
-    '2017-04-25',
-    '2017-04-26',
-    '2017-04-27',
-    '2017-04-28',
-    '2017-05-02',
-    '2017-05-03',
-    '2017-05-04',
-    '2017-05-05',
-    '2017-05-08',
-    '2017-05-09',
-    '2017-05-10',
-    '2017-05-11',
-    '2017-05-12',
-    '2017-05-15',
-    '2017-05-16',
-    '2017-05-17',
-    '2017-05-18',
-    '2017-05-19',
-    '2017-05-22',
-    '2017-05-23',
-    '2017-05-24',
-    '2017-05-25',
-    '2017-05-26',
-    '2017-05-31',
-    '2017-06-01',
-    '2017-06-02',
-    '2017-06-05',
-    '2017-06-06',
-    '2017-06-07',
-    '2017-06-08',
-    '2017-06-09',
-    '2017-06-12',
-    '2017-06-13',
-    '2017-06-14',
-    '2017-06-15',
-    '2017-06-16',
-    '2017-06-19',
-    '2017-06-20',
-    '2017-06-21',
-    '2017-06-22',
-    '2017-06-23',
-    '2017-06-26',
-    '2017-06-27',
-    '2017-06-28',
-    '2017-06-29',
-    '2017-06-30',
-    '2017-07-03',
-    '2017-07-04',
-    '2017-07-05',
-    '2017-07-06',
-    '2017-07-07',
-    '2017-07-10',
-    '2017-07-11',
-    '2017-07-12',
-    '2017-07-13',
-    '2017-07-14',
-    '2017-07-17',
-    '2017-07-18',
-    '2017-07-19',
-    '2017-07-20',
-    '2017-07-21',
-    '2017-07-24',
-    '2017-07-25',
-    '2017-07-26',
-    '2017-07-27',
-    '2017-07-28',
-    '2017-07-31',
-    '2017-08-01',
-    '2017-08-02',
-    '2017-08-03',
-    '2017-08-04',
-    '2017-08-07',
-    '2017-08-08',
-    '2017-08-09',
-    '2017-08-10',
-    '2017-08-11',
-    '2017-08-14',
-    '2017-08-15',
-    '2017-08-16',
-    '2017-08-17',
-    '2017-08-18',
-    '2017-08-21',
-    '2017-08-22',
-    '2017-08-23',
-    '2017-08-24',
-    '2017-08-25',
-    '2017-08-28',
-    '2017-08-29',
-    '2017-08-30',
-    '2017-08-31',
-    '2017-09-01',
-    '2017-09-04',
-    '2017-09-05',
-    '2017-09-06',
-    '2017-09-07',
-    '2017-09-08',
-    '2017-09-11',
-    '2017-09-12',
-    '2017-09-13',
-    '2017-09-14',
-    '2017-09-15',
-    '2017-09-18',
-    '2017-09-19',
-    '2017-09-20',
-    '2017-09-21',
-    '2017-09-22',
-    '2017-09-25',
-    '2017-09-26',
-    '2017-09-27',
-    '2017-09-28',
-    '2017-09-29',
-    '2017-10-09',
-    '2017-10-10',
-    '2017-10-11',
-    '2017-10-12',
-    '2017-10-13',
-    '2017-10-16',
-    '2017-10-17',
-    '2017-10-18',
-    '2017-10-19',
-    '2017-10-20',
-    '2017-10-23',
-    '2017-10-24',
-    '2017-10-25',
-    '2017-10-26',
-    '2017-10-27',
-    '2017-10-30',
-    '2017-10-31',
-    '2017-11-01',
-    '2017-11-02',
-    '2017-11-03',
-    '2017-11-06',
-    '2017-11-07',
-    '2017-11-08',
-    '2017-11-09',
-    '2017-11-10',
-    '2017-11-13',
-    '2017-11-14',
-    '2017-11-15',
-    '2017-11-16',
-    '2017-11-17',
-    '2017-11-20',
-    '2017-11-21',
-    '2017-11-22',
-    '2017-11-23',
-    '2017-11-24',
-    '2017-11-27',
-    '2017-11-28',
-    '2017-11-29',
-    '2017-11-30',
-    '2017-12-01',
-    '2017-12-04',
-    '2017-12-05',
-    '2017-12-06',
-    '2017-12-07',
-    '2017-12-08',
-    '2017-12-11',
-    '2017-12-12',
-    '2017-12-13',
-    '2017-12-14',
-    '2017-12-15',
-    '2017-12-18',
-    '2017-12-19',
-    '2017-12-20',
-    '2017-12-21',
-    '2017-12-22',
-    '2017-12-25',
-    '2017-12-26',
-    '2017-12-27',
-    '2017-12-28',
-    '2017-12-29',
-    '2018-01-02',
-    '2018-01-03',
-    '2018-01-04',
-    '2018-01-05',
-    '2018-01-08',
-    '2018-01-09',
-    '2018-01-10',
-    '2018-01-11',
-    '2018-01-12',
-    '2018-01-15',
-    '2018-01-16',
-    '2018-01-17',
-    '2018-01-18',
-    '2018-01-19',
-    '2018-01-22',
-    '2018-01-23',
-    '2018-01-24',
-    '2018-01-25',
-    '2018-01-26',
-    '2018-01-29',
-    '2018-01-30',
-    '2018-01-31',
-    '2018-02-01',
-    '2018-02-02',
-    '2018-02-05',
-    '2018-02-06',
-    '2018-02-07',
-    '2018-02-08',
-    '2018-02-09',
-    '2018-02-12',
-    '2018-02-13',
-    '2018-02-14',
-    '2018-02-22',
-    '2018-02-23',
-    '2018-02-26',
-    '2018-02-27',
-    '2018-02-28',
-    '2018-03-01',
-    '2018-03-02',
-    '2018-03-05',
-    '2018-03-06',
-    '2018-03-07',
-    '2018-03-08',
-    '2018-03-09',
-    '2018-03-12',
-    '2018-03-13',
-    '2018-03-14',
-    '2018-03-15',
-    '2018-03-16',
-    '2018-03-19',
-    '2018-03-20',
-    '2018-03-21',
-    '2018-03-22',
-    '2018-03-23',
-    '2018-03-26',
-    '2018-03-27',
-    '2018-03-28',
-    '2018-03-29',
-    '2018-03-30',
-    '2018-04-02',
-    '2018-04-03',
-    '2018-04-04',
-    '2018-04-09',
-    '2018-04-10',
-    '2018-04-11',
-    '2018-04-12',
-    '2018-04-13',
-    '2018-04-16',
-    '2018-04-17',
-    '2018-04-18',
-    '2018-04-19',
-    '2018-04-20',
-    '2018-04-23',
-    '2018-04-24',
-    '2018-04-25',
-    '2018-04-26',
-    '2018-04-27',
-    '2018-05-02',
-    '2018-05-03',
-    '2018-05-04',
-    '2018-05-07',
-    '2018-05-08',
-    '2018-05-09',
-    '2018-05-10',
-    '2018-05-11',
-    '2018-05-14',
-    '2018-05-15',
-    '2018-05-16',
-    '2018-05-17',
-    '2018-05-18',
-    '2018-05-21',
-    '2018-05-22',
-    '2018-05-23',
-    '2018-05-24',
-    '2018-05-25',
-    '2018-05-28',
-    '2018-05-29',
-    '2018-05-30',
-    '2018-05-31',
-    '2018-06-01',
-    '2018-06-04',
-    '2018-06-05',
-    '2018-06-06',
-    '2018-06-07',
-    '2018-06-08',
-    '2018-06-11',
-    '2018-06-12',
-    '2018-06-13',
-    '2018-06-14',
-    '2018-06-15',
-    '2018-06-19',
-    '2018-06-20',
-    '2018-06-21',
-    '2018-06-22',
-    '2018-06-25',
-    '2018-06-26',
-    '2018-06-27',
-    '2018-06-28',
-    '2018-06-29',
-    '2018-07-02',
-    '2018-07-03',
-    '2018-07-04',
-    '2018-07-05',
-    '2018-07-06',
-    '2018-07-09',
-    '2018-07-10',
-    '2018-07-11',
-    '2018-07-12',
-    '2018-07-13',
-    '2018-07-16',
-    '2018-07-17',
-    '2018-07-18',
-    '2018-07-19',
-    '2018-07-20',
-    '2018-07-23',
-    '2018-07-24',
-    '2018-07-25',
-    '2018-07-26',
-    '2018-07-27',
-    '2018-07-30',
-    '2018-07-31',
-    '2018-08-01',
-    '2018-08-02',
-    '2018-08-03',
-    '2018-08-06',
-    '2018-08-07',
-    '2018-08-08',
-    '2018-08-09',
-    '2018-08-10',
-    '2018-08-13',
-    '2018-08-14',
-    '2018-08-15',
-    '2018-08-16',
-    '2018-08-17',
-    '2018-08-20',
-    '2018-08-21',
-    '2018-08-22',
-    '2018-08-23',
-    '2018-08-24',
-    '2018-08-27',
-    '2018-08-28',
-    '2018-08-29',
-    '2018-08-30',
-    '2018-08-31',
-    '2018-09-03',
-    '2018-09-04',
-    '2018-09-05',
-    '2018-09-06',
-    '2018-09-07',
-    '2018-09-10',
-    '2018-09-11',
-    '2018-09-12',
-    '2018-09-13',
-    '2018-09-14',
-    '2018-09-17',
-    '2018-09-18',
-    '2018-09-19',
-    '2018-09-20',
-    '2018-09-21',
-    '2018-09-25',
-    '2018-09-26',
-    '2018-09-27',
-    '2018-09-28',
-    '2018-10-08',
-    '2018-10-09',
-    '2018-10-10',
-    '2018-10-11',
-    '2018-10-12',
-    '2018-10-15',
-    '2018-10-16',
-    '2018-10-17',
-    '2018-10-18',
-    '2018-10-19',
-    '2018-10-22',
-    '2018-10-23',
-    '2018-10-24',
-    '2018-10-25',
-    '2018-10-26',
-    '2018-10-29',
-    '2018-10-30',
-    '2018-10-31',
-    '2018-11-01',
-    '2018-11-02',
-    '2018-11-05',
-    '2018-11-06',
-    '2018-11-07',
-    '2018-11-08',
-    '2018-11-09',
-    '2018-11-12',
-    '2018-11-13',
-    '2018-11-14',
-    '2018-11-15',
-    '2018-11-16',
-    '2018-11-19',
-    '2018-11-20',
-    '2018-11-21',
-    '2018-11-22',
-    '2018-11-23',
-    '2018-11-26',
-    '2018-11-27',
-    '2018-11-28',
-    '2018-11-29',
-    '2018-11-30',
-    '2018-12-03',
-    '2018-12-04',
-    '2018-12-05',
-    '2018-12-06',
-    '2018-12-07',
-    '2018-12-10',
-    '2018-12-11',
-    '2018-12-12',
-    '2018-12-13',
-    '2018-12-14',
-    '2018-12-17',
-    '2018-12-18',
-    '2018-12-19',
-    '2018-12-20',
-    '2018-12-21',
-    '2018-12-24',
-    '2018-12-25',
-    '2018-12-26',
-    '2018-12-27',
-    '2018-12-28',
-    '2019-01-02',
-    '2019-01-03',
-    '2019-01-04',
-    '2019-01-07',
-    '2019-01-08',
-    '2019-01-09',
-    '2019-01-10',
-    '2019-01-11',
-    '2019-01-14',
-    '2019-01-15',
-    '2019-01-16',
-    '2019-01-17',
-    '2019-01-18',
-    '2019-01-21',
-    '2019-01-22',
-    '2019-01-23',
-    '2019-01-24',
-    '2019-01-25',
-    '2019-01-28',
-    '2019-01-29',
-    '2019-01-30',
-    '2019-01-31',
-    '2019-02-01',
-    '2019-02-11',
-    '2019-02-12',
-    '2019-02-13',
-    '2019-02-14',
-    '2019-02-15',
-    '2019-02-18',
-    '2019-02-19',
-    '2019-02-20',
-    '2019-02-21',
-    '2019-02-22',
-    '2019-02-25',
-    '2019-02-26',
-    '2019-02-27',
-    '2019-02-28',
-    '2019-03-01',
-    '2019-03-04',
-    '2019-03-05',
-    '2019-03-06',
-    '2019-03-07',
-    '2019-03-08',
-    '2019-03-11',
-    '2019-03-12',
-    '2019-03-13',
-    '2019-03-14',
-    '2019-03-15',
-    '2019-03-18',
-    '2019-03-19',
-    '2019-03-20',
-    '2019-03-21',
-    '2019-03-22',
-    '2019-03-25',
-    '2019-03-26',
-    '2019-03-27',
-    '2019-03-28',
-    '2019-03-29',
-    '2019-04-01',
-    '2019-04-02',
-    '2019-04-03',
-    '2019-04-04',
-    '2019-04-08',
-    '2019-04-09',
-    '2019-04-10',
-    '2019-04-11',
-    '2019-04-12',
-    '2019-04-15',
-    '2019-04-16',
-    '2019-04-17',
-    '2019-04-18',
-    '2019-04-19',
-    '2019-04-22',
-    '2019-04-23',
-    '2019-04-24',
-    '2019-04-25',
-    '2019-04-26',
-    '2019-04-29',
-    '2019-04-30',
-    '2019-05-06',
-    '2019-05-07',
-    '2019-05-08',
-    '2019-05-09',
-    '2019-05-10',
-    '2019-05-13',
-    '2019-05-14',
-    '2019-05-15',
-    '2019-05-16',
-    '2019-05-17',
-    '2019-05-20',
-    '2019-05-21',
-    '2019-05-22',
-    '2019-05-23',
-    '2019-05-24',
-    '2019-05-27',
-    '2019-05-28',
-    '2019-05-29',
-    '2019-05-30',
-    '2019-05-31',
-    '2019-06-03',
-    '2019-06-04',
-    '2019-06-05',
-    '2019-06-06',
-    '2019-06-10',
-    '2019-06-11',
-    '2019-06-12',
-    '2019-06-13',
-    '2019-06-14',
-    '2019-06-17',
-    '2019-06-18',
-    '2019-06-19',
-    '2019-06-20',
-    '2019-06-21',
-    '2019-06-24',
-    '2019-06-25',
-    '2019-06-26',
-    '2019-06-27',
-    '2019-06-28',
-    '2019-07-01',
-    '2019-07-02',
-    '2019-07-03',
-    '2019-07-04',
-    '2019-07-05',
-    '2019-07-08',
-    '2019-07-09',
-    '2019-07-10',
-    '2019-07-11',
-    '2019-07-12',
-    '2019-07-15',
-    '2019-07-16',
-    '2019-07-17',
-    '2019-07-18',
-    '2019-07-19',
-    '2019-07-22',
-    '2019-07-23',
-    '2019-07-24',
-    '2019-07-25',
-    '2019-07-26',
-    '2019-07-29',
-    '2019-07-30',
-    '2019-07-31',
-    '2019-08-01',
-    '2019-08-02',
-    '2019-08-05',
-    '2019-08-06',
-    '2019-08-07',
-    '2019-08-08',
-    '2019-08-09',
-    '2019-08-12',
-    '2019-08-13',
-    '2019-08-14',
-    '2019-08-15',
-    '2019-08-16',
-    '2019-08-19',
-    '2019-08-20',
-    '2019-08-21',
-    '2019-08-22',
-    '2019-08-23',
-    '2019-08-26',
-    '2019-08-27',
-    '2019-08-28',
-    '2019-08-29',
-    '2019-08-30',
-    '2019-09-02',
-    '2019-09-03',
-    '2019-09-04',
-    '2019-09-05',
-    '2019-09-06',
-    '2019-09-09',
-    '2019-09-10',
-    '2019-09-11',
-    '2019-09-12',
-    '2019-09-16',
-    '2019-09-17',
-    '2019-09-18',
-    '2019-09-19',
-    '2019-09-20',
-    '2019-09-23',
-    '2019-09-24',
-    '2019-09-25',
-    '2019-09-26',
-    '2019-09-27',
-    '2019-09-30',
-    '2019-10-08',
-    '2019-10-09',
-    '2019-10-10',
-    '2019-10-11',
-    '2019-10-14',
-    '2019-10-15',
-    '2019-10-16',
-    '2019-10-17',
-    '2019-10-18',
-    '2019-10-21',
-    '2019-10-22',
-    '2019-10-23',
-    '2019-10-24',
-    '2019-10-25',
-    '2019-10-28',
-    '2019-10-29',
-    '2019-10-30',
-    '2019-10-31',
-    '2019-11-01',
-    '2019-11-04',
-    '2019-11-05',
-    '2019-11-06',
-    '2019-11-07',
-    '2019-11-08',
-    '2019-11-11',
-    '2019-11-12',
-    '2019-11-13',
-    '2019-11-14',
-    '2019-11-15',
-    '2019-11-18',
-    '2019-11-19',
-    '2019-11-20',
-    '2019-11-21',
-    '2019-11-22',
-    '2019-11-25',
-    '2019-11-26',
-    '2019-11-27',
-    '2019-11-28',
-    '2019-11-29',
-    '2019-12-02',
-    '2019-12-03',
-    '2019-12-04',
-    '2019-12-05',
-    '2019-12-06',
-    '2019-12-09',
-    '2019-12-10',
-    '2019-12-11',
-    '2019-12-12',
-    '2019-12-13',
-    '2019-12-16',
-    '2019-12-17',
-    '2019-12-18',
-    '2019-12-19',
-    '2019-12-20',
-    '2019-12-23',
-    '2019-12-24',
-    '2019-12-25',
-    '2019-12-26',
-    '2019-12-27',
-    '2019-12-30',
-    '2019-12-31',
-    '2020-01-02',
-    '2020-01-03',
-    '2020-01-06',
-    '2020-01-07',
-    '2020-01-08',
-    '2020-01-09',
-    '2020-01-10',
-    '2020-01-13',
-    '2020-01-14',
-    '2020-01-15',
-    '2020-01-16',
-    '2020-01-17',
-    '2020-01-20',
-    '2020-01-21',
-    '2020-01-22',
-    '2020-01-23',
-    '2020-02-03',
-    '2020-02-04',
-    '2020-02-05',
-    '2020-02-06',
-    '2020-02-07',
-    '2020-02-10',
-    '2020-02-11',
-    '2020-02-12',
-    '2020-02-13',
-    '2020-02-14',
-    '2020-02-17',
-    '2020-02-18',
-    '2020-02-19',
-    '2020-02-20',
-    '2020-02-21',
-    '2020-02-24',
-    '2020-02-25',
-    '2020-02-26',
-    '2020-02-27',
-    '2020-02-28',
-    '2020-03-02',
-    '2020-03-03',
-    '2020-03-04',
-    '2020-03-05',
-    '2020-03-06',
-    '2020-03-09',
-    '2020-03-10',
-    '2020-03-11',
-    '2020-03-12',
-    '2020-03-13',
-    '2020-03-16',
-    '2020-03-17',
-    '2020-03-18',
-    '2020-03-19',
-    '2020-03-20',
-    '2020-03-23',
-    '2020-03-24',
-    '2020-03-25',
-    '2020-03-26',
-    '2020-03-27',
-    '2020-03-30',
-    '2020-03-31',
-    '2020-04-01',
-    '2020-04-02',
-    '2020-04-03',
-    '2020-04-07',
-    '2020-04-08',
-    '2020-04-09',
-    '2020-04-10',
-    '2020-04-13',
-    '2020-04-14',
-    '2020-04-15',
-    '2020-04-16',
-    '2020-04-17',
-    '2020-04-20',
-    '2020-04-21',
-    '2020-04-22',
-    '2020-04-23',
-    '2020-04-24',
-    '2020-04-27',
-    '2020-04-28',
-    '2020-04-29',
-    '2020-04-30',
-    '2020-05-06',
-    '2020-05-07',
-    '2020-05-08',
-    '2020-05-11',
-    '2020-05-12',
-    '2020-05-13',
-    '2020-05-14',
-    '2020-05-15',
-    '2020-05-18',
-    '2020-05-19',
-    '2020-05-20',
-    '2020-05-21',
-    '2020-05-22',
-    '2020-05-25',
-    '2020-05-26',
-    '2020-05-27',
-    '2020-05-28',
-    '2020-05-29',
-    '2020-06-01',
-    '2020-06-02',
-    '2020-06-03',
-    '2020-06-04',
-    '2020-06-05',
-    '2020-06-08',
-    '2020-06-09',
-    '2020-06-10',
-    '2020-06-11',
-    '2020-06-12',
-    '2020-06-15',
-    '2020-06-16',
-    '2020-06-17',
-    '2020-06-18',
-    '2020-06-19',
-    '2020-06-22',
-    '2020-06-23',
-    '2020-06-24',
-    '2020-06-29',
-    '2020-06-30',
-    '2020-07-01',
-    '2020-07-02',
-    '2020-07-03',
-    '2020-07-06',
-    '2020-07-07',
-    '2020-07-08',
-    '2020-07-09',
-    '2020-07-10',
-    '2020-07-13',
-    '2020-07-14',
-    '2020-07-15',
-    '2020-07-16',
-    '2020-07-17',
-    '2020-07-20',
-    '2020-07-21',
-    '2020-07-22',
-    '2020-07-23',
-    '2020-07-24',
-    '2020-07-27',
-    '2020-07-28',
-    '2020-07-29',
-    '2020-07-30',
-    '2020-07-31',
-    '2020-08-03',
-    '2020-08-04',
-    '2020-08-05',
-    '2020-08-06',
-    '2020-08-07',
-    '2020-08-10',
-    '2020-08-11',
-    '2020-08-12',
-    '2020-08-13',
-    '2020-08-14',
-    '2020-08-17',
-    '2020-08-18',
-    '2020-08-19',
-    '2020-08-20',
-    '2020-08-21',
-    '2020-08-24',
-    '2020-08-25',
-    '2020-08-26',
-    '2020-08-27',
-    '2020-08-28',
-    '2020-08-31',
-    '2020-09-01',
-    '2020-09-02',
-    '2020-09-03',
-    '2020-09-04',
-    '2020-09-07',
-    '2020-09-08',
-    '2020-09-09',
-    '2020-09-10',
-    '2020-09-11',
-    '2020-09-14',
-    '2020-09-15',
-    '2020-09-16',
-    '2020-09-17',
-    '2020-09-18',
-    '2020-09-21',
-    '2020-09-22',
-    '2020-09-23',
-    '2020-09-24',
-    '2020-09-25',
-    '2020-09-28',
-    '2020-09-29',
-    '2020-09-30',
-    '2020-10-09',
-    '2020-10-12',
-    '2020-10-13',
-    '2020-10-14',
-    '2020-10-15',
-    '2020-10-16',
-    '2020-10-19',
-    '2020-10-20',
-    '2020-10-21',
-    '2020-10-22',
-    '2020-10-23',
-    '2020-10-26',
-    '2020-10-27',
-    '2020-10-28',
-    '2020-10-29',
-    '2020-10-30',
-    '2020-11-02',
-    '2020-11-03',
-    '2020-11-04',
-    '2020-11-05',
-    '2020-11-06',
-    '2020-11-09',
-    '2020-11-10',
-    '2020-11-11',
-    '2020-11-12',
-    '2020-11-13',
-    '2020-11-16',
-    '2020-11-17',
-    '2020-11-18',
-    '2020-11-19',
-    '2020-11-20',
-    '2020-11-23',
-    '2020-11-24',
-    '2020-11-25',
-    '2020-11-26',
-    '2020-11-27',
-    '2020-11-30',
-    '2020-12-01',
-    '2020-12-02',
-    '2020-12-03',
-    '2020-12-04',
-    '2020-12-07',
-    '2020-12-08',
-    '2020-12-09',
-    '2020-12-10',
-    '2020-12-11',
-    '2020-12-14',
-    '2020-12-15',
-    '2020-12-16',
-    '2020-12-17',
-    '2020-12-18',
-    '2020-12-21',
-    '2020-12-22',
-    '2020-12-23',
-    '2020-12-24',
-    '2020-12-25',
-    '2020-12-28',
-    '2020-12-29',
-    '2020-12-30',
-    '2020-12-31',
-    '2021-01-04',
-    '2021-01-05',
-    '2021-01-06',
-    '2021-01-07',
-    '2021-01-08',
-    '2021-01-11',
-    '2021-01-12',
-    '2021-01-13',
-    '2021-01-14',
-    '2021-01-15',
-    '2021-01-18',
-    '2021-01-19',
-    '2021-01-20',
-    '2021-01-21',
-    '2021-01-22',
-    '2021-01-25',
-    '2021-01-26',
-    '2021-01-27',
-    '2021-01-28',
-    '2021-01-29',
-    '2021-02-01',
-    '2021-02-02',
-    '2021-02-03',
-    '2021-02-04',
-    '2021-02-05',
-    '2021-02-08',
-    '2021-02-09',
-    '2021-02-10',
-    '2021-02-18',
-    '2021-02-19',
-    '2021-02-22',
-    '2021-02-23',
-    '2021-02-24',
-    '2021-02-25',
-    '2021-02-26',
-    '2021-03-01',
-    '2021-03-02',
-    '2021-03-03',
-    '2021-03-04',
-    '2021-03-05',
-    '2021-03-08',
-    '2021-03-09',
-    '2021-03-10',
-    '2021-03-11',
-    '2021-03-12',
-    '2021-03-15',
-    '2021-03-16',
-    '2021-03-17',
-    '2021-03-18',
-    '2021-03-19',
-    '2021-03-22',
-    '2021-03-23',
-    '2021-03-24',
-    '2021-03-25',
-    '2021-03-26',
-    '2021-03-29',
-    '2021-03-30',
-    '2021-03-31',
-    '2021-04-01',
-    '2021-04-02',
-    '2021-04-06',
-    '2021-04-07',
-    '2021-04-08',
-    '2021-04-09',
-    '2021-04-12',
-    '2021-04-13',
-    '2021-04-14',
-    '2021-04-15',
-    '2021-04-16',
-    '2021-04-19',
-    '2021-04-20',
-    '2021-04-21',
-    '2021-04-22',
-    '2021-04-23',
-    '2021-04-26',
-    '2021-04-27',
-    '2021-04-28',
-    '2021-04-29',
-    '2021-04-30',
-    '2021-05-04',
-    '2021-05-05',
-    '2021-05-06',
-    '2021-05-07',
-    '2021-05-10',
-    '2021-05-11',
-    '2021-05-12',
-    '2021-05-13',
-    '2021-05-14',
-    '2021-05-17',
-    '2021-05-18',
-    '2021-05-19',
-    '2021-05-20',
-    '2021-05-21',
-    '2021-05-24',
-    '2021-05-25',
-    '2021-05-26',
-    '2021-05-27',
-    '2021-05-28',
-    '2021-05-31',
-    '2021-06-01',
-    '2021-06-02',
-    '2021-06-03',
-    '2021-06-04',
-    '2021-06-07',
-    '2021-06-08',
-    '2021-06-09',
-    '2021-06-10',
-    '2021-06-11',
-    '2021-06-15',
-    '2021-06-16',
-    '2021-06-17',
-    '2021-06-18',
-    '2021-06-21',
-    '2021-06-22',
-    '2021-06-23',
-    '2021-06-24',
-    '2021-06-25',
-    '2021-06-28',
-    '2021-06-29',
-    '2021-06-30',
-    '2021-07-01',
-    '2021-07-02',
-    '2021-07-05',
-    '2021-07-06',
-    '2021-07-07',
-    '2021-07-08',
-    '2021-07-09',
-    '2021-07-12',
-    '2021-07-13',
-    '2021-07-14',
-    '2021-07-15',
-    '2021-07-16',
-    '2021-07-19',
-    '2021-07-20',
-    '2021-07-21',
-    '2021-07-22',
-    '2021-07-23',
-    '2021-07-26',
-    '2021-07-27',
-    '2021-07-28',
-    '2021-07-29',
-    '2021-07-30',
-    '2021-08-02',
-    '2021-08-03',
-    '2021-08-04',
-    '2021-08-05',
-    '2021-08-06',
-    '2021-08-09',
-    '2021-08-10',
-    '2021-08-11',
-    '2021-08-12',
-    '2021-08-13',
-    '2021-08-16',
-    '2021-08-17',
-    '2021-08-18',
-    '2021-08-19',
-    '2021-08-20',
-    '2021-08-23',
-    '2021-08-24',
-    '2021-08-25',
-    '2021-08-26',
-    '2021-08-27',
-    '2021-08-30',
-    '2021-08-31',
-    '2021-09-01',
-    '2021-09-02',
-    '2021-09-03',
-    '2021-09-06',
-    '2021-09-07',
-    '2021-09-08',
-    '2021-09-09',
-    '2021-09-10',
-    '2021-09-13',
-    '2021-09-14',
-    '2021-09-15',
-    '2021-09-16',
-    '2021-09-17',
-    '2021-09-20',
-    '2021-09-22',
-    '2021-09-23',
-    '2021-09-24',
-    '2021-09-27',
-    '2021-09-28',
-    '2021-09-29',
-    '2021-09-30',
-    '2021-10-08',
-    '2021-10-11',
-    '2021-10-12',
-    '2021-10-13',
-    '2021-10-14',
-    '2021-10-15',
-    '2021-10-18',
-    '2021-10-19',
-    '2021-10-20',
-    '2021-10-21',
-    '2021-10-22',
-    '2021-10-25',
-    '2021-10-26',
-    '2021-10-27',
-    '2021-10-28',
-    '2021-10-29',
-    '2021-11-01',
-    '2021-11-02',
-    '2021-11-03',
-    '2021-11-04',
-    '2021-11-05',
-    '2021-11-08',
-    '2021-11-09',
-    '2021-11-10',
-    '2021-11-11',
-    '2021-11-12',
-    '2021-11-15',
-    '2021-11-16',
-    '2021-11-17',
-    '2021-11-18',
-    '2021-11-19',
-    '2021-11-22',
-    '2021-11-23',
-    '2021-11-24',
-    '2021-11-25',
-    '2021-11-26',
-    '2021-11-29',
-    '2021-11-30',
-    '2021-12-01',
-    '2021-12-02',
-    '2021-12-03',
-    '2021-12-06',
-    '2021-12-07',
-    '2021-12-08',
-    '2021-12-09',
-    '2021-12-10',
-    '2021-12-13',
-    '2021-12-14',
-    '2021-12-15',
-    '2021-12-16',
-    '2021-12-17',
-    '2021-12-20',
-    '2021-12-21',
-    '2021-12-22',
-    '2021-12-23',
-    '2021-12-24',
-    '2021-12-27',
-    '2021-12-28',
-    '2021-12-29',
-    '2021-12-30',
-    '2021-12-31',
-]
+# 交易日历文件，int32 存放 1970-01-01 以来的天数
+_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _date_str(date):
+    return str(date)[0:10]
+
+
+class TradeCalendar:
+    """
+    交易日历，交易日存放在有序的 datetime64[D] 数组中，
+    按天二分查找最近的交易日，字典记录交易日的位置，平移和计算间隔不需要遍历列表
+    日期参数和原来的函数一致，取 str(date) 的前10个字符，返回 '%Y-%m-%d' 字符串
+    """
+
+    def __init__(self, dates):
+        self.dates = np.unique(np.asarray(dates, dtype='datetime64[D]'))
+        self.days = self.dates.astype(np.int64)
+        self.position = {date: i for i, date in enumerate(np.datetime_as_string(self.dates))}
+        self._list = None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, item):
+        return str(self.dates[item])
+
+    def __contains__(self, date):
+        return _date_str(date) in self.position
+
+    def index(self, date):
+        """交易日的位置，不是交易日时和 list.index 一样抛出 ValueError"""
+        try:
+            return self.position[_date_str(date)]
+        except KeyError:
+            raise ValueError('{} is not a trade date'.format(date))
+
+    def search(self, date, towards=-1):
+        """
+        date 当天或者之前(towards=-1)、之后(towards=1)最近的交易日的位置，超出日历范围返回 None
+        """
+        day = np.datetime64(_date_str(date), 'D').astype(np.int64)
+        if towards == 1:
+            i = int(np.searchsorted(self.days, day, side='left'))
+            return i if i < len(self.days) else None
+        elif towards == -1:
+            i = int(np.searchsorted(self.days, day, side='right')) - 1
+            return i if i >= 0 else None
+
+    def real_date(self, date, towards=-1):
+        i = self.search(date, towards)
+        return None if i is None else self[i]
+
+    def shift(self, date, n):
+        """交易日 date 之后(n>0)或者之前(n<0)第 n 个交易日，超出范围返回 None"""
+        i = self.index(date) + n
+        return self[i] if 0 <= i < len(self.days) else None
+
+    def gap(self, start, end):
+        """start 到 end 之间的交易日数量，包含首尾"""
+        lo = self.search(start, 1)
+        hi = self.search(end, -1)
+        if lo is None or hi is None or lo > hi:
+            return 0
+        return hi - lo + 1
+
+    def to_list(self):
+        """'%Y-%m-%d' 字符串列表，和原来的 trade_date_sse 一致"""
+        if self._list is None:
+            self._list = list(np.datetime_as_string(self.dates))
+        return self._list
+
+
+# 交易所 -> 交易日列表、.npy 文件或者返回交易日列表的函数，第一次使用时加载
+_CALENDAR_SOURCES = {
+    'sse': os.path.join(_DATA_PATH, 'trade_date_sse.npy'),
+}
+_CALENDARS = {}
+
+
+def register_calendar(name, source):
+    """
+    explanation:
+        注册交易所日历，期货、港股通等交易日和上交所不同的市场使用，已经注册的会被替换
+
+    params:
+        * name->
+            含义: 日历名称
+            类型: str
+        * source->
+            含义: 交易日
+            类型: list, np.array, str(.npy 文件路径), 返回交易日列表的函数
+    """
+    _CALENDAR_SOURCES[name] = source
+    _CALENDARS.pop(name, None)
+
+
+def get_calendar(name='sse'):
+    """
+    explanation:
+        交易日历，第一次使用时加载，之后直接返回
+    """
+    calendar = _CALENDARS.get(name)
+    if calendar is None:
+        try:
+            source = _CALENDAR_SOURCES[name]
+        except KeyError:
+            raise ValueError('Calendar {} is not registered'.format(name))
+
+        if callable(source):
+            source = source()
+        elif isinstance(source, str):
+            source = np.load(source).astype('datetime64[D]')
+        calendar = _CALENDARS[name] = TradeCalendar(source)
+    return calendar
+
+
+def extend_calendar(end, holidays=(), name='sse'):
+    """
+    explanation:
+        日历最后一天之后到 end 的工作日，去掉 holidays 作为交易日，用来补充还没有更新的年份
+
+    params:
+        * end->
+            含义: 截至日期
+            类型: str, pd.Timestamp
+        * holidays->
+            含义: 休市的工作日
+            类型: list
+        * name->
+            含义: 日历名称
+            类型: str
+    """
+    calendar = get_calendar(name)
+    days = pd.bdate_range(pd.Timestamp(calendar.dates[-1]) + timedelta(days=1), end)
+    days = days[~days.isin(pd.to_datetime(list(holidays)))]
+    _CALENDARS[name] = TradeCalendar(np.concatenate([calendar.dates, days.to_numpy(dtype='datetime64[D]')]))
+    return _CALENDARS[name]
+
+
+def __getattr__(name):
+    # 兼容原来的 trade_date_sse 列表，使用时才加载
+    if name == 'trade_date_sse':
+        return get_calendar('sse').to_list()
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
 
 
 def util_date_valid(date):
@@ -7687,8 +244,8 @@ def util_get_real_date(date, trade_list=None, towards=-1):
             类型: date
             参数支持: []
         * trade_list->
-            含义: 交易列表
-            类型: List
+            含义: 交易列表，或者 register_calendar 注册的日历名称
+            类型: List, str, TradeCalendar
             参数支持: []
         * towards->
             含义: 方向， 1 -> 向前, -1 -> 向后
@@ -7696,23 +253,18 @@ def util_get_real_date(date, trade_list=None, towards=-1):
             参数支持: [1， -1]
     """
     if trade_list is None:
-        trade_list = trade_date_sse
+        calendar = get_calendar()
+    elif isinstance(trade_list, TradeCalendar):
+        calendar = trade_list
+    elif isinstance(trade_list, str):
+        calendar = get_calendar(trade_list)
+    elif trade_list is get_calendar().to_list():
+        calendar = get_calendar()
+    else:
+        calendar = TradeCalendar(trade_list)
 
-    date = str(date)[0:10]
-    if towards == 1:
-        while date not in trade_list:
-            date = str(
-                datetime.strptime(str(date)[0:10], '%Y-%m-%d') + timedelta(days=1)
-            )[0:10]
-        else:
-            return str(date)[0:10]
-    elif towards == -1:
-        while date not in trade_list:
-            date = str(
-                datetime.strptime(str(date)[0:10], '%Y-%m-%d') - timedelta(days=1)
-            )[0:10]
-        else:
-            return str(date)[0:10]
+    # 超出日历范围时返回 None
+    return calendar.real_date(date, towards)
 
 
 def util_date_shift(date, gap, methods):
@@ -7734,20 +286,24 @@ def util_date_shift(date, gap, methods):
             类型: str
             参数支持: ["gt->大于", "gte->大于等于","小于->lt", "小于等于->lte", "等于->==="]
     """
-    try:
-        if methods in ['>', 'gt']:
-            return trade_date_sse[trade_date_sse.index(date) + gap]
-        elif methods in ['>=', 'gte']:
-            return trade_date_sse[trade_date_sse.index(date) + gap - 1]
-        elif methods in ['<', 'lt']:
-            return trade_date_sse[trade_date_sse.index(date) - gap]
-        elif methods in ['<=', 'lte']:
-            return trade_date_sse[trade_date_sse.index(date) - gap + 1]
-        elif methods in ['==', '=', 'eq']:
-            return date
+    if methods in ['>', 'gt']:
+        n = gap
+    elif methods in ['>=', 'gte']:
+        n = gap - 1
+    elif methods in ['<', 'lt']:
+        n = -gap
+    elif methods in ['<=', 'lte']:
+        n = 1 - gap
+    elif methods in ['==', '=', 'eq']:
+        return date
+    else:
+        return None
 
-    except:
+    try:
+        result = get_calendar().shift(date, n)
+    except ValueError:
         return 'wrong date'
+    return 'wrong date' if result is None else result
 
 
 def util_get_next_day(date, n=1):
@@ -7785,12 +341,13 @@ def util_get_real_datelist(start, end):
             类型: date
             参数支持: []
     """
-    real_start = util_get_real_date(start, trade_date_sse, 1)
-    real_end = util_get_real_date(end, trade_date_sse, -1)
-    if trade_date_sse.index(real_start) > trade_date_sse.index(real_end):
+    calendar = get_calendar()
+    lo = calendar.search(start, 1)
+    hi = calendar.search(end, -1)
+    if lo is None or hi is None or lo > hi:
         return None, None
     else:
-        return real_start, real_end
+        return calendar[lo], calendar[hi]
 
 
 def util_get_trade_gap(start, end):
@@ -7808,11 +365,33 @@ def util_get_trade_gap(start, end):
             类型: date
             参数支持: []
    """
-    start, end = util_get_real_datelist(start, end)
-    if start is not None:
-        return trade_date_sse.index(end) + 1 - trade_date_sse.index(start)
-    else:
-        return 0
+    return get_calendar().gap(start, end)
+
+
+# 夜盘开始时间，晚于该时间的K线属于下一个交易日，排在当天日盘之前，见 czsc.Utils.sessions
+TRADE_SESSION_THRESHOLD = TRADE_DAY_START
+_DAY_NS = 24 * 60 * 60 * 10 ** 9
+_THRESHOLD_NS = (TRADE_SESSION_THRESHOLD.hour * 60 + TRADE_SESSION_THRESHOLD.minute) * 60 * 10 ** 9
+
+
+def util_get_trade_ordinal(date):
+    """
+    explanation:
+        交易时段序号，int64纳秒，夜盘时间减去一天，整数比较结果和TradeDate一致
+
+    params:
+        * date->
+            含义: 日期时间
+            类型: str, pd.Timestamp
+            参数支持: []
+
+    return:
+        int
+    """
+    value = pd.Timestamp(date).value
+    if value % _DAY_NS >= _THRESHOLD_NS:
+        return value - _DAY_NS
+    return value
 
 
 @functools.total_ordering
@@ -7834,7 +413,7 @@ class TradeDate:
         else:
             util_log_info('Wrong input data type!')
 
-        self.threshold = time(20, 30)
+        self.threshold = TRADE_SESSION_THRESHOLD
 
     def __le__(self, other):
         if self.date.date() < other.date.date():
@@ -3,10 +3,14 @@ import json
 import pandas as pd
 import numpy as np
 
+from czsc.objects import Element
+
 
 class DataEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, pd.Timestamp):
+        if isinstance(obj, Element):
+            return obj.to_dict()
+        elif isinstance(obj, pd.Timestamp):
             return obj.strftime("%Y-%m-%d")
         elif isinstance(obj, np.integer):
             return int(obj)
@@ -11,73 +11,82 @@ from czsc.factors import threshold_dict
 from czsc.Utils import util_log_info
 
 
+HOLDERS_COLUMNS = [
+    'QFIISharesRatio', 'brokerSharesRatio', 'securitySharesRatio', 'fundsSharesRatio',
+    'socialSecuritySharesRatio', 'privateEquitySharesRatio',
+    'financialCompanySharesRatio', 'pensionInsuranceAgencySharesRatio'
+]
+
+
+def _factor_scores(factor):
+    """
+    按 threshold_dict 对每个报告期的财务指标打分，所有代码一起计算
+    """
+    def grade(x, threshold):
+        # 1 if x > threshold else 0 if x > 0 else -1
+        return np.where(x > threshold, 1, np.where(x > 0, 0, -1))
+
+    def growth_grade(x, threshold):
+        # 1 if x > threshold else 0 if x > 0 else -1 if x > -threshold else -2
+        return np.where(x > threshold, 1, np.where(x > 0, 0, np.where(x > -threshold, -1, -2)))
+
+    scores = pd.DataFrame(index=factor.index)
+    for name in ['ROIC', 'grossProfitMargin', 'netProfitMargin', 'netProfitCashRatio']:
+        scores[name] = grade(factor[name], threshold_dict[name])
+    for name in ['operatingIncomeGrowth', 'continuedProfitGrowth']:
+        scores[name] = growth_grade(factor[name], threshold_dict[name])
+
+    scores['assetsLiabilitiesRatio'] = np.where(
+        factor['assetsLiabilitiesRatio'] < threshold_dict['assetsLiabilitiesRatio'], 1, 0)
+    scores['cashRatio'] = np.where(factor['cashRatio'] > threshold_dict['cashRatio'], 1, 0)
+    scores['inventoryRatio'] = np.where(factor['inventoryRatio'] < threshold_dict['inventoryRatio'], 1, 0)
+    # 小于0取正值会有问题，一般情况影响不大
+    low, high = threshold_dict['interestCoverageRatio']
+    scores['interestCoverageRatio'] = np.where(
+        (factor['interestCoverageRatio'] > low) & (factor['interestCoverageRatio'] < high), 0, 1)
+    return scores
+
+
+def calculate_financial_scores(reports_df, count=12):
+    """
+    全市场财务打分，reports_df 索引为 (report_date, code)，每个代码的报告按数据中的顺序，
+    取前 count 期，越靠前权重越大，权重合计为10
+    :return: pd.DataFrame，索引为code，columns 为 finance 和 holders
+    """
+    findata = FinancialStruct(reports_df)
+    factor = findata.financial_factor
+    code = factor.index.get_level_values(level=1)
+
+    # 每个代码内的序号和报告数
+    groups = pd.Series(code, index=factor.index).groupby(code, sort=False)
+    position = groups.cumcount().to_numpy()
+    length = np.minimum(groups.transform('size').to_numpy(), count)
+
+    weight = (length - position) * 10 / (length * (length + 1) / 2)
+    recent = position < count
+
+    scores = _factor_scores(factor).sum(axis=1).to_numpy()
+    finance = pd.Series(scores[recent] * weight[recent]).groupby(code[recent], sort=False).sum()
+
+    holders = findata.holders_factor[HOLDERS_COLUMNS].sum(axis=1)[position == 0]
+    holders.index = holders.index.get_level_values(level=1)
+
+    code_list = code.drop_duplicates()
+    return pd.DataFrame({
+        'finance': finance.reindex(code_list),
+        'holders': holders.reindex(code_list),
+    }, index=code_list)
+
+
 def get_financial_scores():
     # 根据财务指标选择对公司打分
     today = datetime.today()
     year = today.year - 4
     start = datetime(year, today.month, today.day).strftime('%Y-%m-%d')
     total_reports_df = fetch_financial_report(start=start)
-    code_list = total_reports_df.index.get_level_values(level=1).drop_duplicates()
-    scores_df = pd.DataFrame(index=code_list, columns=['finance', 'holders'])
-    # scores = pd.Series(index=code_list, dtype='float16', name='score')
-
-    for code in code_list:
-        try:
-            df = total_reports_df.loc[(slice(None), code), :]
-        except:
-            continue
-
-        util_log_info("Calculate {} financial scores!".format(code))
-
-        findata = FinancialStruct(df)
-        length = min(len(df), 12)
-        factor = findata.financial_factor.iloc[:length].reset_index(level=1, drop=True)
-
-        weight_list = list(range(length, 0, -1))
-        weight = pd.Series(weight_list, name='weight') * 10 / sum(weight_list)
-        weight.index = factor.index
-
-        financial_score_df = pd.DataFrame(index=factor.index, columns=factor.columns)
-
-        financial_score_df['ROIC'] = factor['ROIC'].apply(
-            lambda x: 1 if x > threshold_dict['ROIC'] else 0 if x > 0 else -1)
-        financial_score_df['grossProfitMargin'] = factor['grossProfitMargin'].apply(
-            lambda x: 1 if x > threshold_dict['grossProfitMargin'] else 0 if x > 0 else -1)
-        financial_score_df['netProfitMargin'] = factor['netProfitMargin'].apply(
-            lambda x: 1 if x > threshold_dict['netProfitMargin'] else 0 if x > 0 else -1)
-        financial_score_df['netProfitCashRatio'] = factor['netProfitCashRatio'].apply(
-            lambda x: 1 if x > threshold_dict['netProfitCashRatio'] else 0 if x > 0 else -1)
-
-        financial_score_df['operatingIncomeGrowth'] = factor['operatingIncomeGrowth'].apply(
-            lambda x: 1 if x > threshold_dict['operatingIncomeGrowth'] else 0 if x > 0
-            else -1 if x > -threshold_dict['operatingIncomeGrowth'] else -2)
-        financial_score_df['continuedProfitGrowth'] = factor['continuedProfitGrowth'].apply(
-            lambda x: 1 if x > threshold_dict['continuedProfitGrowth'] else 0 if x > 0
-            else -1 if x > -threshold_dict['continuedProfitGrowth'] else -2)
-
-        financial_score_df['assetsLiabilitiesRatio'] = factor['assetsLiabilitiesRatio'].apply(
-            lambda x: 1 if x < threshold_dict['assetsLiabilitiesRatio'] else 0)
-        financial_score_df['cashRatio'] = factor['cashRatio'].apply(
-            lambda x: 1 if x > threshold_dict['cashRatio'] else 0)
-        financial_score_df['inventoryRatio'] = factor['inventoryRatio'].apply(
-            lambda x: 1 if x < threshold_dict['inventoryRatio'] else 0)
-        # 小于0取正值会有问题，一般情况影响不大
-        financial_score_df['interestCoverageRatio'] = factor['interestCoverageRatio'].apply(
-            lambda x: 0 if (threshold_dict['interestCoverageRatio'][0] < x
-                           < threshold_dict['interestCoverageRatio'][1]) else 1)
-
-        scores_df.loc[code, 'finance'] = (financial_score_df.T * weight).sum().sum()
-
-        columns = [
-            'QFIISharesRatio', 'brokerSharesRatio', 'securitySharesRatio', 'fundsSharesRatio',
-            'socialSecuritySharesRatio', 'privateEquitySharesRatio',
-            'financialCompanySharesRatio', 'pensionInsuranceAgencySharesRatio'
-        ]
-        holder = findata.holders_factor.iloc[0][columns]
-        scores_df.loc[code, 'holders'] = holder.sum()
-
-
-    return scores_df
+
+    util_log_info("Calculate financial scores!")
+    return calculate_financial_scores(total_reports_df)
 
 
 if __name__ == '__main__':
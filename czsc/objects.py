@@ -3,7 +3,7 @@
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import Any, List
 
 class Mark(Enum):
     D = "底分型"
@@ -54,6 +54,71 @@ class Bar2:
     vol: float
     elements: List[Bar1] = None
 
+class Element:
+    """
+    数据类的基类，提供和dict一致的读写接口，值为None的字段视为不存在
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        # 使用 __slots__ 的数据类(init=False)没有生成 __init__，字段都是可选的
+        for key in self.__dataclass_fields__:
+            setattr(self, key, kwargs.pop(key, None))
+        if kwargs:
+            raise KeyError('{} has no field {}'.format(self.__class__.__name__, list(kwargs)))
+
+    def __getitem__(self, key):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self.__dataclass_fields__:
+            raise KeyError('{} has no field {}'.format(self.__class__.__name__, key))
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__ and getattr(self, key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.to_dict())
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in self.__dataclass_fields__ else None
+        return default if value is None else value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        element = self.__class__.__new__(self.__class__)
+        for key in self.__dataclass_fields__:
+            setattr(element, key, getattr(self, key))
+        return element
+
+    def keys(self):
+        return [key for key in self.__dataclass_fields__ if getattr(self, key) is not None]
+
+    def values(self):
+        return [getattr(self, key) for key in self.keys()]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.keys()}
+
+
 @dataclass
 class FX:
     symbol: str
@@ -75,5 +140,37 @@ class BI:
     elements: List[FX] = None
 
 
+# 引擎中大量创建的端点和中枢使用 __slots__，相等比较使用对象本身，
+# 列表的 index 和 in 不需要逐个比较字段
+@dataclass(init=False, repr=False, eq=False)
+class Point(Element):
+    """分型、笔和线段的端点
+
+    分型端点有 fx_mark, fx_start, fx_end，K线端点有 direction，计算特征值后增加 dif, macd
+    """
+    __slots__ = ('date', 'ordinal', 'fx_mark', 'value', 'fx_start', 'fx_end', 'direction', 'dif', 'macd')
+    date: Any
+    ordinal: int
+    fx_mark: int
+    value: float
+    fx_start: Any
+    fx_end: Any
+    direction: int
+    dif: float
+    macd: float
 
 
+@dataclass(init=False, repr=False, eq=False)
+class ZS(Element):
+    """中枢"""
+    __slots__ = ('zs_start', 'zs_end', 'ZG', 'ZD', 'GG', 'DD', 'xd_list', 'weight', 'location', 'real_loc')
+    zs_start: Any
+    zs_end: Any
+    ZG: Any
+    ZD: Any
+    GG: Any
+    DD: Any
+    xd_list: list
+    weight: Any
+    location: Any
+    real_loc: Any
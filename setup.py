@@ -15,6 +15,7 @@ setup(
     url="https://github.com/zengbin93/czsc",
     packages=find_packages(exclude=['test', 'images', 'docs']),
     include_package_data=True,
+    package_data={'czsc.Utils': ['data/*.npy']},
     install_requires=["pandas", "pyecharts", "mplfinance", "tushare", "matplotlib"],
 
     classifiers=[
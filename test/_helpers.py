@@ -0,0 +1,21 @@
+# coding: utf-8
+"""
+引擎测试共用的K线数据和比较函数
+"""
+import os
+import pandas as pd
+
+cur_path = os.path.split(os.path.realpath(__file__))[0]
+file_kline = os.path.join(cur_path, "data/000001.SH_D.csv")
+kline = pd.read_csv(file_kline, encoding="utf-8", parse_dates=["dt"])
+kline = kline.rename(columns={'dt': 'date', 'vol': 'volume'})[['date', 'open', 'high', 'low', 'close', 'volume']]
+bars = [dict(zip(kline.columns, values)) for values in kline.itertuples(index=False, name=None)]
+
+
+def to_dicts(value):
+    # Point 和 ZS 按对象比较，转换成dict比较字段
+    if hasattr(value, 'to_dict'):
+        return {key: to_dicts(item) for key, item in value.to_dict().items()}
+    if isinstance(value, list):
+        return [to_dicts(item) for item in value]
+    return value
@@ -0,0 +1,82 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import os
+import struct
+import pandas as pd
+from czsc.Fetch import bar_cache
+from czsc.Fetch.tdx_reader import read_min_bars
+
+days = pd.bdate_range('2020-01-01', periods=40)
+
+
+def _records(day, i):
+    num = (day.year - 2004) * 2048 + day.month * 100 + day.day
+    # 夜盘和日盘，夜盘的日期为交易日
+    minutes = list(range(21 * 60 + 5, 23 * 60 + 5, 5)) + list(range(9 * 60 + 5, 15 * 60 + 5, 5))
+    return [struct.pack('<HHfffffII', num, m, 3000.0, 3010.0, 2990.0, 3005.0 + i, 1e6, 500 + i, 0) for m in minutes]
+
+
+def _check(filename):
+    df = read_min_bars(filename)
+    pd.testing.assert_frame_equal(bar_cache.read_cached_bars(filename, read_min_bars), df)
+    for start, end in [(df.index[100], None), (None, df.index[-50]), (df.index[30].normalize(), df.index[-10])]:
+        pd.testing.assert_frame_equal(
+            bar_cache.read_cached_bars(filename, read_min_bars, start, end), read_min_bars(filename, start, end))
+
+
+def test_bar_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(bar_cache, 'BAR_CACHE_PATH', str(tmp_path / 'cache'))
+    filename = str(tmp_path / '30#RBL8.lc5')
+
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days[:30]):
+            f.write(b''.join(_records(day, i)))
+    _check(filename)
+
+    # 盘中改写最后一根K线并追加新的数据，只读取新增的部分
+    with open(filename, 'r+b') as f:
+        f.seek(-32, os.SEEK_END)
+        f.write(_records(days[29], 100)[-1])
+        for i, day in enumerate(days[30:]):
+            f.write(b''.join(_records(day, i + 30)))
+    os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns + 10 ** 9))
+    _check(filename)
+    assert bar_cache.read_cached_bars(filename, read_min_bars).loc['2020-02-11 15:00', 'close'] == 3105.0
+
+    # 源文件被重写，重建缓存
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days[:10]):
+            f.write(b''.join(_records(day, i + 1)))
+    os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns + 2 * 10 ** 9))
+    _check(filename)
+
+
+def test_bar_cache_recovery(tmp_path, monkeypatch):
+    monkeypatch.setattr(bar_cache, 'BAR_CACHE_PATH', str(tmp_path / 'cache'))
+    filename = str(tmp_path / '30#RBL8.lc5')
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days[:10]):
+            f.write(b''.join(_records(day, i)))
+    _check(filename)
+
+    # 写入中断，字段文件比meta记录的短，源文件没有变化时也要重建
+    cache_dir = bar_cache._cache_dir(filename)
+    with open(os.path.join(cache_dir, 'close.bin'), 'r+b') as f:
+        f.truncate(100)
+    assert bar_cache._load_meta(cache_dir) is None
+    _check(filename)
+    assert bar_cache._load_meta(cache_dir) is not None
+
+    # 不同目录下的同名文件使用不同的缓存
+    other = tmp_path / 'other'
+    other.mkdir()
+    other_filename = str(other / '30#RBL8.lc5')
+    with open(other_filename, 'wb') as f:
+        for i, day in enumerate(days[10:20]):
+            f.write(b''.join(_records(day, i)))
+    assert bar_cache._cache_dir(other_filename) != cache_dir
+    _check(other_filename)
+    _check(filename)
@@ -0,0 +1,80 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import pickle
+import numpy as np
+import pandas as pd
+from czsc.Data.bar_store import BarStore
+
+
+def test_bar_store():
+    bars = BarStore(capacity=2)
+    dates = pd.date_range('2020-11-02', periods=10)
+    for i, dt in enumerate(dates):
+        bars.append({'date': dt, 'open': i + 0.5, 'high': i + 1.0, 'low': float(i), 'volume': i, 'code': 'RBL8'})
+
+    assert len(bars) == 10 and bars.capacity >= 10
+    assert bars[-1]['high'] == 10.0
+    assert bars[-1]['date'] == dates[-1] and isinstance(bars[0]['date'], pd.Timestamp)
+    assert [x['low'] for x in bars[-3:]] == [7.0, 8.0, 9.0]
+    assert [x['volume'] for x in bars][:3] == [0, 1, 2]
+    assert np.allclose(bars.column('open'), np.arange(10) + 0.5)
+
+    # 后出现的字段，前面的数据用空值填充
+    bars.append({'date': dates[-1], 'high': 11.0, 'direction': 1})
+    assert bars[0]['direction'] == 0
+    assert bars[-1]['direction'] == 1 and np.isnan(bars[-1]['low'])
+
+    # 整数列出现小数时升级为float
+    bars.append({'date': dates[-1], 'volume': 1.5})
+    assert bars[-1]['volume'] == 1.5 and bars[2]['volume'] == 2
+
+    bars.pop(-1)
+    assert len(bars) == 11 and bars[-1]['high'] == 11.0
+
+    df = bars.to_df()
+    assert len(df) == 11 and list(df.columns)[:3] == ['date', 'open', 'high']
+
+
+def test_trim():
+    bars = BarStore(capacity=4)
+    for i in range(10):
+        bars.append({'close': float(i), 'code': 'RBL8'})
+
+    bars.trim(6)
+    assert len(bars) == 4 and bars.offset == 6
+    assert [x['close'] for x in bars] == [6.0, 7.0, 8.0, 9.0]
+    assert bars.columns['code'][4] is None
+
+    bars.append({'close': 10.0, 'code': 'RBL8'})
+    assert bars[-1]['close'] == 10.0 and np.allclose(bars.column('close'), [6, 7, 8, 9, 10])
+
+
+def test_row_write_through():
+    bars = BarStore()
+    for i in range(5):
+        bars.append({'close': float(i), 'volume': i})
+
+    last = bars[-1]
+    last['close'] = 10.0
+    assert bars.column('close')[-1] == 10.0 and bars[-1]['close'] == 10.0
+
+    row = bars[1]
+    row['volume'] = 2.5
+    row['mark'] = 'g'
+    assert bars[1]['volume'] == 2.5 and bars[1]['mark'] == 'g'
+    # 新增的字段，其他行用空值填充
+    assert bars[-1]['mark'] is None and 'mark' in bars[0]
+
+    bars.trim(2)
+    bars[-1].update(close=11.0)
+    assert bars.column('close')[-1] == 11.0
+    try:
+        row['close'] = 0.0
+        assert False
+    except IndexError:
+        pass
+
+    assert pickle.loads(pickle.dumps(bars[-1])) == {'close': 11.0, 'volume': 4.0, 'mark': None}
@@ -0,0 +1,46 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import pandas as pd
+from czsc.CzscBase import CzscBase
+from test._helpers import bars, to_dicts
+
+
+class CzscList(CzscBase):
+    def on_bar(self, bar):
+        self.bars.append(bar)
+        self.update()
+
+
+def test_checkpoint(tmp_path):
+    filename = str(tmp_path / 'czsc.pkl')
+    split = len(bars) - 300
+
+    full = CzscList()
+    for bar in bars:
+        full.on_bar(bar)
+
+    first = CzscList()
+    for bar in bars[:split]:
+        first.on_bar(bar)
+    first.dump(filename)
+
+    resumed = CzscList()
+    assert resumed.load(filename)
+    assert resumed.xd_list.bars is resumed.bars and resumed.xd_list.trade_date is resumed.trade_date
+    for bar in bars[split:]:
+        resumed.on_bar(bar)
+
+    assert len(resumed.bars) == len(full.bars)
+    assert to_dicts(resumed.fx_list) == to_dicts(full.fx_list)
+    # boll 前面的值为 nan，用 DataFrame 比较
+    assert pd.DataFrame(resumed.sig_list).equals(pd.DataFrame(full.sig_list))
+
+    xd, other = resumed.xd_list, full.xd_list
+    while xd:
+        assert to_dicts(xd.xd_list) == to_dicts(other.xd_list) and to_dicts(xd.zs_list) == to_dicts(other.zs_list)
+        xd, other = xd.next, other.next
+
+    assert not CzscList().load(str(tmp_path / 'missing.pkl'))
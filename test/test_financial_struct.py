@@ -0,0 +1,117 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from czsc.Data.FinancialStruct import FinancialStruct
+
+
+def _ttm_by_row(data):
+    rows = []
+    for (date, code), item in data.iterrows():
+        x = item
+        if date.month != 12:
+            try:
+                x1 = data.loc[(datetime(date.year - 1, date.month, date.day), code)]
+                x2 = data.loc[(datetime(date.year - 1, 12, 31), code)]
+                x = item + x2 - x1
+            except KeyError:
+                pass
+        rows.append(x.to_frame((date, code)).T)
+    return pd.concat(rows)
+
+
+def test_ttm_data():
+    dates = pd.date_range('2015-03-31', periods=20, freq='QE')
+    index = pd.MultiIndex.from_product([dates, ['000001', '600000', '300001']], names=['report_date', 'code'])
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.random((len(index), 3)), index=index, columns=['netProfit', 'EBIT', 'incomeTax'])
+    # 缺少上年同期或者上年年报的报告
+    data = data.drop([(dates[4], '600000'), (dates[11], '300001')])
+    # 报告期倒序，和数据库读取的顺序一致
+    data = data.iloc[::-1]
+
+    findata = FinancialStruct.__new__(FinancialStruct)
+    findata.data = data
+    ttm_data = findata.get_ttm_data()
+
+    expected = _ttm_by_row(data)
+    assert list(ttm_data.index.names) == ['report_date', 'code']
+    assert (ttm_data.index == expected.index).all()
+    assert np.allclose(ttm_data.to_numpy(), expected.to_numpy().astype(float))
+
+
+FINANCIAL_COLUMNS = [
+    'EBIT', 'incomeTax', 'netProfit', 'shortTermLoan', 'longTermLoans', 'bondsPayable',
+    'noncurrentLiabilitiesDueWithinOneYear', 'totalOwnersEquity', 'rateOfReturnOnGrossProfitFromSales',
+    'rateOfReturnOnNetSalesProfit', 'cashFlowRateAndNetProfitRatioOfOperatingActivities',
+    'netCashFlowsFromOperatingActivities', 'operatingIncomeGrowth', 'continuedProfitGrowthRate',
+    'assetsLiabilitiesRatio', 'inventoryRatio', 'interestCoverageRatio', 'cashRatio',
+    'numberOfShareholders', 'institutionShareholding', 'listedAShares', 'institutionNumber',
+    'QFIIShareholding', 'QFIIInstitutionNumber', 'brokerShareholding', 'brokerNumber',
+    'securityShareholding', 'securityNumber', 'fundsShareholding', 'fundsNumber',
+    'socialSecurityShareholding', 'socialSecurityNumber', 'privateEquityShareholding', 'privateEquityNumber',
+    'financialCompanyShareholding', 'financialCompanyNumber',
+    'pensionInsuranceAgencyShareholding', 'pensionInsuranceAgencyNumber',
+]
+
+
+def _scores_by_code(reports_df):
+    from czsc.factors import threshold_dict
+
+    def grade(x, t):
+        return 1 if x > t else 0 if x > 0 else -1
+
+    def growth_grade(x, t):
+        return 1 if x > t else 0 if x > 0 else -1 if x > -t else -2
+
+    code_list = reports_df.index.get_level_values(level=1).drop_duplicates()
+    scores_df = pd.DataFrame(index=code_list, columns=['finance', 'holders'], dtype=float)
+    for code in code_list:
+        df = reports_df[reports_df.index.get_level_values(level=1) == code]
+        findata = FinancialStruct(df)
+        length = min(len(df), 12)
+        factor = findata.financial_factor.iloc[:length]
+        weight = np.arange(length, 0, -1) * 10 / (length * (length + 1) / 2)
+
+        finance = 0
+        for w, (_, item) in zip(weight, factor.iterrows()):
+            score = sum(grade(item[name], threshold_dict[name]) for name in
+                        ['ROIC', 'grossProfitMargin', 'netProfitMargin', 'netProfitCashRatio'])
+            score += sum(growth_grade(item[name], threshold_dict[name]) for name in
+                         ['operatingIncomeGrowth', 'continuedProfitGrowth'])
+            score += 1 if item['assetsLiabilitiesRatio'] < threshold_dict['assetsLiabilitiesRatio'] else 0
+            score += 1 if item['cashRatio'] > threshold_dict['cashRatio'] else 0
+            score += 1 if item['inventoryRatio'] < threshold_dict['inventoryRatio'] else 0
+            low, high = threshold_dict['interestCoverageRatio']
+            score += 0 if low < item['interestCoverageRatio'] < high else 1
+            finance += w * score
+
+        scores_df.loc[code, 'finance'] = finance
+        scores_df.loc[code, 'holders'] = findata.holders_factor.iloc[0][
+            ['QFIISharesRatio', 'brokerSharesRatio', 'securitySharesRatio', 'fundsSharesRatio',
+             'socialSecuritySharesRatio', 'privateEquitySharesRatio',
+             'financialCompanySharesRatio', 'pensionInsuranceAgencySharesRatio']].sum()
+    return scores_df
+
+
+def test_financial_scores():
+    from czsc.analyze import calculate_financial_scores
+
+    dates = pd.date_range('2015-03-31', periods=16, freq='QE')[::-1]
+    index = pd.MultiIndex.from_product([dates, ['000001', '600000', '300001']], names=['report_date', 'code'])
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame(rng.normal(10, 30, (len(index), len(FINANCIAL_COLUMNS))),
+                        index=index, columns=FINANCIAL_COLUMNS)
+    data.iloc[::7, 3] = np.nan
+    # 报告数少于12期的代码
+    data = pd.concat([data, data.xs('000001', level=1, drop_level=False).iloc[:5].rename(index={'000001': '000002'})])
+
+    scores = calculate_financial_scores(data)
+    expected = _scores_by_code(data)
+    assert list(scores.index) == ['000001', '600000', '300001', '000002']
+    assert np.allclose(scores['finance'].to_numpy(dtype=float), expected['finance'].to_numpy())
+    assert np.allclose(scores['holders'].to_numpy(dtype=float), expected['holders'].to_numpy())
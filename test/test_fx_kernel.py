@@ -0,0 +1,63 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import numpy as np
+import pandas as pd
+from czsc.CzscBase import CzscBase
+from czsc.Utils.fx_kernel import calculate_fx_bi
+from test._helpers import kline, to_dicts
+
+
+def _stream(czsc, data):
+    columns = data.columns.to_list()
+    for values in data.itertuples(index=False, name=None):
+        czsc.bars.append(dict(zip(columns, values)))
+        czsc.update()
+    return czsc
+
+
+def _key(point):
+    # 高级别线段会修改笔端点的 fx_mark，只比较方向
+    return (point['date'], point['value'], np.sign(point.get('fx_mark', 0)),
+            point.get('fx_start'), point.get('fx_end'), point.get('direction'))
+
+
+def test_calculate_fx_bi():
+    czsc = _stream(CzscBase(), kline)
+
+    new_bars, fx_list, bi_list = calculate_fx_bi(kline)
+
+    assert new_bars.to_df().equals(czsc.new_bars.to_df())
+    assert [_key(fx) for fx in fx_list] == [_key(fx) for fx in czsc.fx_list]
+    assert [_key(bi) for bi in bi_list] == [_key(bi) for bi in czsc.xd_list.xd_list]
+
+
+def test_bulk_load():
+    full = _stream(CzscBase(), kline)
+
+    for split in [10, len(kline) - 300, len(kline)]:
+        # 前面的历史一次性计算，后面的继续逐根更新
+        czsc = CzscBase()
+        czsc.bulk_load(kline.iloc[:split])
+        _stream(czsc, kline.iloc[split:])
+
+        assert czsc.trade_date.trade_date == full.trade_date.trade_date
+        assert czsc.new_bars.to_df().equals(full.new_bars.to_df())
+        assert to_dicts(czsc.fx_list) == to_dicts(full.fx_list)
+        # boll 的批量计算和滚动计算有浮点误差
+        pd.testing.assert_frame_equal(pd.DataFrame(czsc.sig_list), pd.DataFrame(full.sig_list), rtol=1e-10)
+
+        xd, other = czsc.xd_list, full.xd_list
+        while other:
+            assert to_dicts(xd.xd_list) == to_dicts(other.xd_list)
+            assert to_dicts(xd.zs_list) == to_dicts(other.zs_list)
+            xd, other = xd.next, other.next
+        assert not xd
+
+    try:
+        czsc.bulk_load(kline)
+        assert False
+    except ValueError:
+        pass
@@ -0,0 +1,65 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import os
+import numpy as np
+import pandas as pd
+from czsc.Indicator import IndicatorSet
+
+cur_path = os.path.split(os.path.realpath(__file__))[0]
+file_kline = os.path.join(cur_path, "data/000001.SH_D.csv")
+kline = pd.read_csv(file_kline, encoding="utf-8", parse_dates=["dt"])
+
+
+def test_boll_rolling_std():
+    indicators = IndicatorSet()
+    closes = []
+    for _, row in kline.iterrows():
+        indicators.bars.append({'date': row['dt'], 'close': row['close']})
+        indicators.update()
+        closes.append(row['close'])
+
+        record = indicators.boll[-1]
+        if len(closes) < 20:
+            assert 'UB' not in record or np.isnan(record['UB'])
+            continue
+
+        close = np.array(closes[-20:])
+        assert np.isclose(record['boll'], close.mean(), rtol=1e-10)
+        assert np.isclose(record['UB'], close.mean() + 2 * close.std(ddof=1), rtol=1e-10)
+        assert np.isclose(record['LB'], close.mean() - 2 * close.std(ddof=1), rtol=1e-10)
+
+
+def test_bulk_load():
+    split = len(kline) - 100
+    incremental = IndicatorSet()
+    for _, row in kline.iterrows():
+        incremental.bars.append({'date': row['dt'], 'close': row['close']})
+        incremental.update()
+
+    # 前面的历史一次性计算，后面的继续逐根更新
+    bulk = IndicatorSet.from_arrays({'date': kline['dt'].to_numpy()[:split], 'close': kline['close'].to_numpy()[:split]})
+    for _, row in kline.iloc[split:].iterrows():
+        bulk.bars.append({'date': row['dt'], 'close': row['close']})
+        bulk.update()
+
+    assert len(bulk.bars) == len(incremental.bars) == len(kline)
+    for indicator in ['boll', 'macd']:
+        a, b = getattr(bulk, indicator).value, getattr(incremental, indicator).value
+        assert list(a.columns) == list(b.columns)
+        assert (a.column('date') == b.column('date')).all()
+        for name in a.columns:
+            if name != 'date':
+                assert np.allclose(a.column(name), b.column(name), rtol=1e-10, equal_nan=True), name
+
+
+def test_load_after_trim():
+    indicators = IndicatorSet.from_arrays({'date': kline['dt'].to_numpy(), 'close': kline['close'].to_numpy()})
+    indicators.trim(100, pinned=())
+    try:
+        indicators.macd.load()
+        assert False
+    except ValueError:
+        pass
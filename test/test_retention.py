@@ -0,0 +1,33 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import pandas as pd
+from czsc.CzscBase import CzscBase
+from test._helpers import bars, to_dicts
+
+
+def _run(max_bars=None):
+    czsc = CzscBase(max_bars=max_bars)
+    for bar in bars:
+        czsc.bars.append(bar)
+        czsc.update()
+    return czsc
+
+
+def test_max_bars():
+    full = _run()
+    window = _run(max_bars=200)
+
+    assert len(window.bars) < 2 * 200 and window.bars.offset + len(window.bars) == len(full.bars)
+    assert len(window.fx_list) < len(full.fx_list)
+    assert to_dicts(window.fx_list) == to_dicts(full.fx_list[-len(window.fx_list):])
+    # boll 前面的值为 nan，用 DataFrame 比较
+    assert pd.DataFrame(window.sig_list).equals(pd.DataFrame(full.sig_list[-len(window.sig_list):]))
+
+    xd, other = window.xd_list, full.xd_list
+    while xd:
+        assert to_dicts(xd.xd_list) == to_dicts(other.xd_list[len(other.xd_list) - len(xd.xd_list):])
+        assert to_dicts(xd.zs_list) == to_dicts(other.zs_list[len(other.zs_list) - len(xd.zs_list):])
+        xd, other = xd.next, other.next
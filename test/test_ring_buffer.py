@@ -0,0 +1,54 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import os
+import pandas as pd
+from czsc.Data.ring_buffer import RingBuffer
+from czsc.Utils.kline_generator import KlineGeneratorByTick
+
+cur_path = os.path.split(os.path.realpath(__file__))[0]
+file_kline = os.path.join(cur_path, "data/000001.XSHG_1MIN.csv")
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(4)
+    assert not buffer and buffer[-3:] == []
+
+    expected = []
+    for i in range(11):
+        buffer.append(i)
+        expected = (expected + [i])[-4:]
+        assert len(buffer) == len(expected) and list(buffer) == expected
+        for start in range(-6, 6):
+            assert buffer[start:] == expected[start:]
+            assert buffer[:start] == expected[:start]
+        assert buffer[::2] == expected[::2] and buffer[-1] == expected[-1]
+
+    buffer[-1] = 100
+    assert buffer[-1] == 100 and buffer[3] == 100 and list(buffer) == [7, 8, 9, 100]
+
+    try:
+        buffer[4]
+        assert False
+    except IndexError:
+        pass
+
+    buffer.extend(range(20, 30))
+    assert list(buffer) == [26, 27, 28, 29]
+
+    buffer.clear()
+    assert len(buffer) == 0 and buffer[-100000000:] == []
+
+
+def test_kline_generator_max_count():
+    kline = pd.read_csv(file_kline, encoding="utf-8", parse_dates=["dt"])
+    kg = KlineGeneratorByTick(max_count=100, freqs=['日线', '30分钟', '5分钟', '1分钟'])
+    for row in kline.to_dict("records")[:1000]:
+        kg.update({'symbol': row['symbol'], 'dt': row['dt'], 'price': row['close'], 'vol': row['vol']})
+
+    bars = kg.get_kline('1分钟', count=100000000)
+    assert len(bars) == 100 and kg.end_dt == kline['dt'].iloc[999]
+    assert len(kg.get_kline('5分钟', count=10)) == 10
+    assert len(kg.get_kline('日线', count=100)) == 5
@@ -0,0 +1,84 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+from datetime import datetime, timedelta, time, date
+from czsc.Utils.sessions import get_session, register_session, TRADE_DAY_START
+from czsc.Utils.trade_date import TRADE_SESSION_THRESHOLD
+from czsc.Utils.kline_generator import get_next_end_time
+
+
+def _next_end_time(dt, m=1):
+    # 原来逐分钟查找的实现
+    am_st, am_et, pm_st, pm_et = "09:30", "11:30", "13:00", "15:00"
+    if dt.strftime("%H:%M") == am_et or dt.strftime("%H:%M") == pm_et:
+        return dt.replace(second=0)
+    for _ in range(1000):
+        dt = dt + timedelta(minutes=1)
+        if dt.minute % m == 0:
+            h = dt.strftime("%H:%M")
+            if am_et >= h > am_st or pm_et >= h > pm_st:
+                return dt.replace(second=0)
+    return dt.replace(second=0)
+
+
+def test_get_next_end_time():
+    base = datetime(2020, 7, 16)
+    for m in (1, 5, 15, 30, 60):
+        # 收盘之后到次日开盘，原来的实现查找1000分钟后停止
+        for x in list(range(0, 15 * 60 + 1)) + list(range(18 * 60, 24 * 60)):
+            for second in (0, 30, 59):
+                dt = base + timedelta(minutes=x, seconds=second)
+                assert get_next_end_time(dt, m) == _next_end_time(dt, m)
+
+    assert get_next_end_time(datetime(2020, 7, 16, 15, 30), 5) == datetime(2020, 7, 17, 9, 35)
+
+
+def test_night_session():
+    shfe = get_session('shfe')
+    assert get_next_end_time(datetime(2020, 7, 16, 21, 0, 30), exchange='shfe') == datetime(2020, 7, 16, 21, 1)
+    assert shfe.bar_end(datetime(2020, 7, 16, 23, 59, 30), 5) == datetime(2020, 7, 17, 0, 0)
+    assert shfe.bar_end(datetime(2020, 7, 17, 2, 30, 10), 15) == datetime(2020, 7, 17, 2, 30)
+    assert shfe.bar_end(datetime(2020, 7, 17, 2, 31), 1) == datetime(2020, 7, 17, 9, 1)
+    assert shfe.bar_end(datetime(2020, 7, 17, 10, 20), 1) == datetime(2020, 7, 17, 10, 31)
+
+    dce = get_session('dce')
+    assert dce.bar_end(datetime(2020, 7, 16, 23, 0, 40), 30) == datetime(2020, 7, 16, 23, 0)
+    assert dce.bar_end(datetime(2020, 7, 16, 23, 1), 30) == datetime(2020, 7, 17, 9, 30)
+    assert dce.boundaries(60)[:3] == [time(22, 0), time(23, 0), time(10, 0)]
+
+    # 周五夜盘属于下周一
+    assert dce.trade_date(datetime(2020, 7, 17, 21, 5)) == date(2020, 7, 20)
+    assert dce.trade_date(datetime(2020, 7, 20, 9, 5)) == date(2020, 7, 20)
+    assert TRADE_SESSION_THRESHOLD == TRADE_DAY_START
+
+    # 周五夜盘午夜之后的部分同样属于下周一，日盘不变
+    assert shfe.trade_date(datetime(2020, 11, 6, 21, 5)) == date(2020, 11, 9)
+    assert shfe.trade_date(datetime(2020, 11, 7, 1, 0)) == date(2020, 11, 9)
+    assert shfe.trade_date(datetime(2020, 11, 7, 2, 30)) == date(2020, 11, 9)
+    assert shfe.trade_date(datetime(2020, 11, 10, 1, 0)) == date(2020, 11, 10)
+    assert shfe.trade_date(datetime(2020, 11, 10, 9, 5)) == date(2020, 11, 10)
+
+
+def test_register_session():
+    register_session('test', [('22:00', '01:00'), ('09:00', '15:00')])
+    session = get_session('test')
+    assert session.bar_end(datetime(2020, 7, 16, 22, 10), 60) == datetime(2020, 7, 16, 23, 0)
+    assert session.bar_end(datetime(2020, 7, 17, 0, 30), 60) == datetime(2020, 7, 17, 1, 0)
+
+    try:
+        register_session('test', [('09:00', '15:00'), ('21:00', '23:00')])
+        get_session('test')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_bar_ends():
+    sse = get_session('sse')
+    base = datetime(2020, 7, 16)
+    minutes = (1, 5, 15, 30, 60)
+    for x in range(0, 24 * 60, 7):
+        dt = base + timedelta(minutes=x, seconds=31)
+        assert sse.bar_ends(dt, minutes) == [sse.bar_end(dt, m) for m in minutes]
@@ -0,0 +1,118 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import os
+import struct
+import pandas as pd
+from pytdx.reader import TdxDailyBarReader, TdxExHqDailyBarReader, TdxLCMinBarReader
+from czsc.Fetch.tdx_reader import read_daily_bars, read_ex_daily_bars, read_min_bars
+
+days = pd.bdate_range('2020-01-01', periods=300)
+
+
+def _check(filename, pytdx_reader, reader):
+    df = pytdx_reader.get_df(filename)
+    df.index = df.index.astype('datetime64[ns]')
+    pd.testing.assert_frame_equal(reader(filename), df, check_names=False)
+
+    for start, end in [(df.index[100], None), (None, df.index[50]), (df.index[10] + pd.Timedelta(minutes=1), df.index[-10])]:
+        expected = df
+        if start is not None:
+            expected = expected[expected.index >= start]
+        if end is not None:
+            expected = expected[expected.index <= end]
+        pd.testing.assert_frame_equal(reader(filename, start, end), expected, check_names=False)
+
+
+def test_read_daily_bars(tmp_path):
+    filename = str(tmp_path / 'sh000001.day')
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days):
+            date = day.year * 10000 + day.month * 100 + day.day
+            f.write(struct.pack('<IIIIIfII', date, 300000 + i, 301000 + i, 299000 + i, 300500 + i, 1.5e10 + i, 2000000 + i, 0))
+    _check(filename, TdxDailyBarReader(), read_daily_bars)
+
+
+def test_read_ex_daily_bars(tmp_path):
+    filename = str(tmp_path / '30#RBL8.day')
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days):
+            date = day.year * 10000 + day.month * 100 + day.day
+            f.write(struct.pack('<IffffIIf', date, 3000.0 + i, 3010.0 + i, 2990.0 + i, 3005.0 + i, 100000 + i, 5000 + i, 3001.0))
+    _check(filename, TdxExHqDailyBarReader(), read_ex_daily_bars)
+
+
+def test_read_min_bars(tmp_path):
+    filename = str(tmp_path / '30#RBL8.lc5')
+    with open(filename, 'wb') as f:
+        for i, day in enumerate(days[:50]):
+            num = (day.year - 2004) * 2048 + day.month * 100 + day.day
+            # 夜盘和日盘，夜盘的日期为交易日
+            for minute in list(range(21 * 60 + 5, 23 * 60 + 5, 5)) + list(range(9 * 60 + 5, 15 * 60 + 5, 5)):
+                f.write(struct.pack('<HHfffffII', num, minute, 3000.0, 3010.0, 2990.0, 3005.0 + i, 1e6, 500 + i, 0))
+    _check(filename, TdxLCMinBarReader(), read_min_bars)
+
+
+def test_security_cache_interval(tmp_path, monkeypatch):
+    from czsc.Fetch import tdx
+
+    for name in ['sh', 'sz', 'ds']:
+        (tmp_path / name).mkdir()
+    securities = pd.DataFrame({'code': ['000001'], 'tdx_code': ['sh'], 'exchange': ['sse'], 'instrument': ['index']})
+    scans = []
+
+    def scan():
+        scans.append(1)
+        return securities
+
+    monkeypatch.setattr(tdx, '_get_lday_dir', lambda x: str(tmp_path / x))
+    monkeypatch.setattr(tdx, '_get_sh_sz_list', scan)
+    monkeypatch.setattr(tdx, '_get_ds_list', lambda: securities.iloc[0:0])
+    monkeypatch.setattr(tdx, '_SECURITY_CACHE_FILE', str(tmp_path / 'security.pkl'))
+    monkeypatch.setattr(tdx, '_SECURITY_CACHE', None)
+
+    checks = []
+    getmtime = tdx.os.path.getmtime
+    monkeypatch.setattr(tdx.os.path, 'getmtime', lambda x: checks.append(x) or getmtime(x))
+
+    assert list(tdx.get_security_index()) == ['000001']
+    assert len(checks) == 3 and len(scans) == 1
+
+    # 检查间隔内不读取目录
+    for _ in range(10):
+        tdx.get_security_index()
+    assert len(checks) == 3
+
+    # 目录有变化，refresh 时立即重新扫描
+    (tmp_path / 'sh' / 'new.day').write_bytes(b'')
+    os.utime(str(tmp_path / 'sh'), (1, 1))
+    tdx.get_security_index(refresh=True)
+    assert len(checks) == 6 and len(scans) == 2
+
+
+def test_get_bars_same_code(monkeypatch):
+    from czsc.Fetch import tdx
+
+    prices = {'sse': 3000.0, 'szse': 15.0}
+
+    def get_bar(code, start=None, end=None, freq='day', exchange=None, cache=False):
+        index = days[:5] if exchange == 'sse' else days[2:7]
+        df = pd.DataFrame({'close': [prices[exchange] + i for i in range(5)]}, index=index)
+        df['date'] = df.index
+        return df.assign(code=code, exchange=exchange)
+
+    monkeypatch.setattr(tdx, 'get_security_index', lambda refresh=False: {})
+    monkeypatch.setattr(tdx, 'get_bar', get_bar)
+    codes = [('000001', 'sse'), ('000001', 'szse')]
+
+    panel = tdx.get_bars(codes, format='dict')
+    assert list(panel['code']) == ['000001', '000001'] and list(panel['exchange']) == ['sse', 'szse']
+    assert panel['close'].shape == (7, 2)
+    assert list(panel['close'][:5, 0]) == [3000.0, 3001.0, 3002.0, 3003.0, 3004.0]
+    assert list(panel['close'][2:, 1]) == [15.0, 16.0, 17.0, 18.0, 19.0]
+
+    df = tdx.get_bars(codes)
+    assert len(df) == 10 and list(df['code'].cat.categories) == ['000001']
+    assert (df.loc[df['exchange'] == 'szse', 'close'] < 100).all()
@@ -0,0 +1,72 @@
+# coding: utf-8
+import sys
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '..')
+import itertools
+import pandas as pd
+from czsc.Utils.trade_date import TradeDate, util_get_trade_ordinal, TradeCalendar, \
+    trade_date_sse, get_calendar, register_calendar, extend_calendar, util_get_real_date, util_date_shift, util_get_next_day, util_get_trade_gap, util_get_real_datelist
+
+# 日盘、夜盘以及20:30阈值附近的时间点，覆盖跨零点的夜盘
+dates = [
+    pd.Timestamp('{} {}'.format(day, t))
+    for day in ['2020-11-05', '2020-11-06', '2020-11-09', '1969-12-31']
+    for t in ['00:00', '00:30', '02:30', '09:00', '11:30', '13:30', '15:00', '20:29:59', '20:30', '21:00', '23:59']
+]
+
+
+def test_trade_ordinal_equivalence():
+    for a, b in itertools.product(dates, repeat=2):
+        oa, ob = util_get_trade_ordinal(a), util_get_trade_ordinal(b)
+        assert (oa < ob) == (TradeDate(a) < TradeDate(b))
+        assert (oa <= ob) == (TradeDate(a) <= TradeDate(b))
+        assert (oa == ob) == (TradeDate(a) == TradeDate(b))
+        assert (oa > ob) == (TradeDate(a) > TradeDate(b))
+
+
+def test_trade_ordinal_night_session():
+    night = util_get_trade_ordinal('2020-11-06 21:00')
+    assert util_get_trade_ordinal('2020-11-05 15:00') < night < util_get_trade_ordinal('2020-11-06 09:00')
+    assert util_get_trade_ordinal('2020-11-06 20:30') < util_get_trade_ordinal('2020-11-06 20:29')
+    assert util_get_trade_ordinal(pd.Timestamp('2020-11-06 09:00')) == util_get_trade_ordinal('2020-11-06 09:00')
+
+
+def test_trade_calendar():
+    # 2021-10-01 到 2021-10-07 国庆休市
+    assert util_get_real_date('2021-10-04') == '2021-09-30'
+    assert util_get_real_date(pd.Timestamp('2021-10-04'), towards=1) == '2021-10-08'
+    assert util_get_real_date('2021-10-08') == '2021-10-08'
+    assert util_get_real_date('2021-10-04', trade_date_sse[::2]) == '2021-09-29'
+    # 超出日历范围
+    assert util_get_real_date('1990-01-01') is None and util_get_real_date('2030-01-01', towards=1) is None
+
+    assert util_get_next_day('2021-09-30') == '2021-10-08'
+    assert util_get_next_day('2021-09-30', 2) == '2021-10-11'
+    assert util_date_shift('2021-10-08', 1, 'lt') == '2021-09-30'
+    assert util_date_shift('2021-10-08', 1, 'lte') == '2021-10-08'
+    assert util_date_shift('2021-10-04', 1, 'gt') == 'wrong date'
+    assert util_date_shift('1990-12-19', 1, 'lt') == 'wrong date'
+
+    assert util_get_trade_gap('2021-09-30', '2021-10-08') == 2
+    assert util_get_trade_gap('2021-10-02', '2021-10-04') == 0
+    assert util_get_real_datelist('2021-10-02', '2021-10-12') == ('2021-10-08', '2021-10-12')
+
+    calendar = TradeCalendar(['2021-01-05', '2021-01-04', '2021-01-04'])
+    assert len(calendar) == 2 and calendar[0] == '2021-01-04' and '2021-01-05' in calendar
+    assert calendar.shift('2021-01-04', 1) == '2021-01-05' and calendar.shift('2021-01-04', -1) is None
+
+
+def test_calendar_registry():
+    assert trade_date_sse[0] == '1990-12-19' and trade_date_sse[-1] == get_calendar()[-1]
+
+    register_calendar('test', lambda: ['2022-01-04', '2022-01-05'])
+    assert util_get_real_date('2022-01-08', 'test') == '2022-01-05'
+
+    # 2022-01-07 休市，周末不是交易日
+    calendar = extend_calendar('2022-01-11', holidays=['2022-01-07'], name='test')
+    assert calendar is get_calendar('test')
+    assert calendar.to_list() == ['2022-01-04', '2022-01-05', '2022-01-06', '2022-01-10', '2022-01-11']
+
+    register_calendar('test', ['2022-01-04'])
+    assert len(get_calendar('test')) == 1